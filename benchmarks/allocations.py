@@ -0,0 +1,119 @@
+"""
+Measures memory allocated per request by the parser protocol, request and
+response objects, by tracemalloc:
+- reset: peak of memory allocated while the request is recycled and the
+  response is wiped. Must be zero, as they're reused as they are
+- request: peak of memory allocated while a request is parsed, processed
+  and reset (parsed url, headers and parameters take some, of course)
+- retained: memory that is still allocated after a request is processed.
+  Must be zero, otherwise something is leaking
+
+Exits with code 1 if reset allocates or anything is retained, so it may
+be run to check for regressions
+
+Run from the repository root: python -m benchmarks.allocations
+"""
+
+import sys
+import tracemalloc
+
+from httptools import HttpRequestParser
+
+from rush.entities import Headers, Response
+from rush.storage.fd_sendfile import SimpleDevStorage
+from rush.parser.httptools_protocol import Protocol
+
+WARMUP = 1_000
+REQUESTS = 10_000
+REQUESTS_DATA = {
+    'get': (
+        b'GET /api/items?page=2&sort=desc HTTP/1.1\r\n'
+        b'Host: example.com\r\n'
+        b'User-Agent: curl/8.4.0\r\n'
+        b'Accept: */*\r\n'
+        b'\r\n'
+    ),
+    'post': (
+        b'POST /api/items HTTP/1.1\r\n'
+        b'Host: example.com\r\n'
+        b'Content-Type: application/json\r\n'
+        b'Content-Length: 27\r\n'
+        b'\r\n'
+        b'{"name":"item","price":1.5}'
+    ),
+}
+DEFAULT_HEADERS = Headers({'server': 'rush', 'connection': 'keep-alive'})
+
+
+def process(protocol: Protocol, parser: HttpRequestParser, response: Response, data: bytes):
+    parser.feed_data(data)
+    request = protocol.pop_completed()
+    request.headers.get('host')
+    request.params()
+    response(code=200, headers={'content-type': 'text/plain'}, body=b'hello')
+
+    return request
+
+
+def reset(protocol: Protocol, response: Response, request) -> None:
+    protocol.recycle(request)
+    response.wipe()
+
+
+def noop(*_) -> None:
+    pass
+
+
+def measure(data: bytes, reset_func=reset):
+    protocol = Protocol(SimpleDevStorage())
+    parser = protocol.parser = HttpRequestParser(protocol)
+    response = Response(DEFAULT_HEADERS)
+
+    for _ in range(WARMUP):
+        reset(protocol, response, process(protocol, parser, response, data))
+
+    reset_peak = request_peak = 0
+    tracemalloc.start()
+    retained_before = tracemalloc.get_traced_memory()[0]
+
+    for _ in range(REQUESTS):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        request = process(protocol, parser, response, data)
+
+        processed = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        reset_func(protocol, response, request)
+        current, peak = tracemalloc.get_traced_memory()
+
+        reset_peak = max(reset_peak, peak - processed)
+        request_peak = max(request_peak, max(peak, processed) - before)
+
+        if reset_func is noop:
+            reset(protocol, response, request)
+
+    retained = tracemalloc.get_traced_memory()[0] - retained_before
+    tracemalloc.stop()
+
+    return reset_peak, request_peak, retained
+
+
+if __name__ == '__main__':
+    failed = False
+
+    for title, request_data in REQUESTS_DATA.items():
+        # tracemalloc itself allocates some ints and tuples while measuring
+        reset_noise, _, retained_noise = measure(request_data, reset_func=noop)
+        reset_bytes, request_bytes, retained_bytes = measure(request_data)
+        reset_bytes = max(reset_bytes - reset_noise, 0)
+        retained_bytes = max(retained_bytes - retained_noise, 0)
+        print(f'{title}:')
+        print(f'  reset     {reset_bytes:>8} bytes')
+        print(f'  request   {request_bytes:>8} bytes')
+        print(f'  retained  {retained_bytes:>8} bytes after {REQUESTS} requests')
+
+        failed = failed or reset_bytes > 0 or retained_bytes > 0
+
+    if failed:
+        print('reset must allocate nothing, and nothing must be retained')
+        sys.exit(1)
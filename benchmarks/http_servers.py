@@ -0,0 +1,126 @@
+"""
+Compares HTTP server backends on real sockets:
+- uvloop: AioHTTPServer with DirectServerProtocol
+- uvloop+eager: the same, but with eager handlers
+- epoll: EpollHTTPServer
+
+Server runs in a single process. Load is generated by LOAD_PROCESSES
+processes, every of which keeps CONNECTIONS keep-alive connections, sending
+small GETs one by one, and pipelined by PIPELINE_DEPTH, for DURATION seconds.
+Server and load generator share the machine, so it's better to have at
+least LOAD_PROCESSES + 1 cores
+
+Run from the repository root: python -m benchmarks.http_servers
+"""
+
+import time
+import socket
+import asyncio
+import logging
+import multiprocessing
+
+from rush import webserver
+from rush.server.aiohttpserver import AioHTTPServer
+from rush.server.epollserver import EpollHTTPServer
+from rush.dispatcher.default import AsyncDispatcher
+
+PORT = 9192
+DURATION = 5
+LOAD_PROCESSES = 2
+CONNECTIONS = 32
+PIPELINE_DEPTH = 16
+REQUEST = b'GET / HTTP/1.1\r\nHost: localhost\r\nUser-Agent: bench\r\nAccept: */*\r\n\r\n'
+BODY = b'Hello, world!'
+
+
+def serve(httpserver, eager_handlers: bool):
+    dp = AsyncDispatcher()
+
+    @dp.get('/')
+    async def index(request, response):
+        return response(body=BODY)
+
+    logger = logging.getLogger('benchmark')
+    logger.disabled = True
+    webserver.WebServer(webserver.Settings(
+        port=PORT,
+        processes=1,
+        httpserver=httpserver,
+        eager_handlers=eager_handlers,
+        logger=logger,
+        asyncio_logging=False
+    )).run(dp)
+
+
+async def connection(depth: int, deadline: float) -> int:
+    reader, writer = await asyncio.open_connection('127.0.0.1', PORT)
+    requests = REQUEST * depth
+    done = 0
+
+    while time.monotonic() < deadline:
+        writer.write(requests)
+        received = 0
+
+        # responses are the same, so it's enough to count their bodies
+        while received < depth:
+            received += (await reader.read(65536)).count(BODY)
+
+        done += depth
+
+    writer.close()
+
+    return done
+
+
+def load(depth: int, results: multiprocessing.Queue):
+    async def main():
+        deadline = time.monotonic() + DURATION
+        done = await asyncio.gather(*(connection(depth, deadline) for _ in range(CONNECTIONS)))
+        results.put(sum(done))
+
+    asyncio.run(main())
+
+
+def wait_for_server():
+    while True:
+        try:
+            socket.create_connection(('127.0.0.1', PORT)).close()
+            return
+        except ConnectionRefusedError:
+            time.sleep(.1)
+
+
+def bench(depth: int, httpserver, eager_handlers: bool) -> float:
+    server = multiprocessing.Process(target=serve, args=(httpserver, eager_handlers))
+    server.start()
+    wait_for_server()
+
+    results = multiprocessing.Queue()
+    loaders = [multiprocessing.Process(target=load, args=(depth, results))
+               for _ in range(LOAD_PROCESSES)]
+
+    for loader in loaders:
+        loader.start()
+
+    done = sum(results.get() for _ in loaders)
+
+    for loader in loaders:
+        loader.join()
+
+    server.terminate()
+    server.join()
+
+    return done / DURATION
+
+
+if __name__ == '__main__':
+    for pipeline_depth in (1, PIPELINE_DEPTH):
+        print(f'pipeline depth {pipeline_depth}:')
+
+        for name, server_class, eager in (
+                ('uvloop', AioHTTPServer, False),
+                ('uvloop+eager', AioHTTPServer, True),
+                ('epoll', EpollHTTPServer, False),
+        ):
+            rps = bench(pipeline_depth, server_class, eager)
+            print(f'  {name:<14} {rps:>10.0f} req/s')
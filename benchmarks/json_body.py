@@ -0,0 +1,89 @@
+"""
+Compares reading a few fields of JSON request bodies with json.loads(),
+as handlers did themselves, against request.json() (reusable simdjson
+parser, fields are converted only when accessed). Also compares rendering
+of JSON responses with json.dumps() against response.json()
+
+Run from the repository root: python -m benchmarks.json_body
+"""
+
+import json
+from timeit import timeit
+
+from rush.entities import Request, Response, Headers, JSON_NOT_PARSED
+from rush.storage.fd_sendfile import SimpleDevStorage
+from rush.utils import jsonutils
+from rush.utils.httputils import render_http_response
+
+REPEATS = 20_000
+BODIES = {
+    'small': {'user': 'someone', 'password': 'hunter2', 'remember': True},
+    'big': {
+        'user': 'someone',
+        'items': [
+            {'id': i, 'name': f'item {i}', 'price': i * 1.5, 'tags': ['a', 'b', 'c']}
+            for i in range(300)
+        ],
+    },
+}
+DEFAULT_HEADERS = Headers({'server': 'rush', 'connection': 'keep-alive'})
+
+
+def with_json_loads(request: Request):
+    return json.loads(request.body)['user']
+
+
+def with_request_json(request: Request):
+    # as if it's a new request
+    request.parsed_json = JSON_NOT_PARSED
+
+    return request.json()['user']
+
+
+def render(response: Response) -> bytes:
+    return render_http_response(
+        protocol=b'1.1',
+        code=response.code,
+        status_code=response.status,
+        headers=response.headers,
+        body=response.body,
+        count_content_length=True
+    )
+
+
+def with_json_dumps(response: Response, obj) -> bytes:
+    response.wipe()
+
+    return render(response(
+        headers={'content-type': 'application/json'},
+        body=json.dumps(obj)
+    ))
+
+
+def with_response_json(response: Response, obj) -> bytes:
+    response.wipe()
+
+    return render(response.json(obj))
+
+
+def report(name: str, elapsed: float):
+    print(f'  {name:<16} {elapsed / REPEATS * 1e6:>10.2f}us')
+
+
+if __name__ == '__main__':
+    print(f'parser: {"simdjson" if jsonutils.simdjson else "fallback"}, '
+          f'encoder: {"orjson" if jsonutils.orjson else "ujson" if jsonutils.ujson else "json"}')
+
+    for title, obj in BODIES.items():
+        body = json.dumps(obj).encode()
+        request = Request(SimpleDevStorage())
+        response = Response(DEFAULT_HEADERS)
+        request.body = body
+
+        print(f'{title} body ({len(body)} bytes), reading one field:')
+        report('json.loads', timeit(lambda: with_json_loads(request), number=REPEATS))
+        report('request.json', timeit(lambda: with_request_json(request), number=REPEATS))
+
+        print(f'{title} body, rendering the response:')
+        report('json.dumps', timeit(lambda: with_json_dumps(response, obj), number=REPEATS))
+        report('response.json', timeit(lambda: with_response_json(response, obj), number=REPEATS))
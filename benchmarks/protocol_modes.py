@@ -0,0 +1,106 @@
+"""
+Compares server protocols on keep-alive connection with small GET requests,
+sent one by one and pipelined:
+- queue: AsyncioServerProtocol (data -> queue -> client runner task -> parser)
+- direct: DirectServerProtocol (data -> parser -> dispatcher task)
+- direct+eager: DirectServerProtocol with eager handlers (no tasks at all)
+
+Sockets are replaced by fake transport, so only protocol overhead is measured
+
+Run from the repository root: python -m benchmarks.protocol_modes
+"""
+
+import asyncio
+from time import perf_counter
+
+from rush.entities import Request, Response, CaseInsensitiveDict
+from rush.dispatcher.default import AsyncDispatcher
+from rush.storage.fd_sendfile import SimpleDevStorage
+from rush.server.aiohttpserver import (server_protocol_factory,
+                                       AsyncioServerProtocol, DirectServerProtocol)
+
+REQUESTS = 100_000
+PIPELINE_DEPTH = 16
+REQUEST = b'GET / HTTP/1.1\r\nHost: localhost\r\nUser-Agent: bench\r\nAccept: */*\r\n\r\n'
+
+
+class FakeTransport:
+    def __init__(self):
+        self.written = None
+
+    def write(self, data: bytes):
+        self.written.set_result([data])
+
+    def writelines(self, data):
+        self.written.set_result(list(data))
+
+    def set_write_buffer_limits(self, high=None, low=None):
+        pass
+
+    def pause_reading(self):
+        pass
+
+    def resume_reading(self):
+        pass
+
+    def is_closing(self):
+        return False
+
+    def close(self):
+        pass
+
+
+def make_dispatcher() -> AsyncDispatcher:
+    dp = AsyncDispatcher()
+
+    @dp.get('/')
+    async def index(request: Request, response: Response) -> Response:
+        return response(body=b'Hello, world!')
+
+    dp.on_begin_serving()
+
+    return dp
+
+
+async def bench(depth: int, protocol_class, **options) -> float:
+    loop = asyncio.get_running_loop()
+    dp = make_dispatcher()
+    protocol = server_protocol_factory(
+        dp.process_request,
+        SimpleDevStorage(),
+        CaseInsensitiveDict(server='rush'),
+        protocol_class,
+        **options
+    )
+    transport = FakeTransport()
+    protocol.connection_made(transport)  # noqa
+
+    data = REQUEST * depth
+    begin = perf_counter()
+
+    for _ in range(REQUESTS // depth):
+        transport.written = loop.create_future()
+        protocol.data_received(data)
+        assert len(await transport.written) == depth
+
+    elapsed = perf_counter() - begin
+    protocol.connection_lost(None)
+
+    return elapsed
+
+
+async def main():
+    for depth in (1, PIPELINE_DEPTH):
+        print(f'pipeline depth {depth}:')
+
+        for name, protocol_class, options in (
+                ('queue', AsyncioServerProtocol, {}),
+                ('direct', DirectServerProtocol, {}),
+                ('direct+eager', DirectServerProtocol, {'eager_handlers': True}),
+        ):
+            elapsed = await bench(depth, protocol_class, **options)
+            print(f'  {name:<14} {REQUESTS / elapsed:>10.0f} req/s')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
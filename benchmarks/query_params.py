@@ -0,0 +1,59 @@
+"""
+Compares parsing of query strings with urllib.parse.parse_qs (on the
+decoded string, as it takes str), with parse_params(), and with cached
+parse_query() for the query strings that repeat. Also compares URL decoding
+with the previous implementation, that concatenated the result piece by
+piece, and with urllib.parse.unquote_to_bytes
+
+Run from the repository root: python -m benchmarks.query_params
+"""
+
+from timeit import timeit
+from urllib.parse import parse_qs, unquote_to_bytes
+
+from rush.utils.httputils import parse_params, parse_query, decode_url, HEX_TO_BYTE
+
+REPEATS = 100_000
+QUERIES = {
+    'short': b'page=2&sort=desc',
+    'typical': b'q=rush+web+server&lang=en&page=3&per_page=50&sort=stars&order=desc',
+    'escaped': b'redirect=https%3A%2F%2Fexample.com%2Fpath%3Fa%3D1%26b%3D2&'
+               b'name=%D0%9F%D1%80%D0%B8%D0%B2%D1%96%D1%82&tags=a&tags=b&tags=c',
+}
+ESCAPED_URLS = {
+    '1KiB': b'/search/' + b'%41' * 340,
+    '64KiB': b'/search/' + b'%41' * 21_800,
+}
+
+
+def concat_decode_url(bytestring: bytes) -> bytes:
+    bits = bytestring.split(b'%')
+    decoded: bytes = bits[0]
+
+    for item in bits[1:]:
+        try:
+            decoded += HEX_TO_BYTE[item[:2]] + item[2:]
+        except KeyError:
+            decoded += b'%' + item
+
+    return decoded
+
+
+def report(name: str, elapsed: float, repeats: int):
+    print(f'  {name:<14} {elapsed / repeats * 1e6:>10.2f}us')
+
+
+if __name__ == '__main__':
+    for title, query in QUERIES.items():
+        print(f'{title} query ({len(query)} bytes):')
+        report('parse_qs', timeit(lambda: parse_qs(query.decode(), keep_blank_values=True),
+                                  number=REPEATS), REPEATS)
+        report('parse_params', timeit(lambda: parse_params(query), number=REPEATS), REPEATS)
+        report('parse_query', timeit(lambda: parse_query(query), number=REPEATS), REPEATS)
+
+    for title, url in ESCAPED_URLS.items():
+        repeats = REPEATS // 100
+        print(f'decoding {title} escaped url:')
+        report('concatenation', timeit(lambda: concat_decode_url(url), number=repeats), repeats)
+        report('unquote', timeit(lambda: unquote_to_bytes(url), number=repeats), repeats)
+        report('decode_url', timeit(lambda: decode_url(url), number=repeats), repeats)
@@ -0,0 +1,61 @@
+"""
+Compares receiving of request bodies of different sizes, coming in
+CHUNK_SIZE pieces (as they are read from the socket):
+- concat: body += chunk, as parser did before
+- chunks: chunks are collected and joined once, when body is complete
+- spill: the same, but bodies over 1MiB are written into a temporary file
+
+Run from the repository root: python -m benchmarks.request_body
+"""
+
+from time import perf_counter
+
+from httptools import HttpRequestParser
+
+from rush.storage.fd_sendfile import SimpleDevStorage
+from rush.parser.httptools_protocol import Protocol
+
+CHUNK_SIZE = 64 * 1024
+BODY_SIZES = (16 * 1024, 1024 * 1024, 8 * 1024 * 1024, 32 * 1024 * 1024)
+TOTAL_BYTES = 256 * 1024 * 1024
+
+
+class ConcatProtocol(Protocol):
+    def on_body(self, body: bytes):
+        self.request_obj.body += body
+
+
+def bench(protocol: Protocol, body_size: int) -> float:
+    parser = protocol.parser = HttpRequestParser(protocol)
+    head = b'POST /upload HTTP/1.1\r\nContent-Length: %d\r\n\r\n' % body_size
+    chunk = b'x' * CHUNK_SIZE
+    full_chunks, rest = divmod(body_size, CHUNK_SIZE)
+    requests = max(TOTAL_BYTES // body_size, 1)
+    begin = perf_counter()
+
+    for _ in range(requests):
+        parser.feed_data(head)
+
+        for _ in range(full_chunks):
+            parser.feed_data(chunk)
+
+        if rest:
+            parser.feed_data(chunk[:rest])
+
+        protocol.recycle(protocol.pop_completed())
+
+    return (perf_counter() - begin) / requests
+
+
+if __name__ == '__main__':
+    for size in BODY_SIZES:
+        print(f'body of {size // 1024}KiB:')
+
+        for name, protocol in (
+                ('concat', ConcatProtocol(SimpleDevStorage())),
+                ('chunks', Protocol(SimpleDevStorage())),
+                ('spill', Protocol(SimpleDevStorage(), spill_threshold=1024 * 1024)),
+        ):
+            elapsed = bench(protocol, size)
+            print(f'  {name:<8} {elapsed * 1e3:>10.3f}ms per request  '
+                  f'{size / elapsed / 2 ** 20:>8.0f}MiB/s')
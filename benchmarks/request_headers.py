@@ -0,0 +1,88 @@
+"""
+Compares parsing of header-heavy requests (like ones browsers send, with
+cookies) with headers kept raw and decoded lazily, against decoding all of
+them eagerly into CaseInsensitiveDict (as parser did before). Handler reads
+no headers, or three of them
+
+Run from the repository root: python -m benchmarks.request_headers
+"""
+
+from time import perf_counter
+
+from httptools import HttpRequestParser
+
+from rush.entities import CaseInsensitiveDict, Headers
+from rush.storage.fd_sendfile import SimpleDevStorage
+from rush.parser.httptools_protocol import Protocol
+
+REQUESTS = 200_000
+REQUEST = (
+    b'GET /account/settings?tab=privacy HTTP/1.1\r\n'
+    b'Host: example.com\r\n'
+    b'Connection: keep-alive\r\n'
+    b'sec-ch-ua: "Chromium";v="118", "Google Chrome";v="118", "Not=A?Brand";v="99"\r\n'
+    b'sec-ch-ua-mobile: ?0\r\n'
+    b'sec-ch-ua-platform: "Linux"\r\n'
+    b'Upgrade-Insecure-Requests: 1\r\n'
+    b'User-Agent: Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 '
+    b'(KHTML, like Gecko) Chrome/118.0.0.0 Safari/537.36\r\n'
+    b'Accept: text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,'
+    b'image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7\r\n'
+    b'Sec-Fetch-Site: same-origin\r\n'
+    b'Sec-Fetch-Mode: navigate\r\n'
+    b'Sec-Fetch-User: ?1\r\n'
+    b'Sec-Fetch-Dest: document\r\n'
+    b'Referer: https://example.com/account\r\n'
+    b'Accept-Encoding: gzip, deflate, br\r\n'
+    b'Accept-Language: en-US,en;q=0.9,uk;q=0.8\r\n'
+    b'Cookie: sessionid=6f1c0e5b9a3d4f2e8b7a6c5d4e3f2a1b; '
+    b'csrftoken=Zq8rT4nW2xY7vB1mK9pL3sD6fH0jG5cE; '
+    b'_ga=GA1.1.1234567890.1697040000; _ga_ABCDEF1234=GS1.1.1697040000.1.1.1697040100.0.0.0; '
+    b'theme=dark; lang=en\r\n'
+    b'\r\n'
+)
+READ_HEADERS = ('host', 'cookie', 'user-agent')
+
+
+class EagerProtocol(Protocol):
+    """
+    Decodes every header into CaseInsensitiveDict as soon as it's received
+    """
+
+    def on_message_begin(self):
+        if self.spare_requests:
+            # base protocol expects it to be there, but it's not used
+            self.spare_requests[-1].headers = Headers()
+
+        super(EagerProtocol, self).on_message_begin()
+        self.request_obj.headers = CaseInsensitiveDict()
+
+    def on_header(self, header: bytes, value: bytes):
+        self.request_obj.headers[header.decode()] = value.decode()
+
+
+def bench(protocol_class, read_headers) -> float:
+    protocol = protocol_class(SimpleDevStorage())
+    parser = protocol.parser = HttpRequestParser(protocol)
+    begin = perf_counter()
+
+    for _ in range(REQUESTS):
+        parser.feed_data(REQUEST)
+        request = protocol.pop_completed()
+
+        for header in read_headers:
+            request.headers.get(header)
+
+        protocol.recycle(request)
+
+    return perf_counter() - begin
+
+
+if __name__ == '__main__':
+    for read in ((), READ_HEADERS):
+        print(f'reading {len(read)} headers of 17:')
+
+        for name, protocol_cls in (('eager', EagerProtocol), ('lazy', Protocol)):
+            elapsed = bench(protocol_cls, read)
+            print(f'  {name:<6} {REQUESTS / elapsed:>10.0f} req/s  '
+                  f'{elapsed / REQUESTS * 1e6:.2f}us per request')
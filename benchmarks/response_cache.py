@@ -0,0 +1,73 @@
+"""
+Compares processing of a GET request by the dispatcher with and without
+the response cache of the route (see dispatcher.cache.CachePolicy). The
+route has 3 middlewares and renders a small JSON response, cache is hit
+every time, but the first. Also shows counters of the cache
+
+Run from the repository root: python -m benchmarks.response_cache
+"""
+
+import asyncio
+from time import perf_counter
+
+from rush.entities import Request, Response
+from rush.storage.fd_sendfile import SimpleDevStorage
+from rush.dispatcher.cache import CachePolicy
+from rush.dispatcher.default import AsyncDispatcher
+from rush.middlewares.base import BaseMiddleware
+
+REQUESTS = 100_000
+ITEM = {'id': 123, 'name': 'item', 'price': 1.5, 'tags': ['a', 'b', 'c']}
+
+
+class PassMiddleware(BaseMiddleware):
+    async def process(self, handler, request):
+        return await handler
+
+
+async def item_handler(request: Request, response: Response) -> Response:
+    return response.json(ITEM)
+
+
+def make_dispatcher() -> AsyncDispatcher:
+    dp = AsyncDispatcher()
+    middlewares = [PassMiddleware() for _ in range(3)]
+    dp.get('/items/{id:int}', middlewares=middlewares)(item_handler)
+    dp.get('/cached/items/{id:int}', middlewares=middlewares,
+           cache=CachePolicy(ttl=60, vary=['accept-language']))(item_handler)
+    dp.on_begin_serving()
+
+    return dp
+
+
+async def bench(dp: AsyncDispatcher, path: bytes) -> float:
+    request = Request(SimpleDevStorage())
+    response = Response({'server': 'rush'})
+    sent = []
+    begin = perf_counter()
+
+    for _ in range(REQUESTS):
+        request.method, request.path, request.protocol = b'GET', path, '1.1'
+        request.raw_parameters = b'fields=name,price'
+        request.headers.add(b'Accept-Language', b'en')
+        await dp.process_request(request, response, sent.append)
+        request.wipe()
+        response.wipe()
+        sent.clear()
+
+    return perf_counter() - begin
+
+
+async def main():
+    dp = make_dispatcher()
+
+    for name, path in (('no cache', b'/items/123'), ('cached', b'/cached/items/123')):
+        elapsed = await bench(dp, path)
+        print(f'{name:<10} {REQUESTS / elapsed:>10.0f} req/s  '
+              f'{elapsed / REQUESTS * 1e6:.2f}us per request')
+
+    print(dp.cache_stats())
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,96 @@
+"""
+Compares looking up the route of the request path in the router (see
+dispatcher.router.Router) against a list of compiled regexes, tried one
+by one, as frameworks often do. There are 400 routes: 40 resources with 10
+routes each, some static, some with parameters. Paths are looked up for
+the first and the last resources, as regexes of the last ones are tried
+after all the others, and for a path no route matches
+
+Run from the repository root: python -m benchmarks.routing
+"""
+
+import re
+from timeit import timeit
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from rush.dispatcher.router import Router, CONVERTERS
+
+REPEATS = 50_000
+RESOURCES = [f'resource{i}' for i in range(40)]
+ROUTE_SHAPES = (
+    '/api/v1/{res}',
+    '/api/v1/{res}/search',
+    '/api/v1/{res}/{{id:int}}',
+    '/api/v1/{res}/{{id:int}}/edit',
+    '/api/v1/{res}/{{id:int}}/comments',
+    '/api/v1/{res}/{{id:int}}/comments/{{comment_id:int}}',
+    '/api/v1/{res}/by-name/{{name}}',
+    '/v2/{res}',
+    '/v2/{res}/{{id:int}}',
+    '/files/{res}/{{file:path}}',
+)
+ROUTES = [shape.format(res=res).encode() for res in RESOURCES for shape in ROUTE_SHAPES]
+PATHS = {
+    'static, first': b'/api/v1/resource0',
+    'static, last': b'/v2/resource39',
+    'param, first': b'/api/v1/resource0/123',
+    'param, last': b'/v2/resource39/123',
+    '2 params, last': b'/api/v1/resource39/123/comments/456',
+    'tail, last': b'/files/resource39/images/2023/logo.png',
+    'not found': b'/api/v1/unknown/123',
+}
+REGEX_PARAMS = {
+    'str': rb'(?P<\1>[^/]+)',
+    'int': rb'(?P<\1>[0-9]+)',
+    'path': rb'(?P<\1>.*)',
+}
+
+
+class RegexRouter:
+    def __init__(self):
+        self.routes: List[Tuple[re.Pattern, Dict[str, Callable], Any]] = []
+
+    def add(self, path: bytes, value: Any) -> None:
+        converters = {}
+        pattern = re.escape(path)
+
+        for param_type, regex in REGEX_PARAMS.items():
+            for name in re.findall(rb'\\{(\w+):%s\\}' % param_type.encode(), pattern):
+                converters[name.decode()] = CONVERTERS.get(param_type, CONVERTERS['str'])
+
+            pattern = re.sub(rb'\\{(\w+):%s\\}' % param_type.encode(), regex, pattern)
+
+        pattern = re.sub(rb'\\{(\w+)\\}', REGEX_PARAMS['str'], pattern)
+        self.routes.append((re.compile(pattern), converters, value))
+
+    def match(self, path: bytes) -> Optional[Tuple[Any, Dict[str, Any]]]:
+        for pattern, converters, value in self.routes:
+            found = pattern.fullmatch(path)
+
+            if found is not None:
+                params = found.groupdict()
+
+                for name, converter in converters.items():
+                    params[name] = converter(params[name])
+
+                return value, params
+
+        return None
+
+
+if __name__ == '__main__':
+    router, regex_router = Router(), RegexRouter()
+
+    for route in ROUTES:
+        router.add(route, route)
+        regex_router.add(route, route)
+
+    print(f'{len(ROUTES)} routes')
+
+    for title, path in PATHS.items():
+        assert router.match(path) == regex_router.match(path), path
+        print(f'{title} ({path.decode()}):')
+
+        for name, matcher in (('regexes', regex_router), ('router', router)):
+            elapsed = timeit(lambda: matcher.match(path), number=REPEATS)
+            print(f'  {name:<8} {elapsed / REPEATS * 1e6:>10.2f}us')
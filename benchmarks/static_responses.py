@@ -0,0 +1,64 @@
+"""
+Compares processing of a GET request to a health check by a handler, that
+builds the same response every time, against the static response of the
+path (see AsyncDispatcher.add_static_response()), with and without the Date
+header
+
+Run from the repository root: python -m benchmarks.static_responses
+"""
+
+import asyncio
+from time import perf_counter
+
+from rush.entities import Request, Response
+from rush.storage.fd_sendfile import SimpleDevStorage
+from rush.dispatcher.default import AsyncDispatcher
+
+REQUESTS = 100_000
+HEADERS = {'content-type': 'application/json', 'cache-control': 'no-store'}
+BODY = b'{"status":"ok"}'
+
+
+async def health_handler(request: Request, response: Response) -> Response:
+    return response(headers=HEADERS, body=BODY)
+
+
+def make_dispatcher() -> AsyncDispatcher:
+    dp = AsyncDispatcher()
+    dp.get('/health')(health_handler)
+    dp.add_static_response('/static/health', headers=HEADERS, body=BODY)
+    dp.add_static_response('/static/health-dated', headers=HEADERS, body=BODY, date=True)
+    dp.on_begin_serving()
+
+    return dp
+
+
+async def bench(dp: AsyncDispatcher, path: bytes) -> float:
+    request = Request(SimpleDevStorage())
+    response = Response({})
+    sent = []
+    begin = perf_counter()
+
+    for _ in range(REQUESTS):
+        request.method, request.path, request.protocol = b'GET', path, '1.1'
+        await dp.process_request(request, response, sent.append)
+        request.wipe()
+        response.wipe()
+        sent.clear()
+
+    return perf_counter() - begin
+
+
+async def main():
+    dp = make_dispatcher()
+
+    for name, path in (('handler', b'/health'),
+                       ('static', b'/static/health'),
+                       ('with date', b'/static/health-dated')):
+        elapsed = await bench(dp, path)
+        print(f'{name:<10} {REQUESTS / elapsed:>10.0f} req/s  '
+              f'{elapsed / REQUESTS * 1e6:.2f}us per request')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,109 @@
+"""
+Compares throughput and latency of the multiprocess server with workers
+balanced by the kernel and with workers pinned to CPUs (with connections
+steered to the worker on the CPU received them)
+
+Server and load generator share the machine, so numbers make sense only on
+a box with a lot of cores. Load is generated by LOAD_PROCESSES processes,
+every of which keeps CONNECTIONS keep-alive connections sending small GETs
+one by one for DURATION seconds
+
+Run from the repository root: python -m benchmarks.worker_pinning [workers]
+"""
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import multiprocessing
+from statistics import quantiles
+
+from rush import webserver
+from rush.dispatcher.default import AsyncDispatcher
+
+PORT = 9191
+DURATION = 10
+LOAD_PROCESSES = 2
+CONNECTIONS = 64
+REQUEST = b'GET / HTTP/1.1\r\nHost: localhost\r\n\r\n'
+
+
+def serve(workers: int, pin_workers: bool):
+    dp = AsyncDispatcher()
+
+    @dp.get('/')
+    async def index(request, response):
+        return response(body=b'Hello, world!')
+
+    logger = logging.getLogger('benchmark')
+    logger.disabled = True
+    webserver.WebServer(webserver.Settings(
+        port=PORT,
+        processes=workers,
+        pin_workers=pin_workers,
+        logger=logger,
+        asyncio_logging=False
+    )).run(dp)
+
+
+async def connection(latencies: list, deadline: float):
+    reader, writer = await asyncio.open_connection('127.0.0.1', PORT)
+
+    while time.monotonic() < deadline:
+        begin = time.perf_counter()
+        writer.write(REQUEST)
+        await reader.readuntil(b'\r\n\r\n')
+        # body is fixed-size and short, so it's always in the same chunk
+        await reader.readexactly(len(b'Hello, world!'))
+        latencies.append(time.perf_counter() - begin)
+
+    writer.close()
+
+
+def load(results: multiprocessing.Queue):
+    latencies = []
+    deadline = time.monotonic() + DURATION
+
+    async def main():
+        await asyncio.gather(*(connection(latencies, deadline) for _ in range(CONNECTIONS)))
+
+    asyncio.run(main())
+    results.put(latencies)
+
+
+def bench(workers: int, pin_workers: bool):
+    server = multiprocessing.Process(target=serve, args=(workers, pin_workers))
+    server.start()
+    time.sleep(1)
+
+    results = multiprocessing.Queue()
+    loaders = [multiprocessing.Process(target=load, args=(results,))
+               for _ in range(LOAD_PROCESSES)]
+
+    for loader in loaders:
+        loader.start()
+
+    latencies = []
+
+    for _ in loaders:
+        latencies.extend(results.get())
+
+    for loader in loaders:
+        loader.join()
+
+    server.terminate()
+    server.join()
+
+    percentiles = quantiles(latencies, n=100)
+    print(f'  {"pinned" if pin_workers else "kernel":<8} '
+          f'{len(latencies) / DURATION:>10.0f} req/s  '
+          f'p50={percentiles[49] * 1000:.2f}ms  p99={percentiles[98] * 1000:.2f}ms')
+
+
+if __name__ == '__main__':
+    workers_count = int(sys.argv[1]) if len(sys.argv) > 1 else max(os.cpu_count() // 2, 1)
+    print(f'{workers_count} workers:')
+
+    for pinned in (False, True):
+        bench(workers_count, pinned)
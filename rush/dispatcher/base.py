@@ -1,5 +1,5 @@
 import abc
-from typing import Callable
+from typing import Callable, Optional
 
 from ..entities import Request, Response
 
@@ -18,6 +18,34 @@ class BaseDispatcher(abc.ABC):
         This method is optional
         """
 
+    def get_max_body_size(self, request: Request) -> Optional[int]:
+        """
+        Called when headers of the request with body are received. Returns
+        max size of its body, or None if global limit must be applied
+
+        This method is optional
+        """
+
+    def streams_body(self, request: Request) -> bool:
+        """
+        Called when headers of the request with body are received. If returns
+        True, request is processed at once, and its body is given to the
+        handler by request.stream() as it's received
+
+        This method is optional
+        """
+
+        return False
+
+    def check_continue(self, request: Request) -> Optional[bytes]:
+        """
+        Called when headers of the request with `Expect: 100-continue` are
+        received, before client sends the body. Returns None to let client
+        send it, or a rendered response to reject the request with at once
+
+        This method is optional
+        """
+
     @abc.abstractmethod
     async def process_request(self,
                               request: Request,
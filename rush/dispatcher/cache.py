@@ -0,0 +1,150 @@
+from time import monotonic
+from functools import lru_cache
+from collections import OrderedDict
+from typing import Dict, Hashable, Iterable, Optional, Tuple
+
+from ..entities import Request, Headers
+from ..utils.httputils import parse_query, PARAMS_CACHE_SIZE, PARAMS_CACHE_MAX_LENGTH
+
+# responses to other methods are never cached
+CACHEABLE_METHODS = {b'GET', b'HEAD'}
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_MAX_SIZE = 16 * 1024 * 1024
+
+CacheKey = Tuple[Hashable, ...]
+
+
+def normalize_query(query: Optional[bytes]) -> Tuple[Tuple[str, Tuple[str, ...]], ...]:
+    """
+    Returns decoded parameters of the query string, sorted by names, so the
+    same parameters in another order or escaped in another way give the
+    same result
+    """
+
+    if not query:
+        return ()
+
+    if len(query) > PARAMS_CACHE_MAX_LENGTH:
+        return _normalize_query(query)
+
+    return _normalize_query_cached(query)
+
+
+def _normalize_query(query: bytes) -> Tuple[Tuple[str, Tuple[str, ...]], ...]:
+    return tuple(sorted((name, tuple(values)) for name, values in parse_query(query).items()))
+
+
+_normalize_query_cached = lru_cache(maxsize=PARAMS_CACHE_SIZE)(_normalize_query)
+
+
+class CachePolicy:
+    """
+    Describes how responses of the route are cached. Responses are kept for
+    `ttl` seconds by the request path, query (parameters order doesn't
+    matter) and values of `vary` request headers. Each worker has its own
+    cache, that keeps at most `max_entries` responses of at most `max_size`
+    bytes in total, evicting the least recently used ones
+
+    Only successful (200) responses to GET and HEAD without Set-Cookie are
+    cached. Cached response is sent as it is, without calling middlewares,
+    so if they decide something by the request (like authorization does),
+    the headers they use must be listed in `vary`
+    """
+
+    def __init__(self,
+                 ttl: float,
+                 vary: Iterable[str] = (),
+                 max_entries: int = DEFAULT_MAX_ENTRIES,
+                 max_size: int = DEFAULT_MAX_SIZE):
+        self.ttl = ttl
+        self.vary = tuple(name.lower() for name in vary)
+        self.max_entries = max_entries
+        self.max_size = max_size
+
+
+class ResponseCache:
+    """
+    Rendered responses of a single route, in order they were used
+    """
+
+    __slots__ = ('policy', 'entries', 'size', 'hits', 'misses', 'evictions', 'expirations')
+
+    def __init__(self, policy: CachePolicy):
+        self.policy = policy
+        # key -> (expiration time, rendered response)
+        self.entries: 'OrderedDict[CacheKey, Tuple[float, bytes]]' = OrderedDict()
+        # total length of the responses
+        self.size = 0
+
+        self.hits = 0
+        self.misses = 0
+        # responses removed to fit the limits, and the outdated ones
+        self.evictions = 0
+        self.expirations = 0
+
+    def make_key(self, request: Request) -> Optional[CacheKey]:
+        """
+        Returns the key of the request, or None if its response must not be
+        cached
+        """
+
+        if request.method not in CACHEABLE_METHODS:
+            return None
+
+        headers = request.headers
+
+        return (request.method, request.path, normalize_query(request.raw_parameters),
+                *[headers.get_raw(name) for name in self.policy.vary])
+
+    def get(self, key: CacheKey) -> Optional[bytes]:
+        entry = self.entries.get(key)
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, response = entry
+
+        if expires_at <= monotonic():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+
+        return response
+
+    def put(self, key: CacheKey, code: int, headers: Headers, response: bytes) -> None:
+        if code != 200 or 'set-cookie' in headers or len(response) > self.policy.max_size:
+            return
+
+        if key in self.entries:
+            self._remove(key)
+
+        self.entries[key] = (monotonic() + self.policy.ttl, response)
+        self.size += len(response)
+
+        while len(self.entries) > self.policy.max_entries or self.size > self.policy.max_size:
+            _, (_, evicted) = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.size = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'entries': len(self.entries),
+            'size': self.size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+    def _remove(self, key: CacheKey) -> None:
+        _, response = self.entries.pop(key)
+        self.size -= len(response)
@@ -1,19 +1,26 @@
 import logging
 import sys
 import traceback
-from functools import reduce
+from time import time
 from asyncio import iscoroutinefunction
-from typing import (Dict, Callable, Awaitable, Union, Type, Iterable, List, Optional)
+from typing import (Dict, Callable, Awaitable, Union, Type, Iterable, List, Optional, Set, Tuple)
 
 from .. import exceptions
 from .base import BaseDispatcher
-from ..entities import Request, Response
-from ..middlewares.base import BaseMiddleware
+from .router import Router
+from .cache import CachePolicy, ResponseCache
+from ..entities import Request, Response, Headers
+from ..middlewares.base import BaseMiddleware, SyncMiddleware, Middleware
 from ..utils.stringutils import make_sure_bytes_or_none
-from ..utils.httputils import HTTP_METHODS, render_http_response
+from ..utils.httputils import HTTP_METHODS, render_http_response, http_date
 from ..typehints import RoutePath, AsyncFunction, HTTPMethod, Logger
 
 ErrorHandler = Callable[[Request, Response, Exception], Awaitable[Response]]
+# called with the request which body isn't received yet. Raises
+# exceptions.HTTPError to reject it
+ContinueCheck = Callable[[Request], None]
+# static responses are sent only to these methods
+STATIC_RESPONSE_METHODS = {b'GET', b'HEAD'}
 PRE_RENDERED_INTERNAL_ERROR_RESPONSE = render_http_response(
     protocol=b'1.1',
     code=500,
@@ -30,28 +37,79 @@ PRE_RENDERED_NOT_FOUND = render_http_response(
 )
 
 
-def collapse_middlewares(middlewares: List[BaseMiddleware],
-                         handler: Awaitable,
-                         request: Request) -> Awaitable:
+def render_rejection(code: int, description: bytes, allow: Optional[str] = None) -> bytes:
     """
-    Takes a list of middlewares and a handler, and returns single coroutine
-    that is just a chain of nested calls of next middleware (or handler in
-    the end)
+    Renders the response to the request which body is not going to be
+    received, so connection is closed after it
     """
 
-    # TODO: benchmark, what is faster: given variant below,
-    #       or making the last middleware already with handler,
-    #       and collapse all them only after that
-    return reduce(
-        lambda prev, next_: next_.process(prev, request),
-        # all the middlewares `process()` method requires handler
-        # but endpoint handler doesn't. So we just put endpoint handler
-        # as the first element in the list of middlewares so we don't need
-        # to pass any arguments to it. Ez solution, but ugly for linters
-        [handler] + middlewares  # noqa
+    headers = {'content-type': 'text/html', 'connection': 'close'}
+
+    if allow is not None:
+        headers['allow'] = allow
+
+    return render_http_response(
+        protocol=b'1.1',
+        code=code,
+        status_code=description,
+        headers=headers,
+        body=b'<h1>%d %s</h1>' % (code, description),
+        count_content_length=True
+    )
+
+
+def render_not_allowed(allow: str, with_body: bool = True) -> bytes:
+    return render_http_response(
+        protocol=b'1.1',
+        code=exceptions.HTTPMethodNotAllowed.code,
+        status_code=exceptions.HTTPMethodNotAllowed.description,
+        headers={'content-type': 'text/html', 'allow': allow},
+        body=b'<h1>405 Method Not Allowed</h1>',
+        count_content_length=True,
+        with_body=with_body
     )
 
 
+def normalize_methods(methods: Union[str, bytes, Iterable[Union[str, bytes]]]) -> Set[HTTPMethod]:
+    """
+    Returns a set of uppercase bytes methods, as request methods are
+    """
+
+    if isinstance(methods, (str, bytes)):
+        methods = (methods,)
+
+    return {make_sure_bytes_or_none(method).upper() for method in methods}
+
+
+def chain_middleware(middleware: BaseMiddleware,
+                     inner: Callable[[Request, Response], Awaitable]
+                     ) -> Callable[[Request, Response], Awaitable]:
+    process = middleware.process
+
+    def call(request: Request, response: Response) -> Awaitable:
+        return process(inner(request, response), request)
+
+    return call
+
+
+def compile_middlewares(handler: Callable[[Request, Response], Awaitable],
+                        middlewares: List[BaseMiddleware]
+                        ) -> Callable[[Request, Response], Awaitable]:
+    """
+    Takes a handler and a list of middlewares, and returns a function that
+    calls the handler through all of them, the last one being the outermost.
+    It's built once, so request costs just a call of it (and a coroutine
+    per middleware, as they take the awaitable of the next one)
+    """
+
+    chain = handler
+
+    for middleware in middlewares:
+        chain = chain_middleware(middleware, chain)
+
+    return chain
+
+
 class Handler:
     """
     A class that describes handler. Keeps it routing path,
@@ -63,23 +121,174 @@ class Handler:
                  path: RoutePath,
                  methods: Iterable[bytes],
                  any_path: bool,
-                 middlewares: List[BaseMiddleware]):
+                 middlewares: List[Middleware],
+                 max_body_size: Optional[int] = None,
+                 stream_body: bool = False,
+                 continue_check: Optional[ContinueCheck] = None,
+                 cache: Optional[CachePolicy] = None):
         self.handler = handler
         self.path = path
         self.methods = methods
         self.any_path = any_path
         self.middlewares = middlewares or []
+        # None means global limit is applied
+        self.max_body_size = max_body_size
+        # handler is called before the body is received, and reads it by
+        # request.stream()
+        self.stream_body = stream_body
+        # decides whether client that expects 100 Continue may send the body
+        self.continue_check = continue_check
+        # rendered responses, if they may be reused
+        self.cache = None if cache is None else ResponseCache(cache)
+
+        # handler with its middlewares, and sync middlewares' methods that
+        # are called around it, in order. See compile()
+        self.chain = handler
+        self.before: Tuple[Callable[[Request, Response], Optional[Response]], ...] = ()
+        self.after: Tuple[Callable[[Request, Response], Response], ...] = ()
+        self.compile([])
+
+    def compile(self, global_middlewares: List[Middleware]) -> None:
+        """
+        Builds the chain of the handler and its middlewares, with global ones
+        being outer than own ones
+        """
 
-    def get_wrapped_handler(self,
-                            request: Request,
-                            response: Response) -> Awaitable:
-        return collapse_middlewares(
-            middlewares=self.middlewares,
-            handler=self.handler(request, response),
-            request=request
+        middlewares = self.middlewares + global_middlewares
+        sync_middlewares = [
+            middleware for middleware in middlewares if isinstance(middleware, SyncMiddleware)
+        ]
+
+        self.chain = compile_middlewares(self.handler, [
+            middleware for middleware in middlewares if not isinstance(middleware, SyncMiddleware)
+        ])
+        # the outermost one is called first before, and the last after
+        self.before = tuple(
+            middleware.before for middleware in reversed(sync_middlewares)
+            if type(middleware).before is not SyncMiddleware.before
+        )
+        self.after = tuple(
+            middleware.after for middleware in sync_middlewares
+            if type(middleware).after is not SyncMiddleware.after
         )
 
 
+class MethodTable:
+    """
+    Handlers of a single route path by methods. Responses to the methods
+    that have no handlers are rendered once, in on_begin_serving()
+    """
+
+    __slots__ = ('handlers', 'allow', 'not_allowed', 'not_allowed_head')
+
+    def __init__(self):
+        self.handlers: Dict[HTTPMethod, Handler] = {}
+        # value of the Allow header
+        self.allow = ''
+        self.not_allowed = b''
+        self.not_allowed_head = b''
+
+    def compile(self, static_methods: Iterable[HTTPMethod] = ()) -> None:
+        """
+        `static_methods` are the methods answered by the static response of
+        the path, if there is one
+        """
+
+        if b'GET' in self.handlers and b'HEAD' not in self.handlers:
+            # the body is rendered, but isn't sent
+            self.handlers[b'HEAD'] = self.handlers[b'GET']
+
+        methods = set(self.handlers).union(static_methods)
+        self.allow = ', '.join(sorted(method.decode() for method in methods))
+        self.not_allowed = render_not_allowed(self.allow)
+        self.not_allowed_head = render_not_allowed(self.allow, with_body=False)
+
+
+class StaticResponse:
+    """
+    Response that is always the same, so it's rendered once, in
+    on_begin_serving(), and sent as it is to GET and HEAD requests. If it has
+    the Date header, its value is replaced once a second
+    """
+
+    __slots__ = ('code', 'status', 'headers', 'body', 'date', 'response', 'head_response',
+                 '_date_second', '_date_offsets')
+
+    def __init__(self,
+                 code: int,
+                 status: Optional[bytes],
+                 headers: Union[Dict, Headers],
+                 body: bytes,
+                 date: bool):
+        self.code = code
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.date = date
+
+        self.response = b''
+        self.head_response = b''
+        # time the Date header is rendered for, and its offset in both responses
+        self._date_second = 0
+        self._date_offsets = (0, 0)
+
+    def render(self) -> None:
+        if isinstance(self.headers, Headers):
+            headers = self.headers.copy()
+        else:
+            headers = Headers(self.headers)
+
+        if self.date:
+            # placeholder of the same length, replaced by render_date()
+            headers[b'date'] = b'x' * len(http_date(0))
+
+        self.response, self.head_response = (
+            render_http_response(
+                protocol=b'1.1',
+                code=self.code,
+                status_code=self.status,
+                headers=headers,
+                body=self.body,
+                count_content_length=True,
+                with_body=with_body
+            ) for with_body in (True, False)
+        )
+
+        if self.date:
+            marker = b'\r\ndate: '
+            self._date_offsets = (
+                self.response.index(marker) + len(marker),
+                self.head_response.index(marker) + len(marker)
+            )
+            self.render_date(int(time()))
+
+    def render_date(self, second: int) -> None:
+        """
+        Replaces the value of the Date header in the rendered responses. They
+        are bytes and not updated in place, as transport may still keep the
+        previous ones
+        """
+
+        date = http_date(second)
+        response_offset, head_offset = self._date_offsets
+        self.response = b'%s%s%s' % (
+            self.response[:response_offset], date, self.response[response_offset + len(date):]
+        )
+        self.head_response = b'%s%s%s' % (
+            self.head_response[:head_offset], date, self.head_response[head_offset + len(date):]
+        )
+        self._date_second = second
+
+    def get(self, method: HTTPMethod) -> bytes:
+        if self.date:
+            second = int(time())
+
+            if second != self._date_second:
+                self.render_date(second)
+
+        return self.head_response if method == b'HEAD' else self.response
+
+
 class Route:
     """
     Mainly class for cases when you need to add routes without using
@@ -90,15 +299,20 @@ class Route:
                  handler: AsyncFunction,
                  path: RoutePath,
                  method_or_methods: Union[str, bytes, Iterable] = HTTP_METHODS,
-                 middlewares: Optional[List[BaseMiddleware]] = None):
+                 middlewares: Optional[List[Middleware]] = None,
+                 max_body_size: Optional[int] = None,
+                 stream_body: bool = False,
+                 continue_check: Optional[ContinueCheck] = None,
+                 cache: Optional[CachePolicy] = None):
         self.handler = handler
         self.path = path if isinstance(path, bytes) else path.encode()
 
-        if not isinstance(method_or_methods, Iterable):
-            method_or_methods = {method_or_methods}
-
-        self.methods = method_or_methods
+        self.methods = normalize_methods(method_or_methods)
         self.middlewares = middlewares or []
+        self.max_body_size = max_body_size
+        self.stream_body = stream_body
+        self.continue_check = continue_check
+        self.cache = cache
 
 
 class AsyncDispatcher(BaseDispatcher):
@@ -108,7 +322,10 @@ class AsyncDispatcher(BaseDispatcher):
         else:
             self.logger = logger
 
-        self.usual_handlers: Dict[bytes, Handler] = {}
+        # method tables by their paths. Path may have parameters, like
+        # `/users/{id:int}`, and they're set to request.path_params
+        self.router = Router()
+        self.method_tables: Dict[bytes, MethodTable] = {}
         self.any_paths_handlers: Dict[HTTPMethod, Handler] = {
             method: None for method in HTTP_METHODS
         }
@@ -116,80 +333,162 @@ class AsyncDispatcher(BaseDispatcher):
         # a dict with exceptions and handlers of the exceptions
         self.error_handlers: Dict[Type[Exception], ErrorHandler] = {}
 
-        self.global_middlewares: List[BaseMiddleware] = []
+        self.global_middlewares: List[Middleware] = []
+
+        # responses that are sent as they are to GET and HEAD, by paths
+        self.static_responses: Dict[bytes, StaticResponse] = {}
 
     def on_begin_serving(self):
         """
-        Implicitly insert global middlewares to the list of middlewares
-        of all the handlers. Inserting to the beginning as it is tenable
+        Compiles middlewares of every handler into a single chain, implicitly
+        adding global middlewares. They're the outer ones, as it is tenable
         for global middlewares to be first who will process the request
+
+        Also routes HEAD requests to GET handlers where there are no HEAD
+        ones, and renders 405 responses of every route path and static
+        responses
         """
 
-        for handler in self.usual_handlers.values():
-            self._apply_middlewares(handler, self.global_middlewares)
+        handlers = [
+            handler for table in self.method_tables.values() for handler in table.handlers.values()
+        ]
+        handlers.extend(
+            handler for handler in self.any_paths_handlers.values() if handler is not None
+        )
 
-        for handler in self.any_paths_handlers.values():
-            if handler is not None:
-                self._apply_middlewares(handler, self.global_middlewares)
+        # the same handler may serve a few methods, so it's met a few times
+        for handler in {id(handler): handler for handler in handlers}.values():
+            handler.compile(self.global_middlewares)
+
+        for path, static_response in self.static_responses.items():
+            static_response.render()
+
+            if path not in self.method_tables:
+                # so requests with other methods get 405
+                self._get_method_table(path)
+
+        for path, table in self.method_tables.items():
+            table.compile(STATIC_RESPONSE_METHODS if path in self.static_responses else ())
 
     async def process_request(self,
                               request: Request,
                               response: Response,
                               http_send: Callable[[bytes], None]) -> None:
-        if request.path not in self.usual_handlers:
-            handler = self.any_paths_handlers[request.method]
-
-            if handler is None:
-                err_handler = self._get_error_handler(exceptions.HTTPNotFound)
-
-                if err_handler is not None:
-                    rendered_response = await self._run_exception_handler(
-                        exc_handler=err_handler,
-                        request=request,
-                        response=response,
-                        exception=exceptions.HTTPNotFound(
-                            request,
-                            msg='no handlers attached for the request'
-                        )
-                    )
-                else:
-                    rendered_response = PRE_RENDERED_INTERNAL_ERROR_RESPONSE
-                    self.logger.warning(f'{request.path.decode()}: no handlers attached')
+        static_response = self.static_responses.get(request.path)
 
-                http_send(rendered_response)
-                return
-        else:
-            handler = self.usual_handlers[request.path]
+        if static_response is not None and request.method in STATIC_RESPONSE_METHODS:
+            http_send(static_response.get(request.method))
+            return
+
+        handler = self._find_handler(request)
+
+        if handler is None:
+            http_send(await self._handle_no_handler(request, response))
+            return
+
+        cache_key = None
+
+        if handler.cache is not None:
+            cache_key = handler.cache.make_key(request)
+
+            if cache_key is not None:
+                cached = handler.cache.get(cache_key)
+
+                if cached is not None:
+                    http_send(cached)
+                    return
 
         try:
-            if handler.middlewares:
-                result = await handler.get_wrapped_handler(request, response)
+            if handler.before:
+                for before in handler.before:
+                    result = before(request, response)
+
+                    if result is not None:
+                        break
+                else:
+                    result = await handler.chain(request, response)
             else:
-                result = await handler.handler(request, response)
+                result = await handler.chain(request, response)
+
+            if handler.after:
+                for after in handler.after:
+                    result = after(request, result)
         except Exception as exc:
             http_send(await self._handle_exception(request, response, exc))
             return
 
-        http_send(
-            render_http_response(
-                protocol=b'1.1',
-                code=result.code,
-                status_code=result.status,  # status can be None
-                headers=result.headers,     # but body can't, otherwise TypeError
-                body=result.body or b'',
-                # TODO: this option shouldn't be always True, so after native chunked transfer
-                #       will be implemented this flag will become optional
-                count_content_length=True
-            )
+        rendered_response = render_http_response(
+            protocol=b'1.1',
+            code=result.code,
+            status_code=result.status,  # status can be None
+            headers=result.headers,     # but body can't, otherwise TypeError
+            body=result.body or b'',
+            # TODO: this option shouldn't be always True, so after native chunked transfer
+            #       will be implemented this flag will become optional
+            count_content_length=True,
+            # responses to HEAD never have a body, though its length is sent
+            with_body=request.method != b'HEAD'
         )
 
+        if cache_key is not None:
+            handler.cache.put(cache_key, result.code, result.headers, rendered_response)
+
+        http_send(rendered_response)
+
+    def get_max_body_size(self, request: Request) -> Optional[int]:
+        handler = self._find_handler(request)
+
+        return None if handler is None else handler.max_body_size
+
+    def streams_body(self, request: Request) -> bool:
+        handler = self._find_handler(request)
+
+        return handler is not None and handler.stream_body
+
+    def check_continue(self, request: Request) -> Optional[bytes]:
+        """
+        Rejects the request if there's no handler for it (by 405 if the path
+        has handlers of other methods), or if continue_check
+        of the route raises exceptions.HTTPError. As body is never received
+        then, connection is closed after the response. Error handlers are
+        coroutines, so they can't be ran here, and default pages are used
+        """
+
+        handler = self._find_handler(request)
+
+        if handler is None:
+            table = self._find_method_table(request)
+
+            if table is not None:
+                return render_rejection(exceptions.HTTPMethodNotAllowed.code,
+                                        exceptions.HTTPMethodNotAllowed.description,
+                                        allow=table.allow)
+
+            return render_rejection(exceptions.HTTPNotFound.code,
+                                    exceptions.HTTPNotFound.description)
+
+        if handler.continue_check is not None:
+            try:
+                handler.continue_check(request)
+            except exceptions.HTTPError as exc:
+                return render_rejection(exc.code, exc.description)
+            except Exception:   # noqa: the same as with handlers
+                self.logger.exception('uncaught exception in continue check:')
+
+                return render_rejection(500, b'Internal Server Error')
+
+        return None
+
     def route(self,
               path: RoutePath,
               method: Union[str, bytes, None] = None,
               methods: Iterable[HTTPMethod] = HTTP_METHODS,
-              middlewares: Optional[List[BaseMiddleware]] = None):
-        if method is not None:
-            methods = {make_sure_bytes_or_none(method.upper())}
+              middlewares: Optional[List[Middleware]] = None,
+              max_body_size: Optional[int] = None,
+              stream_body: bool = False,
+              continue_check: Optional[ContinueCheck] = None,
+              cache: Optional[CachePolicy] = None):
+        methods = normalize_methods(methods if method is None else method)
 
         def deco(coro: Callable[[Request, Response], Awaitable]):
             if not methods:
@@ -201,9 +500,13 @@ class AsyncDispatcher(BaseDispatcher):
             self._put_handler(Handler(
                 handler=coro,
                 path=make_sure_bytes_or_none(path),
-                methods=set(methods),
+                methods=methods,
                 any_path=path is None,
-                middlewares=middlewares or []
+                middlewares=middlewares or [],
+                max_body_size=max_body_size,
+                stream_body=stream_body,
+                continue_check=continue_check,
+                cache=cache
             ))
 
             return coro
@@ -211,40 +514,145 @@ class AsyncDispatcher(BaseDispatcher):
         return deco
 
     def get(self, path: RoutePath,
-            middlewares: Optional[List[BaseMiddleware]] = None):
-        return self.route(path, 'GET', middlewares=middlewares)
+            middlewares: Optional[List[Middleware]] = None,
+            max_body_size: Optional[int] = None,
+            stream_body: bool = False,
+            continue_check: Optional[ContinueCheck] = None,
+            cache: Optional[CachePolicy] = None):
+        return self.route(path, 'GET', middlewares=middlewares,
+                          max_body_size=max_body_size, stream_body=stream_body,
+                          continue_check=continue_check, cache=cache)
 
     def post(self, path: RoutePath,
-             middlewares: Optional[List[BaseMiddleware]] = None):
-        return self.route(path, 'POST', middlewares=middlewares)
+             middlewares: Optional[List[Middleware]] = None,
+             max_body_size: Optional[int] = None,
+             stream_body: bool = False,
+             continue_check: Optional[ContinueCheck] = None,
+             cache: Optional[CachePolicy] = None):
+        return self.route(path, 'POST', middlewares=middlewares,
+                          max_body_size=max_body_size, stream_body=stream_body,
+                          continue_check=continue_check, cache=cache)
 
     def head(self, path: RoutePath,
-             middlewares: Optional[List[BaseMiddleware]] = None):
-        return self.route(path, 'HEAD', middlewares=middlewares)
+             middlewares: Optional[List[Middleware]] = None,
+             max_body_size: Optional[int] = None,
+             stream_body: bool = False,
+             continue_check: Optional[ContinueCheck] = None,
+             cache: Optional[CachePolicy] = None):
+        return self.route(path, 'HEAD', middlewares=middlewares,
+                          max_body_size=max_body_size, stream_body=stream_body,
+                          continue_check=continue_check, cache=cache)
 
     def put(self, path: RoutePath,
-            middlewares: Optional[List[BaseMiddleware]] = None):
-        return self.route(path, 'PUT', middlewares=middlewares)
+            middlewares: Optional[List[Middleware]] = None,
+            max_body_size: Optional[int] = None,
+            stream_body: bool = False,
+            continue_check: Optional[ContinueCheck] = None,
+            cache: Optional[CachePolicy] = None):
+        return self.route(path, 'PUT', middlewares=middlewares,
+                          max_body_size=max_body_size, stream_body=stream_body,
+                          continue_check=continue_check, cache=cache)
 
     def trace(self, path: RoutePath,
-              middlewares: Optional[List[BaseMiddleware]] = None):
-        return self.route(path, 'TRACE', middlewares=middlewares)
+              middlewares: Optional[List[Middleware]] = None,
+              max_body_size: Optional[int] = None,
+              stream_body: bool = False,
+              continue_check: Optional[ContinueCheck] = None,
+              cache: Optional[CachePolicy] = None):
+        return self.route(path, 'TRACE', middlewares=middlewares,
+                          max_body_size=max_body_size, stream_body=stream_body,
+                          continue_check=continue_check, cache=cache)
 
     def connect(self, path: RoutePath,
-                middlewares: Optional[List[BaseMiddleware]] = None):
-        return self.route(path, 'CONNECT', middlewares=middlewares)
+                middlewares: Optional[List[Middleware]] = None,
+                max_body_size: Optional[int] = None,
+                stream_body: bool = False,
+                continue_check: Optional[ContinueCheck] = None,
+                cache: Optional[CachePolicy] = None):
+        return self.route(path, 'CONNECT', middlewares=middlewares,
+                          max_body_size=max_body_size, stream_body=stream_body,
+                          continue_check=continue_check, cache=cache)
 
     def delete(self, path: RoutePath,
-               middlewares: Optional[List[BaseMiddleware]] = None):
-        return self.route(path, 'DELETE', middlewares=middlewares)
+               middlewares: Optional[List[Middleware]] = None,
+               max_body_size: Optional[int] = None,
+               stream_body: bool = False,
+               continue_check: Optional[ContinueCheck] = None,
+               cache: Optional[CachePolicy] = None):
+        return self.route(path, 'DELETE', middlewares=middlewares,
+                          max_body_size=max_body_size, stream_body=stream_body,
+                          continue_check=continue_check, cache=cache)
 
     def options(self, path: RoutePath,
-                middlewares: Optional[List[BaseMiddleware]] = None):
-        return self.route(path, 'OPTIONS', middlewares=middlewares)
+                middlewares: Optional[List[Middleware]] = None,
+                max_body_size: Optional[int] = None,
+                stream_body: bool = False,
+                continue_check: Optional[ContinueCheck] = None,
+                cache: Optional[CachePolicy] = None):
+        return self.route(path, 'OPTIONS', middlewares=middlewares,
+                          max_body_size=max_body_size, stream_body=stream_body,
+                          continue_check=continue_check, cache=cache)
 
     def patch(self, path: RoutePath,
-              middlewares: Optional[List[BaseMiddleware]] = None):
-        return self.route(path, 'PATCH', middlewares=middlewares)
+              middlewares: Optional[List[Middleware]] = None,
+              max_body_size: Optional[int] = None,
+              stream_body: bool = False,
+              continue_check: Optional[ContinueCheck] = None,
+              cache: Optional[CachePolicy] = None):
+        return self.route(path, 'PATCH', middlewares=middlewares,
+                          max_body_size=max_body_size, stream_body=stream_body,
+                          continue_check=continue_check, cache=cache)
+
+    def _find_handler(self, request: Request) -> Optional[Handler]:
+        """
+        Returns the handler of the route path and method. If there's none,
+        handler of any path with the method is returned, if any
+        """
+
+        found = self.router.match(request.path)
+
+        if found is not None:
+            table, request.path_params = found
+            handler = table.handlers.get(request.method)
+
+            if handler is not None:
+                return handler
+
+        return self.any_paths_handlers.get(request.method)
+
+    def _find_method_table(self, request: Request) -> Optional[MethodTable]:
+        found = self.router.match(request.path)
+
+        return None if found is None else found[0]
+
+    async def _handle_no_handler(self, request: Request, response: Response) -> bytes:
+        """
+        Returns 405 response if the route path has handlers of other methods,
+        and 404 otherwise. Default responses are rendered beforehand, so
+        they're used as they are, unless there is an error handler
+        """
+
+        table = self._find_method_table(request)
+
+        if table is None:
+            exception = exceptions.HTTPNotFound(request, msg='no handlers attached for the request')
+        else:
+            exception = exceptions.HTTPMethodNotAllowed(request, allow=table.allow)
+
+        err_handler = self._get_error_handler(exception.__class__)
+
+        if err_handler is not None:
+            return await self._run_exception_handler(
+                exc_handler=err_handler,
+                request=request,
+                response=response,
+                exception=exception
+            )
+
+        if table is None:
+            return PRE_RENDERED_NOT_FOUND
+
+        return table.not_allowed_head if request.method == b'HEAD' else table.not_allowed
 
     def add_routes(self, routes: Iterable[Route]):
         for route in routes:
@@ -256,9 +664,50 @@ class AsyncDispatcher(BaseDispatcher):
             path=route.path,
             methods=route.methods,
             any_path=not route.path,
-            middlewares=route.middlewares
+            middlewares=route.middlewares,
+            max_body_size=route.max_body_size,
+            stream_body=route.stream_body,
+            continue_check=route.continue_check,
+            cache=route.cache
         ))
 
+    def cache_stats(self) -> Dict[bytes, Dict[str, int]]:
+        """
+        Returns counters of the response caches of this worker by route paths
+        """
+
+        handlers = [
+            handler for table in self.method_tables.values() for handler in table.handlers.values()
+        ]
+
+        return {
+            handler.path: handler.cache.stats() for handler in handlers if handler.cache is not None
+        }
+
+    def add_static_response(self,
+                            path: RoutePath,
+                            code: int = 200,
+                            headers: Union[Dict, Headers, None] = None,
+                            body: Union[str, bytes] = b'',
+                            status: Optional[bytes] = None,
+                            date: bool = False) -> None:
+        """
+        Adds the response that is always the same, like the one of a health
+        check or robots.txt. It's rendered once, and sent as it is to GET and
+        HEAD requests to the path, without calling any handlers or middlewares
+        (so no default headers are added). Requests with other methods are
+        routed as usual, and get 405 if there are no handlers of them. If
+        `date` is True, response has the Date header, updated once a second
+        """
+
+        self.static_responses[make_sure_bytes_or_none(path)] = StaticResponse(
+            code=code,
+            status=status,
+            headers=headers or {},
+            body=make_sure_bytes_or_none(body),
+            date=date
+        )
+
     def handle_error(self, error: Type[Exception]):
         def deco(coro: AsyncFunction):
             self.error_handlers[error] = coro
@@ -267,10 +716,10 @@ class AsyncDispatcher(BaseDispatcher):
 
         return deco
 
-    def add_global_middleware(self, middleware: BaseMiddleware):
+    def add_global_middleware(self, middleware: Middleware):
         self.global_middlewares.append(middleware)
 
-    def add_global_middlewares(self, *middlewares: BaseMiddleware):
+    def add_global_middlewares(self, *middlewares: Middleware):
         for middleware in middlewares:
             self.add_global_middleware(middleware)
 
@@ -291,7 +740,8 @@ class AsyncDispatcher(BaseDispatcher):
                     status_code=exc.description,
                     headers=response.default_headers,
                     body=b'<h1>%d %s</h1>' % (exc.code, exc.description),
-                    count_content_length=True
+                    count_content_length=True,
+                    with_body=request.method != b'HEAD'
                 )
 
             self.logger.exception('no error handlers registered for exception:')
@@ -343,15 +793,23 @@ class AsyncDispatcher(BaseDispatcher):
             count_content_length=True
         )
 
-    @staticmethod
-    def _apply_middlewares(handler: Handler, middlewares: List[BaseMiddleware]):
-        handler.middlewares.extend(middlewares)
-
     def _put_handler(self, handler: Handler) -> None:
         if handler.any_path:
             self._add_any_path_handler(handler)
         else:
-            self.usual_handlers[handler.path] = handler
+            table = self._get_method_table(handler.path)
+
+            for method in handler.methods:
+                table.handlers[method] = handler
+
+    def _get_method_table(self, path: bytes) -> MethodTable:
+        table = self.method_tables.get(path)
+
+        if table is None:
+            table = self.method_tables[path] = MethodTable()
+            self.router.add(path, table)
+
+        return table
 
     def _add_any_path_handler(self, handler: Handler) -> None:
         for method in handler.methods:
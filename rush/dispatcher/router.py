@@ -0,0 +1,192 @@
+import re
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
+
+from .. import exceptions
+from ..entities import NO_PATH_PARAMS
+
+
+def convert_str(segment: bytes) -> str:
+    return segment.decode('utf-8', 'replace')
+
+
+def convert_int(segment: bytes) -> int:
+    # int() also takes signs, spaces and underscores
+    if not segment.isdigit():
+        raise ValueError(segment)
+
+    return int(segment)
+
+
+# converters of the typed parameters (`{id:int}`). Take the decoded segment,
+# and raise ValueError if it doesn't fit, so the next route is tried
+CONVERTERS: Dict[str, Callable[[bytes], Any]] = {
+    'str': convert_str,
+    'int': convert_int,
+}
+# `{name:path}` takes the rest of the path, slashes included. Allowed only
+# in the end of the route
+TAIL_TYPE = 'path'
+# typed parameters are tried before untyped ones at the same place
+PARAM_PRIORITY = {'str': 1}
+PARAM = re.compile(rb'^{([A-Za-z_][A-Za-z0-9_]*)(?::([A-Za-z_]+))?}$')
+
+RouteParams = Mapping[str, Any]
+RouteMatch = Tuple[Any, RouteParams]
+
+
+def is_route_pattern(path: bytes) -> bool:
+    """
+    Returns whether route path has parameters, so it can't be matched
+    just by comparing
+    """
+
+    return b'{' in path
+
+
+class Node:
+    """
+    A node of the tree, that corresponds to a single segment of the path
+    """
+
+    __slots__ = ('static', 'params', 'tail', 'value', 'has_value')
+
+    def __init__(self):
+        # segment -> child
+        self.static: Dict[bytes, Node] = {}
+        # (name, type, converter, child), in order they're tried
+        self.params: List[Tuple[str, str, Callable[[bytes], Any], Node]] = []
+        # (name, value) of the route ending with `{name:path}` here
+        self.tail: Optional[Tuple[str, Any]] = None
+        self.value: Any = None
+        self.has_value = False
+
+
+class Router:
+    """
+    Prefix tree of the routes, split by segments. Routes without parameters
+    are kept in a dict, so they're found at once, whatever a number of routes
+    is. Others are looked up segment by segment, so cost of the lookup
+    depends on the depth of the path, not on a number of routes
+
+    Static segments are preferred over parameters, and typed parameters
+    over untyped. If the preferred branch has no route for the rest of the
+    path, the next one is tried
+    """
+
+    def __init__(self):
+        self.static: Dict[bytes, Any] = {}
+        self.root = Node()
+
+    def add(self, path: bytes, value: Any) -> None:
+        """
+        Adds the route. Its path consists of static segments and parameters:
+        `{name}` matches any non-empty segment, `{name:int}` only digits, and
+        `{name:path}` the rest of the path. Route with the same path replaces
+        the previous one
+        """
+
+        if not is_route_pattern(path):
+            self.static[path] = value
+            return
+
+        node = self.root
+        names = set()
+        segments = path.split(b'/')
+
+        for position, segment in enumerate(segments):
+            if b'{' not in segment:
+                node = node.static.setdefault(segment, Node())
+                continue
+
+            # parameter always takes the whole segment
+            param = PARAM.match(segment)
+
+            if param is None:
+                raise exceptions.InvalidRoutePath(f'{path!r}: bad parameter {segment!r}')
+
+            name = param.group(1).decode()
+            param_type = (param.group(2) or b'str').decode()
+
+            if name in names:
+                raise exceptions.InvalidRoutePath(f'{path!r}: parameter {name} is repeated')
+
+            names.add(name)
+
+            if param_type == TAIL_TYPE:
+                if position != len(segments) - 1:
+                    raise exceptions.InvalidRoutePath(f'{path!r}: {{{name}:path}} must be the last')
+
+                node.tail = (name, value)
+                return
+
+            if param_type not in CONVERTERS:
+                raise exceptions.InvalidRoutePath(f'{path!r}: unknown parameter type {param_type}')
+
+            node = self._get_param_node(node, name, param_type)
+
+        node.value = value
+        node.has_value = True
+
+    def match(self, path: bytes) -> Optional[RouteMatch]:
+        """
+        Returns the value of the route and its parameters, or None if there's
+        no route for the path
+        """
+
+        value = self.static.get(path)
+
+        if value is not None:
+            return value, NO_PATH_PARAMS
+
+        segments = path.split(b'/')
+
+        return self._match(self.root, segments, 0, {})
+
+    def _match(self, node: Node, segments: List[bytes],
+               position: int, params: Dict[str, Any]) -> Optional[RouteMatch]:
+        if position == len(segments):
+            return (node.value, params) if node.has_value else None
+
+        segment = segments[position]
+        child = node.static.get(segment)
+
+        if child is not None:
+            found = self._match(child, segments, position + 1, params)
+
+            if found is not None:
+                return found
+
+        if segment:
+            for name, _, converter, child in node.params:
+                try:
+                    params[name] = converter(segment)
+                except ValueError:
+                    continue
+
+                found = self._match(child, segments, position + 1, params)
+
+                if found is not None:
+                    return found
+
+                del params[name]
+
+        if node.tail is not None:
+            name, value = node.tail
+            params[name] = b'/'.join(segments[position:]).decode('utf-8', 'replace')
+
+            return value, params
+
+        return None
+
+    @staticmethod
+    def _get_param_node(node: Node, name: str, param_type: str) -> Node:
+        for param_name, existing_type, _, child in node.params:
+            if param_name == name and existing_type == param_type:
+                return child
+
+        child = Node()
+        node.params.append((name, param_type, CONVERTERS[param_type], child))
+        # stable, so parameters of the same priority are tried in order they're added
+        node.params.sort(key=lambda param: PARAM_PRIORITY.get(param[1], 0))
+
+        return child
@@ -1,29 +1,24 @@
+import mmap
 import asyncio
-from typing import Union, Any, Dict, List, Callable, Awaitable, Optional
+from types import MappingProxyType
+from collections import deque
+from typing import (Union, Any, Dict, List, Tuple, Iterable, Callable, Awaitable, Optional,
+                    BinaryIO, Deque, AsyncIterator, Mapping)
 
 from . import exceptions
 from .typehints import Connection
 from .storage.base import Storage
-from .utils.httputils import parse_params, render_http_request
+from .utils import jsonutils
+from .utils.httputils import parse_params, parse_query, render_http_request, HEADER_KEYS
+from .parser.multipart import (MultipartParser, MultipartForm, parse_header_params,
+                               MAX_FIELD_SIZE)
 
-
-def make_async(func: Callable) -> Callable[[Any], Awaitable]:
-    """
-    A modern analogue for asyncio.coroutine(), that is unfortunately
-    was deprecated
-    """
-
-    async def not_real_async() -> Any:
-        return func()
-
-    return not_real_async
-
-
-def make_sure_async(func: Union[Callable[[Any], Callable],
-                                Callable[[Any], Awaitable]]) -> Callable[[Any], Awaitable]:
-    return \
-        func if asyncio.iscoroutinefunction(func) \
-        else make_async(func)
+# body written into a file is streamed by pieces of this size
+BODY_FILE_CHUNK_SIZE = 64 * 1024
+# request.parsed_json is set to it until body is parsed, as JSON may be null
+JSON_NOT_PARSED = object()
+# request.path_params of the routes without parameters. Read-only, as it's shared
+NO_PATH_PARAMS = MappingProxyType({})
 
 
 class CaseInsensitiveDict(dict):
@@ -66,7 +61,346 @@ class CaseInsensitiveDict(dict):
         return CaseInsensitiveDict(self.items())
 
 
+class Headers:
+    """
+    Headers as flat lists of raw names and values, in order they were added.
+    The same header may be there a few times (like Set-Cookie, or
+    X-Forwarded-For), getall() returns all its values, while get() and []
+    return the last one. Keys are case-insensitive, and the values are
+    decoded only when they are read
+
+    Lowercase index of names is built only on the first lookup, as handlers
+    usually read a few request headers of all the received. Names of common
+    headers are interned, so their lowercase versions are already known
+
+    Headers may be an overlay on top of the `base` ones (like response headers
+    on top of the default ones): base headers are not copied, but read through,
+    and headers added to the overlay are just rendered after them. Base is
+    copied only if some of its headers is replaced or removed
+    """
+
+    __slots__ = ('raw_names', 'raw_values', 'base', '_index', '_rendered')
+
+    def __init__(self,
+                 headers: Union[Dict, Iterable[Tuple[Any, Any]], None] = None,
+                 base: Optional['Headers'] = None):
+        self.raw_names: List[bytes] = []
+        self.raw_values: List[bytes] = []
+        self.base = base
+        # lowercase name -> position of its last value
+        self._index: Optional[Dict[str, int]] = None
+        # render() results by the name of the skipped header
+        self._rendered: Optional[Dict[Optional[str], bytes]] = None
+
+        if headers:
+            for name, value in headers.items() if hasattr(headers, 'items') else headers:
+                self.add(name, value)
+
+    def get_raw(self, name: Union[str, bytes], instead: Any = None) -> Union[bytes, Any]:
+        key = self._key(name)
+        position = self._get_index().get(key)
+
+        if position is not None:
+            return self.raw_values[position]
+        if self.base is not None:
+            return self.base.get_raw(key, instead)
+
+        return instead
+
+    def get(self, name: Union[str, bytes], instead: Any = None) -> Union[str, Any]:
+        value = self.get_raw(name)
+
+        return instead if value is None else value.decode()
+
+    def getall(self, name: Union[str, bytes]) -> List[str]:
+        key = self._key(name)
+        values = self.base.getall(key) if self.base is not None else []
+
+        if key in self._get_index():
+            values.extend(
+                value.decode() for name, value in zip(self.raw_names, self.raw_values)
+                if self._name_key(name) == key
+            )
+
+        return values
+
+    def __getitem__(self, name: Union[str, bytes]) -> str:
+        value = self.get_raw(name)
+
+        if value is None:
+            raise KeyError(name)
+
+        return value.decode()
+
+    def add(self, name: Union[str, bytes], value: Union[str, bytes, int]) -> None:
+        """
+        Adds the header, even if there is already one with the same name
+        """
+
+        if not isinstance(name, bytes):
+            name = name.encode()
+        if not isinstance(value, bytes):
+            value = str(value).encode()
+
+        if self._index is not None:
+            self._index[self._name_key(name)] = len(self.raw_names)
+
+        self.raw_names.append(name)
+        self.raw_values.append(value)
+        self._rendered = None
+
+    def __setitem__(self, name: Union[str, bytes], value: Union[str, bytes, int]) -> None:
+        """
+        Replaces all the values of the header by the given one
+        """
+
+        if name in self:
+            self._remove(self._key(name))
+
+        self.add(name, value)
+
+    def __delitem__(self, name: Union[str, bytes]) -> None:
+        if name not in self:
+            raise KeyError(name)
+
+        self._remove(self._key(name))
+
+    def pop(self, name: Union[str, bytes], instead: Any = KeyError) -> Union[str, Any]:
+        value = self.get(name)
+
+        if value is None:
+            if instead is KeyError:
+                raise KeyError(name)
+
+            return instead
+
+        self._remove(self._key(name))
+
+        return value
+
+    def setdefault(self, name: Union[str, bytes], default: Union[str, bytes, int]) -> str:
+        if name not in self:
+            self.add(name, default)
+
+        return self[name]
+
+    def update(self, other: Union[Dict, 'Headers'], **kwargs) -> None:
+        for name, value in other.items():
+            self[name] = value
+
+        for name, value in kwargs.items():
+            self[name] = value
+
+    def __contains__(self, name: Union[str, bytes]) -> bool:
+        return self.get_raw(name) is not None
+
+    def raw_items(self) -> List[Tuple[bytes, bytes]]:
+        items = self.base.raw_items() if self.base is not None else []
+        items.extend(zip(self.raw_names, self.raw_values))
+
+        return items
+
+    def items(self) -> List[Tuple[str, str]]:
+        return [(self._name_key(name), value.decode()) for name, value in self.raw_items()]
+
+    def keys(self) -> List[str]:
+        return [key for key, _ in self.items()]
+
+    def values(self) -> List[str]:
+        return [value for _, value in self.items()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self) -> int:
+        return len(self.raw_names) + (len(self.base) if self.base is not None else 0)
+
+    def render(self, skip: Optional[str] = None) -> bytes:
+        """
+        Returns headers as they are sent, every one followed by CRLF. Header
+        named `skip` (lowercase) is not rendered. Result is cached until
+        headers are changed, so rendering of the base headers costs nothing
+        """
+
+        if self._rendered is not None and skip in self._rendered:
+            return self._rendered[skip]
+
+        rendered = self.base.render(skip) if self.base is not None else b''
+        rendered += b''.join(
+            b'%s: %s\r\n' % (name, value)
+            for name, value in zip(self.raw_names, self.raw_values)
+            if skip is None or self._name_key(name) != skip
+        )
+
+        if self._rendered is None:
+            self._rendered = {}
+
+        self._rendered[skip] = rendered
+
+        return rendered
+
+    def clear(self) -> None:
+        self.reset(None)
+
+    def reset(self, base: Optional['Headers']) -> None:
+        """
+        Removes all the headers, and puts the overlay on top of another base
+        """
+
+        self.raw_names.clear()
+        self.raw_values.clear()
+        self.base = base
+        self._index = None
+        self._rendered = None
+
+    def copy(self) -> 'Headers':
+        headers = Headers(base=self.base)
+        headers.raw_names.extend(self.raw_names)
+        headers.raw_values.extend(self.raw_values)
+
+        return headers
+
+    def __repr__(self):
+        return f'Headers({self.items()!r})'
+
+    def _remove(self, key: str) -> None:
+        if self.base is not None and self.base.get_raw(key) is not None:
+            self._detach_base()
+
+        pairs = [
+            (name, value) for name, value in zip(self.raw_names, self.raw_values)
+            if self._name_key(name) != key
+        ]
+        self.raw_names[:] = [name for name, _ in pairs]
+        self.raw_values[:] = [value for _, value in pairs]
+        self._index = None
+        self._rendered = None
+
+    def _detach_base(self) -> None:
+        """
+        Copies the base headers into ourselves, so they can be changed
+        """
+
+        base_items = self.base.raw_items()
+        self.raw_names[:0] = [name for name, _ in base_items]
+        self.raw_values[:0] = [value for _, value in base_items]
+        self.base = None
+        self._index = None
+
+    @staticmethod
+    def _key(name: Union[str, bytes]) -> str:
+        if isinstance(name, bytes):
+            name = name.decode('latin-1')
+
+        return name.lower()
+
+    @staticmethod
+    def _name_key(name: bytes) -> str:
+        return HEADER_KEYS.get(name) or name.decode('latin-1').lower()
+
+    def _get_index(self) -> Dict[str, int]:
+        if self._index is None:
+            header_keys = HEADER_KEYS
+            self._index = {
+                header_keys.get(name) or name.decode('latin-1').lower(): position
+                for position, name in enumerate(self.raw_names)
+            }
+
+        return self._index
+
+
+class BodyStream:
+    """
+    Body of the request that is given to the handler before it's received.
+    Parser feeds the chunks as they come, and handler takes them by
+    `async for chunk in request.stream()`. While handler doesn't keep up,
+    chunks are buffered, and server stops reading from the connection when
+    there are too many of them
+
+    If handler returns before the body is received, the rest of it is
+    discarded. If client disconnects, or body exceeds the limit, reading
+    handler gets the exception
+    """
+
+    def __init__(self):
+        self.chunks: Deque[bytes] = deque()
+        # total size of chunks that are not taken yet
+        self.buffered: int = 0
+        self.complete: bool = False
+        self.closed: bool = False
+        self.error: Optional[BaseException] = None
+        # called every time a chunk is taken, so server may resume reading
+        self.on_consumed: Optional[Callable[[], None]] = None
+        self._waiter: Optional[asyncio.Future] = None
+
+    def feed(self, chunk: bytes) -> None:
+        if self.closed:
+            return
+
+        self.chunks.append(chunk)
+        self.buffered += len(chunk)
+        self._wakeup()
+
+    def finish(self) -> None:
+        self.complete = True
+        self._wakeup()
+
+    def abort(self, error: BaseException) -> None:
+        if not self.complete:
+            self.error = error
+            self._wakeup()
+
+    def close(self) -> None:
+        """
+        Handler isn't going to read anymore, so everything is discarded
+        """
+
+        self.closed = True
+        self.chunks.clear()
+        self.buffered = 0
+
+        if self.on_consumed is not None:
+            self.on_consumed()
+
+    def __aiter__(self) -> 'BodyStream':
+        return self
+
+    async def __anext__(self) -> bytes:
+        while not self.chunks:
+            if self.error is not None:
+                raise self.error
+            if self.complete or self.closed:
+                raise StopAsyncIteration
+
+            self._waiter = asyncio.get_running_loop().create_future()
+            await self._waiter
+
+        chunk = self.chunks.popleft()
+        self.buffered -= len(chunk)
+
+        if self.on_consumed is not None:
+            self.on_consumed()
+
+        return chunk
+
+    def _wakeup(self) -> None:
+        waiter, self._waiter = self._waiter, None
+
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+
 class Request:
+    """
+    Requests are reused by the parser protocol for the next messages, so
+    wipe() resets them in place, without allocating anything
+    """
+
+    __slots__ = ('storage', 'method', 'path', 'path_params', 'fragment', 'raw_parameters',
+                 'parsed_parameters', 'parsed_form', 'parsed_multipart', 'parsed_json',
+                 'protocol', 'headers', 'body', 'body_file', '_body_map', 'body_stream',
+                 'ctx', 'socket')
+
     def __init__(self, storage: Storage):
         self.storage = storage
 
@@ -75,13 +409,25 @@ class Request:
         # typehints
         self.method: Optional[bytes] = None
         self.path: Optional[bytes] = None
+        # parameters of the route path (like `id` of `/users/{id:int}`),
+        # set by the dispatcher
+        self.path_params: Mapping[str, Any] = NO_PATH_PARAMS
         self.fragment: Optional[bytes] = None
         self.raw_parameters: Optional[bytes] = None
         self.parsed_parameters: Optional[Dict[str, List[str]]] = None
         self.parsed_form: Optional[Dict[str, List[str]]] = None
+        self.parsed_multipart: Optional[MultipartForm] = None
+        self.parsed_json: Any = JSON_NOT_PARSED
         self.protocol: Optional[str] = None
-        self.headers = None
+        # filled by the parser, that's why request keeps it between messages
+        self.headers: Headers = Headers()
         self.body: bytes = b''
+        # big bodies are written into a temporary file instead, and
+        # body is empty then
+        self.body_file: Optional[BinaryIO] = None
+        self._body_map: Optional[mmap.mmap] = None
+        # set instead of body, if handler is called before body is received
+        self.body_stream: Optional[BodyStream] = None
 
         # Purpose of context in request is only for exchanging some data between
         # middlewares and handlers without a lot of shitcode like django does
@@ -89,8 +435,6 @@ class Request:
         self.ctx: dict = {}
 
         self.socket: Optional[Connection] = None
-        self._on_chunk: Optional[Callable] = None
-        self._on_complete: Optional[Callable] = None
 
     def wipe(self):
         """
@@ -102,63 +446,95 @@ class Request:
         """
 
         self.path = None
+        self.path_params = NO_PATH_PARAMS
         self.fragment = None
         self.raw_parameters = None
-        self.parsed_parameters: Optional[Dict[str, List[str]]] = None
+        self.parsed_parameters = None
+        self.parsed_form = None
+        # lazy documents keep the parser busy while they're referenced
+        self.parsed_json = JSON_NOT_PARSED
         self.headers.clear()
+
+        if self.parsed_multipart is not None:
+            # removes uploaded files
+            self.parsed_multipart.close()
+            self.parsed_multipart = None
+
         self.body = b''
         self.ctx.clear()
 
-        self._on_chunk = None
-        self._on_complete = None
+        if self.body_file is not None:
+            self._close_body_file()
+
+        self.body_stream = None
 
-    def on_chunk(self, handler: Union[Callable[[bytes], Callable],
-                                      Callable[[bytes], Awaitable]]) -> None:
+    def stream(self) -> AsyncIterator[bytes]:
         """
-        on_chunk can receive as usual callable, as coroutines. But
-        in case of getting usual callable, we make a coroutine
-        from it, that is actually not async, but able to be ran
-        in event loop
+        Returns async iterator over the body chunks. If the route streams
+        bodies (see dp.route(stream_body=True)), chunks are given as they're
+        received, before the whole body is. Otherwise body is already
+        received, and is given as it is, or by chunks if it's in a file
         """
 
-        self._on_chunk = make_sure_async(handler)
+        if self.body_stream is not None:
+            return self.body_stream
+
+        return self._received_body()
+
+    async def _received_body(self) -> AsyncIterator[bytes]:
+        if self.body_file is None:
+            if self.body:
+                yield self.body
+
+            return
+
+        self.body_file.seek(0)
+
+        while True:
+            chunk = self.body_file.read(BODY_FILE_CHUNK_SIZE)
+
+            if not chunk:
+                return
+
+            yield chunk
 
-    def on_complete(self, handler: Union[Callable[[bytes], Callable],
-                                         Callable[[bytes], Awaitable]]) -> None:
+    def body_view(self) -> Union[memoryview, mmap.mmap]:
         """
-        Same as on_chunk
+        Returns the body without copying it, wherever it's kept. Body written
+        into a file is mapped into memory, and read by the system only when
+        accessed. Map is valid only while the request is processed
         """
 
-        self._on_complete = make_sure_async(handler)
+        if self.body_file is None:
+            return memoryview(self.body)
 
-    def get_on_chunk(self) -> Callable[[bytes], Awaitable]:
-        return self._on_chunk
+        if self._body_map is None:
+            if not self.body_file.seek(0, 2):
+                # empty file can't be mapped
+                return memoryview(b'')
 
-    def get_on_complete(self) -> Callable[[], Awaitable]:
-        return self._on_complete
+            self._body_map = mmap.mmap(self.body_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        return self._body_map
 
     def params(self) -> Dict[str, List[str]]:
         """
-        Returns a dict with URI parameters, where keys are bytes
-        and values are lists with bytes. This may be not convenient
-        for user, but this behaviour matches RFC
+        Returns a dict with URI parameters, where keys are names and values
+        are lists of values of the parameter (see httputils.parse_params())
 
         Also, it isn't parsing anything until user will need it.
         If user never called Request.params(), they also never will
         be parsed
 
-        If no parameters provided, empty dictionary will be returned
-        If parameters are invalid, empty dictionary will be returned (this behaviour
-        may be changed in future)
+        If no parameters provided, empty dictionary will be returned. Query
+        strings are parsed once, but every request gets its own dict
         """
 
-        if self.raw_parameters is None:
-            self.parsed_parameters = {}
-        elif not self.parsed_parameters:
-            try:
-                self.parsed_parameters = parse_params(self.raw_parameters)
-            except ValueError:
+        if self.parsed_parameters is None:
+            if self.raw_parameters is None:
                 self.parsed_parameters = {}
+            else:
+                self.parsed_parameters = parse_query(self.raw_parameters)
 
         return self.parsed_parameters
 
@@ -166,18 +542,108 @@ class Request:
         """
         Returns the same dict as request.params(), but parses request body instead
 
-        If request body is not valid parameters string, exceptions.InvalidFormBodyError
-        will be raised
+        Parsing is lenient, as for query strings: invalid UTF-8 is replaced,
+        and pairs without `=` get empty values, so nothing is raised
         """
 
         if self.parsed_form is None:
-            try:
-                self.parsed_form = parse_params(self.body)
-            except ValueError:
-                raise exceptions.InvalidFormBodyError(body=self.body)
+            body = self.body
+
+            if self.body_file is not None:
+                self.body_file.seek(0)
+                body = self.body_file.read()
+
+            self.parsed_form = parse_params(body)
 
         return self.parsed_form
 
+    def json(self) -> Any:
+        """
+        Parses the body as JSON, once for the request. If pysimdjson is
+        installed, objects and arrays are returned as read-only lazy
+        documents, that convert fields only when they're accessed (see
+        jsonutils.loads()). They're valid only while the request is processed,
+        so copy what is needed later by as_dict()/as_list()
+
+        Raises exceptions.HTTPBadRequest if body is not valid JSON
+        """
+
+        if self.parsed_json is JSON_NOT_PARSED:
+            body = self.body if self.body_file is None else self.body_view()
+
+            try:
+                self.parsed_json = jsonutils.loads(body)
+            except ValueError as exc:
+                raise exceptions.HTTPBadRequest(self, msg=f'invalid json: {exc}')
+
+        return self.parsed_json
+
+    async def multipart(self,
+                        max_part_size: Optional[int] = None,
+                        max_field_size: Optional[int] = MAX_FIELD_SIZE,
+                        max_total_size: Optional[int] = None) -> MultipartForm:
+        """
+        Parses multipart/form-data body. Body is parsed while it's read from
+        request.stream(), so if the route streams bodies, files are written to
+        the disk as they're received, and the body is never kept in memory.
+        Parts with filename are files, they're available until the request
+        is processed
+
+        Raises exceptions.HTTPBadRequest if body is not a valid multipart
+        body, and exceptions.HTTPRequestEntityTooLarge if some of the parts
+        (max_part_size), fields that are kept in memory (max_field_size),
+        or the whole body (max_total_size) exceed the limits
+        """
+
+        if self.parsed_multipart is not None:
+            return self.parsed_multipart
+
+        content_type, params = parse_header_params(self.headers.get_raw('content-type', b''))
+
+        if not content_type.startswith('multipart/') or 'boundary' not in params:
+            raise exceptions.HTTPBadRequest(self, msg='body is not multipart')
+
+        try:
+            parser = MultipartParser(
+                boundary=params['boundary'].encode(),
+                max_part_size=max_part_size,
+                max_field_size=max_field_size,
+                max_total_size=max_total_size
+            )
+        except exceptions.MultipartError as exc:
+            raise exceptions.HTTPBadRequest(self, msg=str(exc))
+
+        try:
+            async for chunk in self.stream():
+                parser.feed(chunk)
+
+            self.parsed_multipart = parser.close()
+        except exceptions.MultipartTooLarge as exc:
+            parser.abort()
+            raise exceptions.HTTPRequestEntityTooLarge(self, msg=str(exc))
+        except exceptions.MultipartError as exc:
+            parser.abort()
+            raise exceptions.HTTPBadRequest(self, msg=str(exc))
+        except BaseException:   # noqa: only cleaning up here
+            parser.abort()
+            raise
+
+        return self.parsed_multipart
+
+    def _close_body_file(self) -> None:
+        if self._body_map is not None:
+            try:
+                self._body_map.close()
+            except BufferError:
+                # handler still holds a view of it, so it's
+                # closed when the view is garbage collected
+                pass
+
+            self._body_map = None
+
+        self.body_file.close()
+        self.body_file = None
+
     def __str__(self):
         return render_http_request(
             method=self.method,
@@ -194,18 +660,38 @@ class Response:
     The actual response will happen after it will be returned
     """
 
-    def __init__(self, default_headers: CaseInsensitiveDict):
+    __slots__ = ('default_headers', 'code', 'status', 'headers', 'body', 'drain_callback')
+
+    def __init__(self, default_headers: Union[Headers, Dict]):
+        if not isinstance(default_headers, Headers):
+            default_headers = Headers(default_headers)
+
         self.default_headers = default_headers
 
         self.code: int = 200
         self.status: Optional[str] = None
-        self.headers: CaseInsensitiveDict = default_headers.copy()
+        # default headers aren't copied, but read through
+        self.headers = Headers(base=default_headers)
         self.body: Optional[bytes] = None
 
+        # set by the server, as only it knows the connection response belongs to
+        self.drain_callback: Optional[Callable[[], Awaitable]] = None
+
+    async def drain(self) -> None:
+        """
+        Flushes responses of the previous requests (if client pipelines them)
+        and waits until client reads enough of them, so write buffer
+        goes lower than low-water mark. Useful when handler is going to
+        produce a lot of data
+        """
+
+        if self.drain_callback is not None:
+            await self.drain_callback()
+
     def wipe(self):
         self.code = 200
         self.status = None
-        self.headers = self.default_headers.copy()
+        self.headers.reset(self.default_headers)
         self.body = None
 
     def __call__(self,
@@ -222,3 +708,24 @@ class Response:
             self.headers.update(headers)
 
         return self
+
+    def json(self,
+             obj: Any,
+             code: int = 200,
+             status: Optional[str] = None,
+             headers: Optional[dict] = None):
+        """
+        Same as calling the response, but body is the object serialized
+        into JSON (see jsonutils.dumps()), and content-type is set. Length
+        is counted when the response is rendered, as usual
+        """
+
+        self.code = code
+        self.status = status
+        self.body = jsonutils.dumps(obj)
+        self.headers[b'content-type'] = jsonutils.JSON_CONTENT_TYPE
+
+        if headers:
+            self.headers.update(headers)
+
+        return self
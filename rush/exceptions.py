@@ -17,6 +17,26 @@ class NoMethodsProvided(WebServerError):
     pass
 
 
+class InvalidRoutePath(WebServerError):
+    pass
+
+
+class RequestBodyTooLarge(WebServerError):
+    pass
+
+
+class ExpectationRejected(WebServerError):
+    pass
+
+
+class MultipartError(WebServerError):
+    pass
+
+
+class MultipartTooLarge(MultipartError):
+    pass
+
+
 class InvalidFormBodyError(WebServerError):
     def __init__(self, body: Optional[Union[bytes, str]] = None):
         self.body = body
@@ -1,5 +1,5 @@
 import abc
-from typing import Awaitable
+from typing import Awaitable, Optional, Union
 
 from ..entities import Request, Response
 
@@ -13,3 +13,32 @@ class BaseMiddleware(abc.ABC):
         A place where handler must be called. Note: handler is not always _endpoint_ handler,
         but in case of multiple middlewares it is mostly another middlewares
         """
+
+
+class SyncMiddleware:
+    """
+    Middleware that only does something before and/or after the handler,
+    without awaiting anything. It's called directly, so it costs no
+    coroutine per request, unlike BaseMiddleware
+
+    Sync middlewares of the handler are always run outside the usual ones:
+    before() of all of them is called before any BaseMiddleware, and after()
+    after all of them. Only overridden methods are called
+    """
+
+    def before(self, request: Request, response: Response) -> Optional[Response]:
+        """
+        Called before the handler. If returns response, it's sent instead
+        of calling the handler (and the rest of before() methods)
+        """
+
+    def after(self, request: Request, response: Response) -> Response:
+        """
+        Called with the response of the handler, or of before(). Returns
+        the response to be sent
+        """
+
+        return response
+
+
+Middleware = Union[BaseMiddleware, SyncMiddleware]
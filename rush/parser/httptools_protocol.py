@@ -1,80 +1,486 @@
-import asyncio
-from typing import Optional
+import re
+from tempfile import TemporaryFile
+from collections import deque
+from functools import lru_cache
+from typing import Optional, Deque, List, Callable, BinaryIO, Tuple, Union
 
 from httptools import HttpRequestParser
 
-from ..entities import Request
-from ..utils.httputils import decode_url
-from ..typehints import AsyncFunction, Nothing
-from ..entities import CaseInsensitiveDict
+from .. import exceptions
+from ..entities import Request, BodyStream
+from ..storage.base import Storage
+from ..utils.httputils import (decode_url, render_http_response, INTERNED_HEADER_NAMES,
+                               INTERNED_METHODS, INTERNED_VERSIONS)
+
+# stages of the message that is currently parsed. Used by
+# the server to choose which timeout must be applied now
+STAGE_IDLE = 0      # between messages
+STAGE_HEADERS = 1   # receiving request line and headers
+STAGE_BODY = 2      # receiving body
+
+# sent instead of processing the request, if its body exceeds the limit. Rest
+# of the body is not going to be received, so the connection is closed after
+PRE_RENDERED_PAYLOAD_TOO_LARGE = render_http_response(
+    protocol=b'1.1',
+    code=413,
+    status_code=b'Payload Too Large',
+    headers={'content-type': 'text/html', 'connection': 'close'},
+    body=b'<h1>413 Payload Too Large</h1>',
+    count_content_length=True
+)
+# sent when client expects it (by `Expect: 100-continue`) before sending
+# the body, and request is approved
+PRE_RENDERED_CONTINUE = b'HTTP/1.1 100 Continue\r\n\r\n'
+
+# fast path is tried only for received chunks up to this size, as they're
+# copied if they're given as memoryview, and big ones are rarely simple GETs
+FAST_PATH_MAX_CHUNK = 16 * 1024
+FAST_PATH_METHODS = {b'GET': b'GET', b'HEAD': b'HEAD'}
+FAST_PATH_PREFIXES = (b'GET ', b'HEAD ')
+# first bytes of the prefixes. Checking a single byte is cheaper than
+# slicing a memoryview, so chunks of other methods aren't even copied
+FAST_PATH_FIRST_BYTES = frozenset(prefix[0] for prefix in FAST_PATH_PREFIXES)
+# scanning headers by regex is slower than httptools, when there are a lot
+# of them, so requests with bigger heads (like browsers send) are left for it
+FAST_PATH_MAX_HEAD = 512
+# parsed request lines are cached, if they aren't longer than this
+REQUEST_LINES_CACHE_SIZE = 1024
+REQUEST_LINE_CACHE_MAX_LENGTH = 256
+# the same characters httptools accepts. Everything else (including non-ASCII
+# URLs and control characters in headers) is left for it to reject
+URL_CHARS = bytes(range(0x21, 0x7f))
+# a header line, with leading whitespace of the value stripped, as httptools
+# does. Headers that make request not simple (body, upgrade, closing the
+# connection) don't match. Anything that doesn't match is taken by the last
+# group, so a single findall() both splits and validates the headers
+SIMPLE_HEADER = re.compile(
+    # first letters are checked case-sensitively, so lookaheads are cheap
+    rb"(?![cteuCTEU](?i:ontent-length|ransfer-encoding|xpect|pgrade):)"
+    rb"(?![cC](?i:onnection):(?![ \t]*(?i:keep-alive)\r\n))"
+    rb"([!#$%&'*+\-.^_`|~0-9A-Za-z]+):[ \t]*([\t\x20-\x7e\x80-\xff]*)\r\n|(.)",
+    re.DOTALL
+)
+
+ParsedRequestLine = Tuple[bytes, bytes, Optional[bytes], Optional[bytes]]
+
+
+def split_url(url: bytes) -> Tuple[bytes, Optional[bytes], Optional[bytes]]:
+    """
+    Returns decoded path, raw parameters and fragment of the url
+    """
+
+    parameters = fragment = None
+
+    if b'?' in url:
+        url, parameters = url.split(b'?', 1)
+
+        if b'#' in parameters:
+            parameters, fragment = parameters.split(b'#', 1)
+    elif b'#' in url:
+        url, fragment = url.split(b'#', 1)
+
+    # only the path is decoded here, as escaped & or = in parameters
+    # must not be taken as separators
+    if b'%' in url:
+        url = decode_url(url)
+
+    return url, parameters, fragment
+
+
+def parse_request_line(line: bytes) -> Optional[ParsedRequestLine]:
+    """
+    Returns method, decoded path, raw parameters and fragment of the request
+    line, if it's a HTTP/1.1 GET or HEAD line, that is surely valid. Otherwise
+    returns None, and it's left for httptools
+    """
+
+    if not line.endswith(b' HTTP/1.1'):
+        return None
+
+    method, _, url = line[:-9].partition(b' ')
+    method = FAST_PATH_METHODS.get(method)
+
+    if method is None or not url.startswith(b'/') or url.translate(None, URL_CHARS):
+        return None
+
+    return (method,) + split_url(url)
+
+
+_parse_request_line_cached = lru_cache(maxsize=REQUEST_LINES_CACHE_SIZE)(parse_request_line)
 
 
 class Protocol:
-    REQUEST_HEADERS = CaseInsensitiveDict()
+    """
+    Every message gets its own request object, so when client pipelines
+    requests, all of them are parsed and kept in `completed` queue in the
+    order they were received, until server takes them out from there
 
-    def __init__(self, request_obj: Request):
-        self.request_obj = request_obj
+    Processed requests must be returned by recycle(), so they will be
+    reused by next messages instead of allocating new ones
 
-        self.headers = self.REQUEST_HEADERS.copy()
-        self.body: bytes = b''
-        self.file: bool = False
+    Body is collected as a list of chunks, and joined only once, when it's
+    complete (if it came in a single chunk, it isn't copied at all). Bodies
+    bigger than spill_threshold are written into a temporary file instead.
+    Body may take max_body_size bytes at most, but `body_limit` may return
+    a limit for a particular request (for example, of the route it's sent
+    to), when its headers are received. If body exceeds the limit, parsing
+    is aborted and `error_response` is set to the response server should send
+    before closing the connection
 
-        self.received: bool = False
+    If `body_streamed` returns True for the request, it's put into `completed`
+    right after its headers, and the body is fed into its body stream as it's
+    received instead. Server may provide `on_stream_consumed` callback to be
+    notified when handler takes chunks from the stream
 
-        self._on_chunk: Optional[AsyncFunction] = None
-        self._on_complete: Optional[AsyncFunction[Nothing]] = None
+    If client sends `Expect: 100-continue`, it waits for the permission
+    before sending the body. `continue_check` is called with the request
+    when its headers are received (and body size is checked), and returns
+    None to approve it, or a rendered response to reject it with, so the
+    body is never sent. Approved requests are passed to `on_continue`, that
+    server provides to send the interim response
+
+    With `fast_path`, small body-less GET and HEAD requests, that come whole
+    in a single chunk, are parsed right in feed() by bytes.find() and a single
+    regex scan of the headers, without going through httptools callbacks
+    (parsed request lines are also cached, as they often repeat exactly).
+    Anything unusual is left for httptools
+    """
+
+    # pipelined burst may need a lot of requests at once, but
+    # there is no reason to keep all of them after
+    MAX_SPARE_REQUESTS = 4
+
+    # protocol lives as long as the connection (or longer, as servers reuse
+    # them), and is touched by every parser callback
+    __slots__ = ('storage', 'max_body_size', 'spill_threshold', 'body_limit', 'body_streamed',
+                 'on_stream_consumed', 'request_obj', 'completed', 'completed_body_size',
+                 'spare_requests', 'stage', 'keep_alive', 'errored', 'error_response', 'url',
+                 'header_names', 'header_values', 'content_length', 'chunked', 'body_chunks',
+                 'body_size', 'body_file', 'request_body_limit', 'stream', 'recycle_received',
+                 'continue_check', 'on_continue', 'expect_continue', 'fast_path', 'parser')
+
+    def __init__(self,
+                 storage: Storage,
+                 max_body_size: Optional[int] = None,
+                 spill_threshold: Optional[int] = None,
+                 body_limit: Optional[Callable[[Request], Optional[int]]] = None,
+                 body_streamed: Optional[Callable[[Request], bool]] = None,
+                 continue_check: Optional[Callable[[Request], Optional[bytes]]] = None,
+                 fast_path: bool = False):
+        self.storage = storage
+        self.max_body_size = max_body_size
+        self.spill_threshold = spill_threshold
+        self.body_limit = body_limit
+        self.body_streamed = body_streamed
+        self.continue_check = continue_check
+        self.fast_path = fast_path
+        self.on_stream_consumed: Optional[Callable[[], None]] = None
+        self.on_continue: Optional[Callable[[], None]] = None
+        self.request_obj: Optional[Request] = None
+        self.completed: Deque[Request] = deque()
+        # total length of bodies of requests in `completed`
+        self.completed_body_size: int = 0
+        self.spare_requests: List[Request] = []
+
+        self.stage: int = STAGE_IDLE
+        # parser can be reused for another connection only if the previous
+        # one ended between messages, and the last message was keep-alive
+        # (otherwise parser rejects anything after it)
+        self.keep_alive: bool = True
+        self.errored: bool = False
+        self.error_response: Optional[bytes] = None
+        self.url: bytes = b''
+        self.header_names: List[bytes] = []
+        self.header_values: List[bytes] = []
+        self.content_length: Optional[int] = None
+        self.chunked: bool = False
+        # body of the current message, and the limit of its size
+        self.body_chunks: List[bytes] = []
+        self.body_size: int = 0
+        self.body_file: Optional[BinaryIO] = None
+        self.request_body_limit: Optional[int] = None
+        # stream of the current message, if its body is streamed
+        self.stream: Optional[BodyStream] = None
+        # handler has returned before the streamed body was received, so the
+        # request is recycled as soon as it is
+        self.recycle_received: bool = False
+        # client waits for 100 Continue before sending the body
+        self.expect_continue: bool = False
 
         self.parser: Optional[HttpRequestParser] = None
 
-    def on_message_begin(self):
-        self.body = b''
-        self.file = False
-        self.headers = self.REQUEST_HEADERS.copy()
-        self.received = False
+    def feed(self, data: Union[bytes, memoryview]) -> None:
+        """
+        Feeds the received data to the parser. Raises httptools.HttpParserError
+        if request is invalid
+        """
 
-    def on_url(self, url: bytes):
-        if b'%' in url:
-            url = decode_url(url)
+        # after a message that isn't keep-alive, httptools must reject the rest
+        if self.fast_path and self.stage == STAGE_IDLE and self.keep_alive and \
+                0 < len(data) <= FAST_PATH_MAX_CHUNK and data[0] in FAST_PATH_FIRST_BYTES:
+            data = self._feed_fast(bytes(data))
+
+            if not data:
+                return
+
+        self.parser.feed_data(data)
+
+    def pop_completed(self) -> Request:
+        request = self.completed.popleft()
+        self.completed_body_size -= len(request.body)
 
-        parameters = fragment = None
+        return request
 
-        if b'?' in url:
-            url, parameters = url.split(b'?', 1)
+    def recycle(self, request: Request) -> None:
+        if request is self.request_obj and self.stage == STAGE_BODY:
+            # body is still streamed, so the rest of it is discarded
+            request.body_stream.close()
+            self.recycle_received = True
+            return
 
-            if b'#' in parameters:
-                parameters, fragment = parameters.split(b'#', 1)
-        elif b'#' in url:
-            url, fragment = url.split(b'#', 1)
+        # even if request is thrown away, its body file must be closed
+        request.wipe()
 
-        self.request_obj.path = url
-        self.request_obj.raw_parameters = parameters
-        self.request_obj.fragment = fragment
-        self.request_obj.method = self.parser.get_method()
+        if len(self.spare_requests) < self.MAX_SPARE_REQUESTS:
+            self.spare_requests.append(request)
+
+    def drop_completed(self) -> None:
+        while self.completed:
+            self.recycle(self.completed.popleft())
+
+        self.completed_body_size = 0
+
+    def parser_reusable(self) -> bool:
+        return self.stage == STAGE_IDLE and self.keep_alive and not self.errored
+
+    def wipe(self) -> None:
+        """
+        Prepares protocol to serve another connection. Spare requests are
+        kept, as this is what protocol is wiped instead of re-creating for
+        """
+
+        self.drop_completed()
+        self.abort_stream(ConnectionResetError('client has disconnected'))
+        # request that wasn't received completely is just dropped
+        self.request_obj = None
+        self.stage = STAGE_IDLE
+        self.keep_alive = True
+        self.errored = False
+        self.error_response = None
+        self.url = b''
+        self._reset_body()
+
+    def abort_stream(self, error: BaseException) -> None:
+        """
+        Wakes up the handler that reads the stream, if body wasn't received
+        completely, with the given exception
+        """
+
+        if self.stream is not None:
+            self.stream.abort(error)
+            self.stream = None
+
+    def on_message_begin(self):
+        if self.spare_requests:
+            self.request_obj = self.spare_requests.pop()
+        else:
+            self.request_obj = Request(self.storage)
+
+        self.stage = STAGE_HEADERS
+        self.url = b''
+        self._reset_body()
+        # headers are written right into the request, without any decoding
+        self.header_names = self.request_obj.headers.raw_names
+        self.header_values = self.request_obj.headers.raw_values
+
+    def on_url(self, url: bytes):
+        # url may come in pieces if it was split between two reads
+        self.url += url
+
+    def parse_url(self):
+        self.request_obj.path, self.request_obj.raw_parameters, self.request_obj.fragment = \
+            split_url(self.url)
+        method = self.parser.get_method()
+        self.request_obj.method = INTERNED_METHODS.get(method, method)
 
     def on_header(self, header: bytes, value: bytes):
-        self.headers[header.decode()] = value.decode()
+        self.header_names.append(INTERNED_HEADER_NAMES.get(header, header))
+        self.header_values.append(value)
+
+        # the only headers we are interested in ourselves. Checking them right
+        # here, so lookups (and so building an index) aren't needed
+        if len(header) == 17 and header.lower() == b'transfer-encoding':
+            if value == b'chunked':
+                self.chunked = True
+        elif len(header) == 14 and header.lower() == b'content-length':
+            # parser has already validated it
+            self.content_length = int(value)
+        elif len(header) == 6 and header.lower() == b'expect':
+            self.expect_continue = value.lower() == b'100-continue'
 
     def on_headers_complete(self):
-        self.request_obj.protocol = self.parser.get_http_version()
-        self.request_obj.headers = self.headers
+        self.stage = STAGE_BODY
+        self.keep_alive = self.parser.should_keep_alive()
+        self.parse_url()
+        version = self.parser.get_http_version()
+        self.request_obj.protocol = INTERNED_VERSIONS.get(version, version)
+
+        if self.content_length or self.chunked:
+            limit = self.max_body_size
+
+            if self.body_limit is not None:
+                route_limit = self.body_limit(self.request_obj)
+
+                if route_limit is not None:
+                    limit = route_limit
+
+            # rejecting at once, without receiving the body
+            if limit is not None and (self.content_length or 0) > limit:
+                self._reject_body()
 
-        if self.headers.get('transfer-encoding') == 'chunked' or \
-                self.headers.get('content-type', '').startswith('multipart/'):
-            self.file = True
-            self._on_chunk, self._on_complete = \
-                self.request_obj.get_on_chunk(), self.request_obj.get_on_complete()
+            self.request_body_limit = limit
+
+            # HTTP/1.0 clients don't know about interim responses
+            if self.expect_continue and self.request_obj.protocol != '1.0':
+                self._approve_body()
+
+            if self.body_streamed is not None and self.body_streamed(self.request_obj):
+                self.stream = self.request_obj.body_stream = BodyStream()
+                self.stream.on_consumed = self.on_stream_consumed
+                # handler may start right now
+                self.completed.append(self.request_obj)
 
     def on_body(self, body: bytes):
-        if self._on_chunk:
-            asyncio.create_task(self._on_chunk(body))
+        self.body_size += len(body)
+
+        if self.request_body_limit is not None and self.body_size > self.request_body_limit:
+            # chunked body, which size isn't known in advance
+            self._reject_body()
+
+        if self.stream is not None:
+            self.stream.feed(body)
+        elif self.body_file is not None:
+            self.body_file.write(body)
+        elif self.spill_threshold is not None and self.body_size > self.spill_threshold:
+            self.body_file = TemporaryFile()
+            self.body_file.writelines(self.body_chunks)
+            self.body_file.write(body)
+            self.body_chunks.clear()
         else:
-            self.request_obj.body += body
+            self.body_chunks.append(body)
 
     def on_message_complete(self):
-        self.received = True
+        self.stage = STAGE_IDLE
+        request = self.request_obj
+        chunks = self.body_chunks
+
+        if self.stream is not None:
+            # request is already processed
+            self.stream.finish()
+            self.stream = None
+
+            if self.recycle_received:
+                self.recycle_received = False
+                self.recycle(request)
+
+            return
+
+        if len(chunks) == 1:
+            request.body = chunks[0]
+        elif chunks:
+            request.body = b''.join(chunks)
+
+        chunks.clear()
+
+        if self.body_file is not None:
+            self.body_file.seek(0)
+            # request is responsible for closing it from now on
+            request.body_file, self.body_file = self.body_file, None
+
+        self.completed.append(request)
+        self.completed_body_size += len(request.body)
+
+    def _reset_body(self) -> None:
+        self.content_length = None
+        self.chunked = False
+        self.stream = None
+        self.recycle_received = False
+        self.expect_continue = False
+        self.body_chunks.clear()
+        self.body_size = 0
+        self.request_body_limit = None
+
+        if self.body_file is not None:
+            # request was never completed
+            self.body_file.close()
+            self.body_file = None
+
+    def _feed_fast(self, data: bytes) -> bytes:
+        """
+        Takes simple requests from the beginning of the data, and returns the
+        rest, that is left for httptools. Everything is done by a few scans,
+        as python loop over the headers is slower than httptools callbacks
+        """
+
+        position = 0
+        completed = self.completed
+
+        while data.startswith(FAST_PATH_PREFIXES, position):
+            end = data.find(b'\r\n\r\n', position, position + FAST_PATH_MAX_HEAD)
+
+            if end == -1:
+                break
+
+            line_end = data.find(b'\r\n', position)
+            line = data[position:line_end]
+
+            if len(line) <= REQUEST_LINE_CACHE_MAX_LENGTH:
+                parsed = _parse_request_line_cached(line)
+            else:
+                parsed = parse_request_line(line)
+
+            if parsed is None:
+                break
+
+            if line_end != end:
+                # with the CRLF of the last header
+                headers = SIMPLE_HEADER.findall(data, line_end + 2, end + 2)
+                names, values, invalid = zip(*headers)
+
+                if any(invalid):
+                    break
+            else:
+                names = values = ()
+
+            if self.spare_requests:
+                request = self.spare_requests.pop()
+            else:
+                request = Request(self.storage)
+
+            request.method, request.path, request.raw_parameters, request.fragment = parsed
+            request.protocol = '1.1'
+            request.headers.raw_names.extend(map(INTERNED_HEADER_NAMES.get, names, names))
+            request.headers.raw_values.extend(values)
+            completed.append(request)
+            position = end + 4
+
+        return data[position:] if position else data
+
+    def _approve_body(self) -> None:
+        if self.continue_check is not None:
+            rejection = self.continue_check(self.request_obj)
+
+            if rejection is not None:
+                self.error_response = rejection
+                # client hasn't sent the body, and isn't going to, so
+                # parser must not wait for it
+                raise exceptions.ExpectationRejected(self.request_obj.path)
 
-        if self._on_complete:
-            asyncio.create_task(self._on_complete())
-            self._on_complete = None
+        if self.on_continue is not None:
+            self.on_continue()
 
-        self._on_chunk = None
+    def _reject_body(self) -> None:
+        self.error_response = PRE_RENDERED_PAYLOAD_TOO_LARGE
+        self.abort_stream(exceptions.HTTPRequestEntityTooLarge(self.request_obj))
+        # makes parser fail, so nothing is parsed anymore
+        raise exceptions.RequestBodyTooLarge(self.request_obj.path)
@@ -0,0 +1,329 @@
+from tempfile import TemporaryFile
+from typing import Optional, Dict, List, Tuple, BinaryIO, Union
+
+from .. import exceptions
+
+# parts headers are kept in memory until they're complete, so they're limited
+MAX_HEADERS_SIZE = 16 * 1024
+# parts without filename are kept in memory, so they're limited by default
+MAX_FIELD_SIZE = 1024 * 1024
+
+STATE_PREAMBLE = 0      # before the first boundary
+STATE_HEADERS = 1       # receiving headers of the part
+STATE_BODY = 2          # receiving body of the part
+STATE_DELIMITER = 3     # after the boundary, waiting for CRLF or --
+STATE_EPILOGUE = 4      # after the closing boundary
+
+
+def parse_header_params(value: bytes) -> Tuple[str, Dict[str, str]]:
+    """
+    Splits header value like `form-data; name="file"; filename="a.txt"` into
+    the value itself and a dict of its parameters (names are lowercase)
+    """
+
+    value = value.decode('utf-8', 'replace')
+    main, _, rest = value.partition(';')
+    params: Dict[str, str] = {}
+
+    while rest:
+        name, _, rest = rest.partition('=')
+        rest = rest.lstrip()
+
+        if rest.startswith('"'):
+            # quoted string, may contain ; and escaped quotes
+            end = 1
+
+            while end < len(rest) and rest[end] != '"':
+                end += 2 if rest[end] == '\\' else 1
+
+            param = rest[1:end].replace('\\"', '"').replace('\\\\', '\\')
+            rest = rest[end + 1:].partition(';')[2]
+        else:
+            param, _, rest = rest.partition(';')
+            param = param.strip()
+
+        if name.strip():
+            params[name.strip().lower()] = param
+
+    return main.strip().lower(), params
+
+
+class Part:
+    """
+    A part of multipart body, that isn't a file. Its value is kept in memory
+    """
+
+    def __init__(self, name: str, headers: Dict[str, str]):
+        self.name = name
+        self.headers = headers
+        self.content_type: Optional[str] = headers.get('content-type')
+        self.size: int = 0
+        self.chunks: List[bytes] = []
+        self.value: bytes = b''
+
+    def write(self, data: memoryview) -> None:
+        self.chunks.append(bytes(data))
+
+    def complete(self) -> None:
+        self.value = b''.join(self.chunks)
+        self.chunks = []
+
+    def close(self) -> None:
+        pass
+
+    def text(self, encoding: str = 'utf-8') -> str:
+        return self.value.decode(encoding)
+
+    def __repr__(self):
+        return f'Part(name={self.name!r}, size={self.size})'
+
+
+class FilePart(Part):
+    """
+    A part with filename. It's written into a temporary file as it's received,
+    so it never takes memory. File is positioned at its beginning when the
+    part is complete, and is closed (and so removed) with the request
+    """
+
+    def __init__(self, name: str, filename: str, headers: Dict[str, str]):
+        super(FilePart, self).__init__(name, headers)
+        self.filename = filename
+        self.file: BinaryIO = TemporaryFile()
+
+    def write(self, data: memoryview) -> None:
+        self.file.write(data)
+
+    def complete(self) -> None:
+        self.file.seek(0)
+
+    def close(self) -> None:
+        self.file.close()
+
+    def __repr__(self):
+        return f'FilePart(name={self.name!r}, filename={self.filename!r}, size={self.size})'
+
+
+class MultipartForm:
+    """
+    Parsed multipart/form-data body. Values of the fields are decoded, and
+    files are given as FileParts. All the parts are also available by their
+    names, in order they came
+    """
+
+    def __init__(self, parts: List[Part]):
+        self.parts = parts
+        self.fields: Dict[str, List[str]] = {}
+        self.files: Dict[str, List[FilePart]] = {}
+
+        for part in parts:
+            if isinstance(part, FilePart):
+                self.files.setdefault(part.name, []).append(part)
+            else:
+                self.fields.setdefault(part.name, []).append(part.text())
+
+    def close(self) -> None:
+        for part in self.parts:
+            part.close()
+
+
+class MultipartParser:
+    """
+    Incremental parser of multipart/form-data bodies. Data is fed in chunks
+    of any size, as it's received, and parts are written out as soon as it's
+    known they don't contain the boundary, by memoryview slices of the chunk
+    that was fed, so body is never joined or copied (except for fields, that
+    are kept in memory)
+
+    Only the few last bytes of the chunk, that may be the beginning of a
+    boundary, are kept until the next one comes
+
+    Raises exceptions.MultipartError if body is malformed, and
+    exceptions.MultipartTooLarge if some of the limits is exceeded. In both
+    cases, parser must be aborted to close the files it has created
+    """
+
+    def __init__(self,
+                 boundary: bytes,
+                 max_part_size: Optional[int] = None,
+                 max_field_size: Optional[int] = MAX_FIELD_SIZE,
+                 max_total_size: Optional[int] = None):
+        if not boundary or len(boundary) > 70:
+            raise exceptions.MultipartError('invalid boundary')
+
+        self.delimiter = b'\r\n--' + boundary
+        self.max_part_size = max_part_size
+        self.max_field_size = max_field_size
+        self.max_total_size = max_total_size
+
+        self.state = STATE_PREAMBLE
+        # the first boundary may be in the very beginning of the body, without
+        # CRLF before it, so pretending it's there
+        self.tail: bytes = b'\r\n'
+        self.total_size: int = 0
+        self.parts: List[Part] = []
+        self.part: Optional[Part] = None
+
+    def feed(self, data: Union[bytes, bytearray]) -> None:
+        self.total_size += len(data)
+
+        if self.max_total_size is not None and self.total_size > self.max_total_size:
+            raise exceptions.MultipartTooLarge('body is too large')
+
+        position = 0
+
+        if self.tail:
+            data, position = self._join_tail(data)
+
+        view = memoryview(data)
+
+        while position < len(data):
+            if self.state in (STATE_BODY, STATE_PREAMBLE):
+                position = self._feed_body(data, view, position)
+            elif self.state == STATE_DELIMITER:
+                position = self._feed_delimiter(data, position)
+            elif self.state == STATE_HEADERS:
+                position = self._feed_headers(data, position)
+            else:
+                # epilogue is ignored
+                return
+
+            if position < 0:
+                # the rest is kept in the tail
+                return
+
+    def close(self) -> MultipartForm:
+        """
+        Called when the whole body is fed
+        """
+
+        if self.state != STATE_EPILOGUE:
+            raise exceptions.MultipartError('body is not complete')
+
+        return MultipartForm(self.parts)
+
+    def abort(self) -> None:
+        for part in self.parts:
+            part.close()
+
+        if self.part is not None:
+            self.part.close()
+            self.part = None
+
+    def _join_tail(self, data: bytes) -> Tuple[bytes, int]:
+        """
+        Returns the data to continue with, and the position in it
+        """
+
+        tail, self.tail = self.tail, b''
+
+        if self.state not in (STATE_BODY, STATE_PREAMBLE) or len(data) < len(self.delimiter):
+            # headers, or too short to search in the chunk itself
+            return tail + data, 0
+
+        # tail is the beginning of the delimiter at most, so only the
+        # delimiter starting in it is searched, without joining the whole chunk
+        window = tail + data[:len(self.delimiter) - 1]
+        found = window.find(self.delimiter)
+
+        if found == -1:
+            self._write(memoryview(tail))
+            return data, 0
+
+        self._write(memoryview(tail)[:found])
+        self._end_part()
+
+        return data, found + len(self.delimiter) - len(tail)
+
+    def _feed_body(self, data: bytes, view: memoryview, position: int) -> int:
+        found = data.find(self.delimiter, position)
+
+        if found == -1:
+            # delimiter may begin in the end of the chunk
+            safe = max(len(data) - len(self.delimiter) + 1, position)
+            self._write(view[position:safe])
+            self.tail = data[safe:]
+
+            return -1
+
+        self._write(view[position:found])
+        self._end_part()
+
+        return found + len(self.delimiter)
+
+    def _end_part(self) -> None:
+        if self.part is not None:
+            self.part.complete()
+            self.parts.append(self.part)
+            self.part = None
+
+        self.state = STATE_DELIMITER
+
+    def _feed_delimiter(self, data: bytes, position: int) -> int:
+        if len(data) - position < 2:
+            self.tail = data[position:]
+            return -1
+
+        marker = data[position:position + 2]
+
+        if marker == b'--':
+            self.state = STATE_EPILOGUE
+        elif marker == b'\r\n':
+            self.state = STATE_HEADERS
+        else:
+            raise exceptions.MultipartError('invalid boundary')
+
+        return position + 2
+
+    def _feed_headers(self, data: bytes, position: int) -> int:
+        end = data.find(b'\r\n\r\n', position)
+
+        if end == -1:
+            if len(data) - position > MAX_HEADERS_SIZE:
+                raise exceptions.MultipartTooLarge('part headers are too large')
+
+            self.tail = data[position:]
+            return -1
+
+        headers: Dict[str, str] = {}
+
+        for line in data[position:end].split(b'\r\n'):
+            name, colon, value = line.partition(b':')
+
+            if not colon:
+                raise exceptions.MultipartError('invalid part header')
+
+            header_name = name.strip().decode('latin-1').lower()
+            headers[header_name] = value.strip().decode('utf-8', 'replace')
+
+        disposition, params = parse_header_params(
+            headers.get('content-disposition', '').encode()
+        )
+
+        if disposition != 'form-data' or 'name' not in params:
+            raise exceptions.MultipartError('part has no name')
+
+        if 'filename' in params:
+            self.part = FilePart(params['name'], params['filename'], headers)
+        else:
+            self.part = Part(params['name'], headers)
+
+        self.state = STATE_BODY
+
+        return end + 4
+
+    def _write(self, data: memoryview) -> None:
+        part = self.part
+
+        if part is None or not data:
+            # preamble is ignored
+            return
+
+        part.size += len(data)
+
+        if self.max_part_size is not None and part.size > self.max_part_size:
+            raise exceptions.MultipartTooLarge(f'part {part.name!r} is too large')
+        if self.max_field_size is not None and part.size > self.max_field_size and \
+                not isinstance(part, FilePart):
+            raise exceptions.MultipartTooLarge(f'field {part.name!r} is too large')
+
+        part.write(data)
@@ -1,9 +1,9 @@
 import socket
 import asyncio
 import warnings
-from typing import Optional, Callable, NoReturn
+from typing import Optional, Callable, NoReturn, List, Set, Type, TYPE_CHECKING
 
-from httptools import HttpRequestParser
+from httptools import HttpRequestParser, HttpParserError, HttpParserUpgrade
 
 try:
     from uvloop import install as install_uvloop
@@ -19,8 +19,14 @@ except ImportError as exc:
 from . import base
 from ..storage.base import Storage
 from ..typehints import AsyncFunction
-from ..entities import Request, Response, CaseInsensitiveDict
-from ..parser.httptools_protocol import Protocol as LLHttpProtocol
+from ..utils.aioutils import run_eagerly
+from ..utils.timerwheel import TimerWheel
+from ..entities import Request, Response, Headers
+from ..parser.httptools_protocol import (Protocol as LLHttpProtocol, PRE_RENDERED_CONTINUE,
+                                         STAGE_IDLE, STAGE_HEADERS, STAGE_BODY)
+
+if TYPE_CHECKING:
+    from ..webserver import Settings
 
 
 install_uvloop()
@@ -30,71 +36,542 @@ CLIENT_DISCONNECTED = 'constant for client runners tasks to stop themselves sile
 def server_protocol_factory(
         on_message_complete: AsyncFunction,
         storage: Storage,
-        default_headers: CaseInsensitiveDict
+        default_headers: Headers,
+        protocol_class: Optional[Type['AsyncioServerProtocol']] = None,
+        parser_options: Optional[dict] = None,
+        **protocol_options
 ) -> 'AsyncioServerProtocol':
+    if protocol_class is None:
+        protocol_class = DirectServerProtocol
 
-    request_obj = Request(storage)
     response_obj = Response(default_headers)
-    protocol = LLHttpProtocol(request_obj)
+    protocol = LLHttpProtocol(storage, **(parser_options or {}))
     parser = HttpRequestParser(protocol)
     protocol.parser = parser
 
-    return AsyncioServerProtocol(
+    return protocol_class(
         on_message_complete,
         protocol,
         parser,
-        request_obj,
         response_obj,
-        storage
+        storage,
+        **protocol_options
     )
 
 
 class AsyncioServerProtocol(asyncio.Protocol):
+    """
+    Queue-based protocol: every received chunk is put into the queue, and
+    client runner task (one per connection) feeds it into the parser
+
+    Also implements flow control for all the protocols: transport pauses
+    us when its write buffer grows over write_high_water, and resumes when
+    it is drained below write_low_water. In meantime, anyone may wait for
+    it by awaiting drain(). Reading is paused while the backlog of received,
+    but not processed yet data is too big
+
+    Timeouts are also applied here, by the timer wheel shared between all the
+    connections of the worker. Connections above max_connections (counted
+    by the shared `connections` set) are closed right after they're accepted
+    """
+
     def __init__(self,
                  on_message_complete: AsyncFunction,
                  protocol: LLHttpProtocol,
                  parser: HttpRequestParser,
-                 request_obj: Request,
                  response_obj: Response,
-                 storage: Storage):
+                 storage: Storage,
+                 write_high_water: int = 64 * 1024,
+                 write_low_water: int = 16 * 1024,
+                 max_pending_requests: int = 32,
+                 max_pending_body: int = 1024 * 1024,
+                 timer_wheel: Optional[TimerWheel] = None,
+                 keepalive_timeout: Optional[float] = None,
+                 header_timeout: Optional[float] = None,
+                 body_timeout: Optional[float] = None,
+                 connections: Optional[Set['AsyncioServerProtocol']] = None,
+                 max_connections: Optional[int] = None):
         self.on_message_complete = on_message_complete
         self.transport: Optional[TCPTransport] = None
         self.protocol = protocol
         self.parser = parser
-        self.request_obj = request_obj
+        # requests are processed one by one, even if they were pipelined,
+        # so one response object per connection is enough
         self.response_obj = response_obj
+        self.response_obj.drain_callback = self.drain
         self.storage = storage
+        protocol.on_continue = self._on_continue
 
-        # TODO: add limit for pending requests count
-        # TODO: maybe move this to connection_made()?
-        self.requests_queue = asyncio.Queue()
+        self.write_high_water = write_high_water
+        self.write_low_water = write_low_water
+        self.max_pending_requests = max_pending_requests
+        self.max_pending_body = max_pending_body
+
+        self.writing_paused: bool = False
+        self.reading_paused: bool = False
+        self.drain_waiter: Optional[asyncio.Future] = None
+
+        self.timer_wheel = timer_wheel
+        self.timer_slot: Optional[set] = None
+        self.timeouts = {
+            STAGE_IDLE: keepalive_timeout,
+            STAGE_HEADERS: header_timeout,
+            STAGE_BODY: body_timeout
+        }
+        # stage which timeout is armed now, None if there is no timeout
+        self.armed_stage: Optional[int] = None
+
+        self.connections = connections
+        self.max_connections = max_connections
+
+        # True while some request is processed. Requests completed
+        # in meantime are waiting in protocol.completed
+        self.handling: bool = False
+        self.requests_queue: Optional[asyncio.Queue] = None
+
+        # pool to return the protocol to when connection is lost
+        # and nothing is processed anymore
+        self.pool: Optional['ProtocolPool'] = None
+        self.disconnected: bool = False
+        # set when server is shutting down, so connection is
+        # closed as soon as it has nothing to process
+        self.closing: bool = False
 
     def connection_made(self, transport: TCPTransport) -> None:
-        self.transport = transport
-        asyncio.create_task(client_runner(
-            requests_queue=self.requests_queue,
-            callback=self.on_message_complete,
-            parser=self.parser,
-            protocol=self.protocol,
-            # I really don't know why linter thinks that TCPTransport
-            # doesn't provide `write()` method but I haven't tried this
-            # without uvloop, so don't know whether this will work for
-            # vanilla asyncio transport
-            response_client=transport.write,  # noqa
-            request=self.request_obj,
-            response=self.response_obj
-        ))
+        if not self._setup_connection(transport):
+            return
+
+        self.requests_queue = asyncio.Queue()
+        asyncio.create_task(client_runner(self))
 
     def data_received(self, data: bytes) -> None:
         asyncio.create_task(self.requests_queue.put(data))
+        self.update_reading()
 
     def connection_lost(self, _) -> None:
         # connection_lost callback receives one positional argument - Exception
         # object. But we actually don't need it, as we anyway doesn't care,
         # it's client's problem
-        asyncio.create_task(self.requests_queue.put(CLIENT_DISCONNECTED))
+        self._teardown_connection()
+
+        if self.requests_queue is not None:
+            # client runner will release us when it's done
+            asyncio.create_task(self.requests_queue.put(CLIENT_DISCONNECTED))
+        else:
+            self.release()
+
+    def wipe(self) -> None:
+        """
+        Resets the protocol after connection was lost, so it can serve another
+        one. Parser is re-created only if it can't be reused
+        """
+
+        self.transport = None
+        self.disconnected = False
+        self.closing = False
+        self.writing_paused = False
+        self.reading_paused = False
+        self.drain_waiter = None
+        self.armed_stage = None
+        self.handling = False
+        self.requests_queue = None
+        self.response_obj.wipe()
+
+        if not self.protocol.parser_reusable():
+            self.parser = HttpRequestParser(self.protocol)
+            self.protocol.parser = self.parser
+
+        self.protocol.wipe()
+
+    def flush(self, responses: List[bytes]) -> None:
+        # client may disconnect while the responses were rendered
+        if not self.transport.is_closing():
+            # I really don't know why linter thinks that TCPTransport
+            # doesn't provide `writelines()` method but I haven't tried this
+            # without uvloop, so don't know whether this will work for
+            # vanilla asyncio transport
+            self.transport.writelines(responses)  # noqa
+
+    def release(self) -> None:
+        if self.pool is not None:
+            self.pool.release(self)
+
+    def pause_writing(self) -> None:
+        self.writing_paused = True
+
+    def resume_writing(self) -> None:
+        self.writing_paused = False
+        self._wakeup_drain_waiter()
+
+    async def drain(self) -> None:
+        """
+        Returns when transport's write buffer is drained below low-water
+        mark (or immediately, if it already is). Also returns if client has
+        disconnected, so waiters won't hang forever
+        """
+
+        if not self.writing_paused or self.transport.is_closing():
+            return
+
+        if self.drain_waiter is None:
+            self.drain_waiter = asyncio.get_running_loop().create_future()
+
+        # shielding, so cancellation of one waiter won't affect the others
+        await asyncio.shield(self.drain_waiter)
+
+    def backlog_exceeded(self) -> bool:
+        return self.requests_queue.qsize() >= self.max_pending_requests
+
+    def update_reading(self) -> None:
+        """
+        Pauses or resumes reading from the transport depending on
+        whether our backlog is exceeded
+        """
+
+        if self.backlog_exceeded():
+            if not self.reading_paused and not self.transport.is_closing():
+                self.reading_paused = True
+                self.transport.pause_reading()
+        elif self.reading_paused:
+            self.reading_paused = False
+
+            if not self.transport.is_closing():
+                self.transport.resume_reading()
+
+    def idle(self) -> bool:
+        """
+        Returns True if there's nothing received or processed at the moment
+        """
+
+        return self.protocol.stage == STAGE_IDLE and not self.handling and \
+            not self.protocol.completed and \
+            (self.requests_queue is None or self.requests_queue.empty())
+
+    def reject(self) -> None:
+        """
+        Called when parser has failed. If protocol has prepared a response
+        for the client, it's sent, and the connection is closed only after
+        lingering (see LINGERING_TIMEOUT). Otherwise it's closed at once.
+        Responses to pipelined requests are not awaited, so if there are
+        some, the response isn't sent at all
+        """
+
+        self.protocol.errored = True
+        response = self.protocol.error_response
+
+        if response is None or self.handling or self.protocol.completed or \
+                self.transport.is_closing() or not self.transport.can_write_eof():
+            self.transport.close()
+            return
+
+        self.transport.write(response)
+        self.transport.write_eof()
+        asyncio.get_running_loop().call_later(base.LINGERING_TIMEOUT, self.transport.close)
+
+    def close_when_idle(self) -> None:
+        self.closing = True
+
+        if self.idle():
+            self.transport.close()
+
+    def update_timeout(self) -> None:
+        """
+        Arms the timeout of the stage connection is in now. Headers timeout
+        limits the time of receiving the whole request line and headers, so it
+        isn't re-armed while they're received. Body timeout limits the time
+        between two pieces of body, so it's re-armed every time. Keep-alive
+        timeout is armed only when there are no requests to process, as
+        handlers aren't limited by timeouts
+
+        If server is shutting down, the connection is closed instead of
+        arming keep-alive timeout
+        """
+
+        if self.closing and self.idle():
+            self.transport.close()
+            return
+
+        if self.timer_wheel is None:
+            return
+
+        stage = self.protocol.stage
+
+        if stage == STAGE_IDLE and (self.handling or self.protocol.completed):
+            stage = None
+        elif stage == STAGE_HEADERS and self.armed_stage == STAGE_HEADERS:
+            return
+        elif self.reading_paused:
+            # client isn't sending because we aren't reading
+            stage = None
+
+        self.armed_stage = stage
+        self._schedule_timeout(self.timeouts.get(stage))
+
+    def on_timeout(self) -> None:
+        self.armed_stage = None
         self.transport.close()
 
+    def _on_continue(self) -> None:
+        # responses to the previous requests must go first. If they aren't
+        # rendered yet, client is left to send the body after its own timeout
+        if not self.handling and not self.protocol.completed and \
+                not self.transport.is_closing():
+            self.transport.write(PRE_RENDERED_CONTINUE)
+
+    def _setup_connection(self, transport: TCPTransport) -> bool:
+        """
+        Returns False if connection was rejected
+        """
+
+        self.transport = transport
+
+        if self.connections is not None:
+            if self.max_connections is not None and \
+                    len(self.connections) >= self.max_connections:
+                transport.close()
+                return False
+
+            self.connections.add(self)
+
+        transport.set_write_buffer_limits(
+            high=self.write_high_water,
+            low=self.write_low_water
+        )
+
+        if self.timer_wheel is not None:
+            # client must send the first request as fast as any other
+            # request is sent, so applying headers timeout instead of keep-alive
+            self.armed_stage = STAGE_HEADERS
+            self._schedule_timeout(self.timeouts[STAGE_HEADERS])
+
+        return True
+
+    def _schedule_timeout(self, timeout: Optional[float]) -> None:
+        if timeout is None:
+            self.timer_wheel.cancel(self)
+        else:
+            self.timer_wheel.schedule(self, timeout)
+
+    def _teardown_connection(self) -> None:
+        self.disconnected = True
+
+        if self.timer_wheel is not None:
+            self.timer_wheel.cancel(self)
+
+        if self.connections is not None:
+            self.connections.discard(self)
+
+        self.transport.close()
+        self._wakeup_drain_waiter()
+
+    def _wakeup_drain_waiter(self) -> None:
+        waiter, self.drain_waiter = self.drain_waiter, None
+
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+
+class DirectServerProtocol(AsyncioServerProtocol):
+    """
+    Feeds the parser right from data_received() without any intermediate
+    queues and tasks, so dispatcher coroutine is scheduled only when the
+    whole message is received
+
+    Pipelined requests are processed strictly one by one in order they
+    came, and their responses are collected and flushed by a single
+    writelines() call when there are no more completed requests, or
+    when transport asked us to pause writing
+
+    If eager_handlers is True, dispatcher coroutine is not even scheduled,
+    but ran right here until the first suspension, so handlers that never
+    suspend are processed without creating a task at all
+    """
+
+    def __init__(self,
+                 on_message_complete: AsyncFunction,
+                 protocol: LLHttpProtocol,
+                 parser: HttpRequestParser,
+                 response_obj: Response,
+                 storage: Storage,
+                 eager_handlers: bool = False,
+                 **flow_control):
+        super(DirectServerProtocol, self).__init__(
+            on_message_complete,
+            protocol,
+            parser,
+            response_obj,
+            storage,
+            **flow_control
+        )
+        self.eager_handlers = eager_handlers
+        self.responses: List[bytes] = []
+        self.responses_size: int = 0
+        protocol.on_stream_consumed = self._on_stream_consumed
+
+    def connection_made(self, transport: TCPTransport) -> None:
+        self._setup_connection(transport)
+
+    def data_received(self, data: bytes) -> None:
+        if self.protocol.errored:
+            # lingering, the rest of the request is thrown away
+            return
+
+        try:
+            self.protocol.feed(data)
+        except (HttpParserError, HttpParserUpgrade):
+            # upgrades aren't supported, so they're rejected as well
+            self.reject()
+            return
+
+        if not self.handling:
+            self._handle_requests()
+
+        self.update_reading()
+        self.update_timeout()
+
+    def connection_lost(self, _) -> None:
+        self.protocol.drop_completed()
+        # handler may wait for the body that won't be received anymore
+        self.protocol.abort_stream(ConnectionResetError('client has disconnected'))
+        self._teardown_connection()
+
+        if not self.handling:
+            self.release()
+
+    def wipe(self) -> None:
+        super(DirectServerProtocol, self).wipe()
+        self.responses.clear()
+        self.responses_size = 0
+
+    async def drain(self) -> None:
+        # responses we are holding also must be drained
+        self._flush()
+        await super(DirectServerProtocol, self).drain()
+
+    def backlog_exceeded(self) -> bool:
+        stream = self.protocol.stream
+
+        return len(self.protocol.completed) >= self.max_pending_requests or \
+            self.protocol.completed_body_size >= self.max_pending_body or \
+            (stream is not None and stream.buffered >= self.max_pending_body)
+
+    def _on_stream_consumed(self) -> None:
+        if self.reading_paused:
+            self.update_reading()
+            self.update_timeout()
+
+    def _handle_requests(self) -> None:
+        if self.eager_handlers:
+            task = run_eagerly(self._process_completed())
+        else:
+            task = asyncio.create_task(self._process_completed())
+
+        if task is not None:
+            self.handling = True
+            task.add_done_callback(self._on_handled)
+
+    async def _process_completed(self) -> None:
+        completed = self.protocol.completed
+
+        # requests that are completed while we are awaiting
+        # some handler will also be processed here
+        while completed:
+            if self.writing_paused:
+                # client does not read responses as fast as he sends
+                # requests, so we aren't going to produce more of them
+                await self.drain()
+
+            request = self.protocol.pop_completed()
+
+            if self.reading_paused:
+                self.update_reading()
+
+            try:
+                await self.on_message_complete(
+                    request,
+                    self.response_obj,
+                    self._send
+                )
+            finally:
+                self._finish(request)
+
+        self._flush()
+
+    def _send(self, data: bytes) -> None:
+        self.responses.append(data)
+        self.responses_size += len(data)
+
+        if self.responses_size >= self.write_high_water:
+            # no reason to hold more, transport will be paused anyway
+            self._flush()
+
+    def _on_handled(self, _) -> None:
+        self.handling = False
+
+        if self.disconnected:
+            # it was the last thing that was holding us
+            self.release()
+            return
+
+        # something could be completed after the task has finished, but
+        # before this callback was called
+        if self.protocol.completed and not self.transport.is_closing():
+            self._handle_requests()
+
+        self.update_timeout()
+
+    def _finish(self, request: Request) -> None:
+        self.protocol.recycle(request)
+        self.response_obj.wipe()
+
+    def _flush(self) -> None:
+        if self.responses:
+            self.flush(self.responses)
+            self.responses.clear()
+            self.responses_size = 0
+
+
+class ProtocolPool:
+    """
+    Per-worker free-list of server protocols with everything they are holding
+    (parser, response and requests objects), so short-lived connections
+    do not allocate them again and again. Protocols are wiped and returned
+    here when their connection is lost and they aren't processing anything
+    """
+
+    def __init__(self,
+                 factory: Callable[[], AsyncioServerProtocol],
+                 max_size: int):
+        self.factory = factory
+        self.max_size = max_size
+        self.free: List[AsyncioServerProtocol] = []
+
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def acquire(self) -> AsyncioServerProtocol:
+        if self.free:
+            self.hits += 1
+
+            return self.free.pop()
+
+        self.misses += 1
+        protocol = self.factory()
+        protocol.pool = self
+
+        return protocol
+
+    def release(self, protocol: AsyncioServerProtocol) -> None:
+        if len(self.free) < self.max_size:
+            protocol.wipe()
+            self.free.append(protocol)
+
+    @property
+    def hit_rate(self) -> float:
+        acquired = self.hits + self.misses
+
+        return self.hits / acquired if acquired else 0.
+
 
 class AioHTTPServer(base.HTTPServer):
     def __init__(self,
@@ -103,59 +580,192 @@ class AioHTTPServer(base.HTTPServer):
                  on_begin_serving: Callable,
                  on_message_complete: AsyncFunction,
                  storage: Storage,
-                 default_headers: CaseInsensitiveDict):
+                 default_headers: Headers,
+                 settings: Optional['Settings'] = None,
+                 body_limit: Optional[Callable[[Request], Optional[int]]] = None,
+                 body_streamed: Optional[Callable[[Request], bool]] = None,
+                 continue_check: Optional[Callable[[Request], Optional[bytes]]] = None):
         super(AioHTTPServer, self).__init__(
             sock=sock,
             max_conns=max_conns,
             on_begin_serving=on_begin_serving,
             on_message_complete=on_message_complete,
             storage=storage,
-            default_headers=default_headers
+            default_headers=default_headers,
+            settings=settings,
+            body_limit=body_limit,
+            body_streamed=body_streamed,
+            continue_check=continue_check
+        )
+
+        self.protocol_options = {
+            'write_high_water': self.settings.write_high_water,
+            'write_low_water': self.settings.write_low_water,
+            'max_pending_requests': self.settings.max_pending_requests,
+            'max_pending_body': self.settings.max_pending_body
+        }
+
+        if issubclass(self.settings.server_protocol, DirectServerProtocol):
+            self.protocol_options['eager_handlers'] = self.settings.eager_handlers
+        else:
+            # client runner feeds the parser and runs handlers itself, so
+            # it can't feed the body while handler is waiting for it
+            self.parser_options['body_streamed'] = None
+
+        # all the connections of the worker, so they can be counted
+        self.connections: Set[AsyncioServerProtocol] = set()
+        self.protocol_options['connections'] = self.connections
+        self.protocol_options['max_connections'] = self.settings.max_worker_connections
+
+        timeouts = {
+            'keepalive_timeout': self.settings.keepalive_timeout,
+            'header_timeout': self.settings.header_timeout,
+            'body_timeout': self.settings.body_timeout
+        }
+        enabled_timeouts = [timeout for timeout in timeouts.values() if timeout is not None]
+        self.timer_wheel: Optional[TimerWheel] = None
+
+        if enabled_timeouts:
+            self.timer_wheel = TimerWheel(
+                resolution=self.settings.timeouts_resolution,
+                max_timeout=max(enabled_timeouts)
+            )
+            self.protocol_options['timer_wheel'] = self.timer_wheel
+            self.protocol_options.update(timeouts)
+
+        self.protocol_pool = ProtocolPool(
+            factory=lambda: server_protocol_factory(
+                self.on_message_complete,
+                self.storage,
+                self.default_headers,
+                self.settings.server_protocol,
+                self.parser_options,
+                **self.protocol_options
+            ),
+            max_size=self.settings.protocol_pool_size
         )
 
         self.server: Optional[asyncio.AbstractServer] = None
+        # resolved with shutdown timeout when server is asked to shut down
+        # (or with None if it must be stopped immediately)
+        self.shutdown_requested: Optional[asyncio.Future] = None
         sock.listen(max_conns)
 
     async def poll(self):
         loop = asyncio.get_running_loop()
         server = await loop.create_server(
-            lambda: server_protocol_factory(
-                self.on_message_complete,
-                self.storage,
-                self.default_headers
-            ),
+            self.protocol_pool.acquire,
             sock=self.sock,
             start_serving=False
         )
         self.server = server
         self.on_begin_serving()
 
-        await server.serve_forever()
+        if self.timer_wheel is not None:
+            self.timer_wheel.start()
+
+        self.shutdown_requested = loop.create_future()
+        await server.start_serving()
+        timeout = await self.shutdown_requested
+
+        if timeout is not None:
+            await self._drain(timeout)
+
+        self.stop()
+
+    def shutdown(self, timeout: float) -> None:
+        if self.shutdown_requested is not None and not self.shutdown_requested.done():
+            self.shutdown_requested.set_result(timeout)
 
     def stop(self):
+        if self.timer_wheel is not None:
+            self.timer_wheel.stop()
+
         self.server.close()
 
+        if self.shutdown_requested is not None and not self.shutdown_requested.done():
+            self.shutdown_requested.set_result(None)
+
+    async def _drain(self, timeout: float) -> None:
+        """
+        Stops accepting new connections, closes idle ones, and gives the
+        others `timeout` seconds to finish requests they are processing.
+        Connections that are still alive after that are aborted
+        """
+
+        self.server.close()
+
+        for connection in tuple(self.connections):
+            connection.close_when_idle()
+
+        deadline = asyncio.get_running_loop().time() + timeout
+
+        while self.connections and asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(.1)
+
+        for connection in tuple(self.connections):
+            connection.transport.abort()
+
+
+async def client_runner(server_protocol: AsyncioServerProtocol) -> NoReturn:
+    """
+    Takes the data received by the protocol from its queue, feeds it to the
+    parser and processes all the completed requests one by one
+    """
+
+    requests_queue = server_protocol.requests_queue
+    callback = server_protocol.on_message_complete
+    response = server_protocol.response_obj
+    protocol = server_protocol.protocol
+    completed = protocol.completed
+    responses: List[bytes] = []
 
-async def client_runner(requests_queue: asyncio.Queue,
-                        callback: AsyncFunction,
-                        parser: HttpRequestParser,
-                        protocol: LLHttpProtocol,
-                        response_client: Callable[[bytes], None],
-                        request: Request,
-                        response: Response) -> NoReturn:
     while True:
         data = await requests_queue.get()
 
         if data == CLIENT_DISCONNECTED:
+            server_protocol.release()
             return
 
-        parser.feed_data(data)
+        server_protocol.update_reading()
 
-        if protocol.received:
-            await callback(
-                request,
-                response,
-                response_client
-            )
-            request.wipe()
-            response.wipe()
+        if protocol.errored:
+            # waiting for connection_lost() to put CLIENT_DISCONNECTED
+            continue
+
+        try:
+            protocol.feed(data)
+        except (HttpParserError, HttpParserUpgrade):
+            server_protocol.reject()
+            continue
+
+        server_protocol.update_timeout()
+
+        if not completed:
+            continue
+
+        # requests are already taken from the queue, so it's the only thing
+        # that tells graceful shutdown not to close the connection yet
+        server_protocol.handling = True
+
+        try:
+            while completed:
+                request = protocol.pop_completed()
+                await callback(
+                    request,
+                    response,
+                    responses.append
+                )
+                protocol.recycle(request)
+                response.wipe()
+        finally:
+            server_protocol.handling = False
+
+        if responses:
+            server_protocol.flush(responses)
+            responses.clear()
+            # do not take more data while client doesn't read what we've sent
+            await response.drain()
+
+        # closes the connection, if shutdown was waiting for the handler
+        server_protocol.update_timeout()
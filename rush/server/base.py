@@ -1,10 +1,18 @@
 import abc
 import socket
-from typing import Callable
+from typing import Callable, Optional, Union, Dict, TYPE_CHECKING
 
 from ..storage.base import Storage
 from ..typehints import AsyncFunction
-from ..entities import CaseInsensitiveDict
+from ..entities import Request, Headers
+
+if TYPE_CHECKING:
+    from ..webserver import Settings
+
+# when request is rejected before it was received completely, connection is
+# kept for this long to discard the rest of it, so client gets the response
+# instead of the connection reset
+LINGERING_TIMEOUT = 5
 
 
 class HTTPServer(abc.ABC):
@@ -20,13 +28,38 @@ class HTTPServer(abc.ABC):
                  on_begin_serving: Callable,
                  on_message_complete: AsyncFunction,
                  storage: Storage,
-                 default_headers: CaseInsensitiveDict):
+                 default_headers: Union[Headers, Dict],
+                 settings: Optional['Settings'] = None,
+                 body_limit: Optional[Callable[[Request], Optional[int]]] = None,
+                 body_streamed: Optional[Callable[[Request], bool]] = None,
+                 continue_check: Optional[Callable[[Request], Optional[bytes]]] = None):
+        if settings is None:
+            # webserver imports http servers, so importing it on
+            # module level would be a circular import
+            from ..webserver import Settings
+
+            settings = Settings()
+
         self.sock = sock
         self.max_conns = max_conns
         self.on_begin_serving = on_begin_serving
         self.on_message_complete = on_message_complete
         self.storage = storage
-        self.default_headers = default_headers
+        # converted once, so every response reads through the same
+        # headers, and their rendered version is cached between responses
+        self.default_headers = \
+            default_headers if isinstance(default_headers, Headers) else Headers(default_headers)
+        # all the other tunables are taken by implementations right from settings
+        self.settings = settings
+        # options of request parsers, the same for all the implementations
+        self.parser_options = {
+            'max_body_size': settings.max_body_size,
+            'spill_threshold': settings.body_spill_threshold,
+            'body_limit': body_limit,
+            'body_streamed': body_streamed,
+            'continue_check': continue_check,
+            'fast_path': settings.parser_fast_path
+        }
 
     @abc.abstractmethod
     async def poll(self) -> None:
@@ -41,3 +74,14 @@ class HTTPServer(abc.ABC):
         """
         Stops the server in correct way
         """
+
+    def shutdown(self, timeout: float) -> None:
+        """
+        Asks the server to stop gracefully: stop accepting new connections
+        and give already accepted ones `timeout` seconds to finish requests
+        they are processing. poll() returns when it's done
+
+        By default just stops the server
+        """
+
+        self.stop()
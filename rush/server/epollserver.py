@@ -0,0 +1,694 @@
+import os
+import errno
+import socket
+import select
+import asyncio
+from typing import Optional, Callable, Dict, List, TYPE_CHECKING
+
+from httptools import HttpRequestParser, HttpParserError, HttpParserUpgrade
+
+from . import base
+from ..storage.base import Storage
+from ..typehints import AsyncFunction
+from ..utils.aioutils import run_eagerly
+from ..utils.timerwheel import TimerWheel
+from ..entities import Request, Response, Headers
+from .aiohttpserver import ProtocolPool
+from ..parser.httptools_protocol import (Protocol as LLHttpProtocol, PRE_RENDERED_CONTINUE,
+                                         STAGE_IDLE, STAGE_HEADERS, STAGE_BODY)
+
+if TYPE_CHECKING:
+    from ..webserver import Settings
+
+
+# all the data is fed to the parser right after it's received, so a single
+# buffer per worker is enough for all the connections
+READ_BUFFER_SIZE = 256 * 1024
+# connections are registered once, for everything, and in edge-triggered
+# mode, so epoll is never modified while the connection is alive
+CONNECTION_EVENTS = select.EPOLLIN | select.EPOLLOUT | select.EPOLLRDHUP | select.EPOLLET
+CLOSE_EVENTS = select.EPOLLHUP | select.EPOLLERR
+MAX_EVENTS = 1024
+# client has gone before it was accepted, but the others are still in the queue
+ACCEPT_SKIP_ERRNOS = {errno.ECONNABORTED, errno.EPROTO}
+# out of descriptors or memory, so accepting is retried after a while, as
+# pending clients won't be notified about again until a new one comes
+ACCEPT_RETRY_ERRNOS = {errno.EMFILE, errno.ENFILE, errno.ENOBUFS, errno.ENOMEM}
+ACCEPT_RETRY_DELAY = 1
+# sendmsg() doesn't take more buffers at once
+IOV_MAX = os.sysconf('SC_IOV_MAX') if hasattr(os, 'sysconf') else 1024
+
+
+class EpollConnection:
+    """
+    Connection of EpollHTTPServer. Does the same DirectServerProtocol does,
+    but right on the socket: data is read by recv_into() into the shared
+    buffer of the server until the socket is drained (as epoll notifies only
+    about new data, not about data that is still there), and responses are
+    written by a single sendmsg() call without joining them. What doesn't fit
+    into the socket is kept until epoll reports it's writable again
+
+    Handlers are always ran eagerly, so a task is created only for those
+    that really suspend
+    """
+
+    def __init__(self,
+                 server: 'EpollHTTPServer',
+                 protocol: LLHttpProtocol,
+                 response_obj: Response,
+                 write_high_water: int = 64 * 1024,
+                 write_low_water: int = 16 * 1024,
+                 max_pending_requests: int = 32,
+                 max_pending_body: int = 1024 * 1024,
+                 keepalive_timeout: Optional[float] = None,
+                 header_timeout: Optional[float] = None,
+                 body_timeout: Optional[float] = None):
+        self.server = server
+        self.on_message_complete = server.on_message_complete
+        self.sock: Optional[socket.socket] = None
+        self.fd: int = -1
+        self.protocol = protocol
+        self.parser = HttpRequestParser(protocol)
+        protocol.parser = self.parser
+        protocol.on_stream_consumed = self._on_stream_consumed
+        protocol.on_continue = self._on_continue
+        self.response_obj = response_obj
+        self.response_obj.drain_callback = self.drain
+
+        self.write_high_water = write_high_water
+        self.write_low_water = write_low_water
+        self.max_pending_requests = max_pending_requests
+        self.max_pending_body = max_pending_body
+
+        # buffers that are not sent yet, and their total size
+        self.output: List[bytes] = []
+        self.output_size: int = 0
+        self.writing_paused: bool = False
+        self.reading_paused: bool = False
+        self.drain_waiter: Optional[asyncio.Future] = None
+
+        self.timer_wheel = server.timer_wheel
+        self.timer_slot: Optional[set] = None
+        self.timeouts = {
+            STAGE_IDLE: keepalive_timeout,
+            STAGE_HEADERS: header_timeout,
+            STAGE_BODY: body_timeout
+        }
+        self.armed_stage: Optional[int] = None
+
+        self.handling: bool = False
+        self.pool: Optional[ProtocolPool] = None
+        self.disconnected: bool = False
+        self.closing: bool = False
+        # request was rejected, and the rest of it is discarded
+        self.lingering: bool = False
+
+    def open(self, sock: socket.socket) -> None:
+        self.sock = sock
+        self.fd = sock.fileno()
+        self.server.connections[self.fd] = self
+        self.server.epoll.register(self.fd, CONNECTION_EVENTS)
+
+        if self.timer_wheel is not None:
+            # client must send the first request as fast as any other
+            # request is sent, so applying headers timeout instead of keep-alive
+            self.armed_stage = STAGE_HEADERS
+            self._schedule_timeout(self.timeouts[STAGE_HEADERS])
+
+    def close(self) -> None:
+        if self.disconnected:
+            return
+
+        self.disconnected = True
+        self.protocol.drop_completed()
+        # handler may wait for the body that won't be received anymore
+        self.protocol.abort_stream(ConnectionResetError('client has disconnected'))
+
+        if self.timer_wheel is not None:
+            self.timer_wheel.cancel(self)
+
+        del self.server.connections[self.fd]
+        # closing the socket also removes it from epoll
+        self.sock.close()
+        self._wakeup_drain_waiter()
+
+        if not self.handling:
+            self.release()
+
+    def wipe(self) -> None:
+        """
+        Resets the connection after it was closed, so it can serve another
+        one. Parser is re-created only if it can't be reused
+        """
+
+        self.sock = None
+        self.fd = -1
+        self.output.clear()
+        self.output_size = 0
+        self.writing_paused = False
+        self.reading_paused = False
+        self.drain_waiter = None
+        self.armed_stage = None
+        self.handling = False
+        self.disconnected = False
+        self.closing = False
+        self.lingering = False
+        self.response_obj.wipe()
+
+        if not self.protocol.parser_reusable():
+            self.parser = HttpRequestParser(self.protocol)
+            self.protocol.parser = self.parser
+
+        self.protocol.wipe()
+
+    def release(self) -> None:
+        if self.pool is not None:
+            self.pool.release(self)
+
+    def on_readable(self) -> None:
+        buffer = self.server.read_buffer
+        view = self.server.read_view
+
+        if self.lingering:
+            self._discard()
+            return
+
+        while not self.reading_paused:
+            try:
+                received = self.sock.recv_into(buffer)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError:
+                self.close()
+                return
+
+            if not received:
+                self.close()
+                return
+
+            try:
+                self.protocol.feed(view[:received])
+            except (HttpParserError, HttpParserUpgrade):
+                # upgrades aren't supported, so they're rejected as well
+                self.reject()
+                return
+
+            if self.output and not self.handling:
+                # 100 Continue, client won't send the body until it gets it
+                self.flush()
+
+                if self.disconnected:
+                    return
+
+            if not self.handling and self.protocol.completed:
+                self._handle_requests()
+
+                if self.disconnected:
+                    return
+
+            self.update_reading()
+
+            if received < len(buffer):
+                # socket is drained, otherwise it would fill the whole buffer
+                break
+
+        self.update_timeout()
+
+    def on_writable(self) -> None:
+        if self.output:
+            self.flush()
+
+    def flush(self) -> None:
+        output = self.output
+
+        while output:
+            try:
+                sent = self.sock.sendmsg(output[:IOV_MAX])
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError:
+                self.close()
+                return
+
+            self.output_size -= sent
+
+            # throwing away what's sent, and cutting what's sent partially
+            sent_buffers = 0
+
+            for buffer in output:
+                if sent < len(buffer):
+                    break
+
+                sent -= len(buffer)
+                sent_buffers += 1
+
+            del output[:sent_buffers]
+
+            if sent:
+                output[0] = memoryview(output[0])[sent:]
+                # socket buffer is full, epoll will tell us when it's not
+                break
+
+        if self.lingering and not output:
+            self._shutdown_writing()
+
+        if self.output_size >= self.write_high_water:
+            self.writing_paused = True
+        elif self.writing_paused and self.output_size <= self.write_low_water:
+            self.writing_paused = False
+            self._wakeup_drain_waiter()
+
+    async def drain(self) -> None:
+        """
+        Returns when output buffer is drained below low-water mark (or
+        immediately, if it already is). Also returns if client has
+        disconnected, so waiters won't hang forever
+        """
+
+        self.flush()
+
+        if not self.writing_paused or self.disconnected:
+            return
+
+        if self.drain_waiter is None:
+            self.drain_waiter = asyncio.get_running_loop().create_future()
+
+        # shielding, so cancellation of one waiter won't affect the others
+        await asyncio.shield(self.drain_waiter)
+
+    def backlog_exceeded(self) -> bool:
+        stream = self.protocol.stream
+
+        return len(self.protocol.completed) >= self.max_pending_requests or \
+            self.protocol.completed_body_size >= self.max_pending_body or \
+            (stream is not None and stream.buffered >= self.max_pending_body)
+
+    def update_reading(self) -> None:
+        if self.backlog_exceeded():
+            self.reading_paused = True
+        elif self.reading_paused:
+            self.reading_paused = False
+            # there won't be another notification about the data that
+            # was already there when we stopped reading
+            self.on_readable()
+
+    def idle(self) -> bool:
+        return self.protocol.stage == STAGE_IDLE and not self.handling and \
+            not self.protocol.completed and not self.output
+
+    def reject(self) -> None:
+        """
+        Same as AsyncioServerProtocol.reject()
+        """
+
+        self.protocol.errored = True
+        response = self.protocol.error_response
+
+        if response is None or self.handling or self.protocol.completed:
+            self.close()
+            return
+
+        self.lingering = True
+        self.server.loop.call_later(base.LINGERING_TIMEOUT, self._stop_lingering, self.sock)
+        self._send(response)
+        self.flush()
+
+        if not self.disconnected:
+            # there may be the rest of request already
+            self._discard()
+
+    def close_when_idle(self) -> None:
+        self.closing = True
+
+        if self.idle():
+            self.close()
+
+    def update_timeout(self) -> None:
+        """
+        Same as AsyncioServerProtocol.update_timeout()
+        """
+
+        if self.closing and self.idle():
+            self.close()
+            return
+
+        if self.timer_wheel is None or self.disconnected:
+            return
+
+        stage = self.protocol.stage
+
+        if stage == STAGE_IDLE and (self.handling or self.protocol.completed):
+            stage = None
+        elif stage == STAGE_HEADERS and self.armed_stage == STAGE_HEADERS:
+            return
+        elif self.reading_paused:
+            # client isn't sending because we aren't reading
+            stage = None
+
+        self.armed_stage = stage
+        self._schedule_timeout(self.timeouts.get(stage))
+
+    def on_timeout(self) -> None:
+        self.armed_stage = None
+        self.close()
+
+    def _on_stream_consumed(self) -> None:
+        if self.reading_paused and not self.backlog_exceeded():
+            # reading is resumed outside of the handler, that is taking
+            # the chunk right now
+            self.server.loop.call_soon(self._resume_reading, self.sock)
+
+    def _on_continue(self) -> None:
+        # responses to the previous requests must go first. If they aren't
+        # rendered yet, client is left to send the body after its own timeout.
+        # Only buffered here, as parser is running, and connection must not
+        # be closed under it if sending fails
+        if not self.handling and not self.protocol.completed:
+            self._send(PRE_RENDERED_CONTINUE)
+
+    def _resume_reading(self, sock: socket.socket) -> None:
+        if self.sock is sock and not self.disconnected:
+            self.update_reading()
+            self.update_timeout()
+
+    def _discard(self) -> None:
+        buffer = self.server.read_buffer
+
+        while True:
+            try:
+                received = self.sock.recv_into(buffer)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                received = 0
+
+            if not received:
+                self.close()
+                return
+
+    def _shutdown_writing(self) -> None:
+        try:
+            self.sock.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+
+    def _stop_lingering(self, sock: socket.socket) -> None:
+        # connection may already be closed, and reused by another client
+        if self.sock is sock:
+            self.close()
+
+    def _schedule_timeout(self, timeout: Optional[float]) -> None:
+        if timeout is None:
+            self.timer_wheel.cancel(self)
+        else:
+            self.timer_wheel.schedule(self, timeout)
+
+    def _handle_requests(self) -> None:
+        # unlike transports, we are closing the connection synchronously, so it
+        # may happen right while handler is ran, and it must not be released
+        self.handling = True
+
+        try:
+            task = run_eagerly(self._process_completed())
+        except BaseException:  # noqa: only cleaning up here
+            task = None
+            raise
+        finally:
+            if task is None:
+                # everything is processed, timeout is updated by the caller
+                self.handling = False
+
+                if self.disconnected:
+                    self.release()
+
+        if task is not None:
+            task.add_done_callback(self._on_handled)
+
+    async def _process_completed(self) -> None:
+        completed = self.protocol.completed
+
+        while completed:
+            if self.writing_paused:
+                await self.drain()
+
+            request = self.protocol.pop_completed()
+
+            if self.reading_paused:
+                self.update_reading()
+
+            try:
+                await self.on_message_complete(
+                    request,
+                    self.response_obj,
+                    self._send
+                )
+            finally:
+                self._finish(request)
+
+        if not self.disconnected:
+            self.flush()
+
+    def _send(self, data: bytes) -> None:
+        self.output.append(data)
+        self.output_size += len(data)
+
+        if self.output_size >= self.write_high_water:
+            self.flush()
+
+    def _on_handled(self, _) -> None:
+        self.handling = False
+
+        if self.disconnected:
+            self.release()
+            return
+
+        if self.protocol.completed:
+            self._handle_requests()
+
+            if self.disconnected:
+                return
+
+        self.update_timeout()
+
+    def _finish(self, request: Request) -> None:
+        self.protocol.recycle(request)
+        self.response_obj.wipe()
+
+    def _wakeup_drain_waiter(self) -> None:
+        waiter, self.drain_waiter = self.drain_waiter, None
+
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+
+class EpollHTTPServer(base.HTTPServer):
+    """
+    HTTP server that manages the sockets itself by edge-triggered epoll,
+    instead of asyncio transports and protocols. The event loop is still
+    used for handlers: epoll file descriptor is watched by the loop, and
+    all the ready events are processed at once when it's readable
+
+    Linux only
+    """
+
+    def __init__(self,
+                 sock: socket.socket,
+                 max_conns: int,
+                 on_begin_serving: Callable,
+                 on_message_complete: AsyncFunction,
+                 storage: Storage,
+                 default_headers: Headers,
+                 settings: Optional['Settings'] = None,
+                 body_limit: Optional[Callable[[Request], Optional[int]]] = None,
+                 body_streamed: Optional[Callable[[Request], bool]] = None,
+                 continue_check: Optional[Callable[[Request], Optional[bytes]]] = None):
+        super(EpollHTTPServer, self).__init__(
+            sock=sock,
+            max_conns=max_conns,
+            on_begin_serving=on_begin_serving,
+            on_message_complete=on_message_complete,
+            storage=storage,
+            default_headers=default_headers,
+            settings=settings,
+            body_limit=body_limit,
+            body_streamed=body_streamed,
+            continue_check=continue_check
+        )
+
+        self.connection_options = {
+            'write_high_water': self.settings.write_high_water,
+            'write_low_water': self.settings.write_low_water,
+            'max_pending_requests': self.settings.max_pending_requests,
+            'max_pending_body': self.settings.max_pending_body,
+            'keepalive_timeout': self.settings.keepalive_timeout,
+            'header_timeout': self.settings.header_timeout,
+            'body_timeout': self.settings.body_timeout
+        }
+        self.max_connections = self.settings.max_worker_connections
+        self.connections: Dict[int, EpollConnection] = {}
+
+        enabled_timeouts = [
+            timeout for timeout in (self.settings.keepalive_timeout,
+                                    self.settings.header_timeout,
+                                    self.settings.body_timeout)
+            if timeout is not None
+        ]
+        self.timer_wheel: Optional[TimerWheel] = None
+
+        if enabled_timeouts:
+            self.timer_wheel = TimerWheel(
+                resolution=self.settings.timeouts_resolution,
+                max_timeout=max(enabled_timeouts)
+            )
+
+        self.connections_pool = ProtocolPool(
+            factory=lambda: EpollConnection(
+                self,
+                LLHttpProtocol(self.storage, **self.parser_options),
+                Response(self.default_headers),
+                **self.connection_options
+            ),
+            max_size=self.settings.protocol_pool_size
+        )
+
+        self.read_buffer = bytearray(READ_BUFFER_SIZE)
+        self.read_view = memoryview(self.read_buffer)
+        self.epoll: Optional[select.epoll] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.accepting: bool = False
+        # scheduled accept after running out of descriptors
+        self.accept_retry: Optional[asyncio.TimerHandle] = None
+        self.shutdown_requested: Optional[asyncio.Future] = None
+
+        sock.setblocking(False)
+        sock.listen(max_conns)
+
+    async def poll(self):
+        self.loop = asyncio.get_running_loop()
+        self.epoll = select.epoll()
+        self.epoll.register(self.sock.fileno(), select.EPOLLIN | select.EPOLLET)
+        self.accepting = True
+        self.loop.add_reader(self.epoll.fileno(), self._on_events)
+        self.on_begin_serving()
+
+        if self.timer_wheel is not None:
+            self.timer_wheel.start()
+
+        self.shutdown_requested = self.loop.create_future()
+        # connections could come before we have started watching the epoll
+        self._accept()
+        timeout = await self.shutdown_requested
+
+        if timeout is not None:
+            await self._drain(timeout)
+
+        self.stop()
+
+    def shutdown(self, timeout: float) -> None:
+        if self.shutdown_requested is not None and not self.shutdown_requested.done():
+            self.shutdown_requested.set_result(timeout)
+
+    def stop(self):
+        if self.timer_wheel is not None:
+            self.timer_wheel.stop()
+
+        self._stop_accepting()
+
+        for connection in tuple(self.connections.values()):
+            connection.close()
+
+        if self.epoll is not None:
+            self.loop.remove_reader(self.epoll.fileno())
+            self.epoll.close()
+            self.epoll = None
+
+        if self.shutdown_requested is not None and not self.shutdown_requested.done():
+            self.shutdown_requested.set_result(None)
+
+    def _on_events(self) -> None:
+        listen_fd = self.sock.fileno() if self.accepting else None
+        connections = self.connections
+
+        for fd, events in self.epoll.poll(0, MAX_EVENTS):
+            if fd == listen_fd:
+                self._accept()
+                continue
+
+            connection = connections.get(fd)
+
+            if connection is None:
+                continue
+
+            try:
+                if events & select.EPOLLOUT:
+                    connection.on_writable()
+
+                # connection may be closed (and even released) by the previous step
+                if events & (select.EPOLLIN | select.EPOLLRDHUP) and \
+                        connections.get(fd) is connection:
+                    connection.on_readable()
+
+                if events & CLOSE_EVENTS and connections.get(fd) is connection:
+                    connection.close()
+            except Exception:   # noqa: the rest of the events must be processed anyway
+                self.settings.logger.exception('unexpected error on connection, closing it:')
+
+                if connections.get(fd) is connection:
+                    connection.close()
+
+    def _accept(self) -> None:
+        while self.accepting:
+            try:
+                client, _ = self.sock.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as exc:
+                if exc.errno in ACCEPT_SKIP_ERRNOS:
+                    continue
+
+                if exc.errno in ACCEPT_RETRY_ERRNOS and self.accept_retry is None:
+                    self.accept_retry = self.loop.call_later(ACCEPT_RETRY_DELAY, self._retry_accept)
+
+                return
+
+            if self.max_connections is not None and \
+                    len(self.connections) >= self.max_connections:
+                client.close()
+                continue
+
+            client.setblocking(False)
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, True)
+            self.connections_pool.acquire().open(client)
+
+    def _retry_accept(self) -> None:
+        self.accept_retry = None
+        self._accept()
+
+    def _stop_accepting(self) -> None:
+        if self.accept_retry is not None:
+            self.accept_retry.cancel()
+            self.accept_retry = None
+
+        if self.accepting:
+            self.accepting = False
+            self.sock.close()
+
+    async def _drain(self, timeout: float) -> None:
+        """
+        Stops accepting new connections, closes idle ones, and gives the
+        others `timeout` seconds to finish requests they are processing.
+        Connections that are still alive after that are aborted
+        """
+
+        self._stop_accepting()
+
+        for connection in tuple(self.connections.values()):
+            connection.close_when_idle()
+
+        deadline = self.loop.time() + timeout
+
+        while self.connections and self.loop.time() < deadline:
+            await asyncio.sleep(.1)
+
+        for connection in tuple(self.connections.values()):
+            connection.close()
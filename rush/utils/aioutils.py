@@ -0,0 +1,56 @@
+import asyncio
+from typing import Any, Coroutine, Generator, Optional
+
+
+class _Resumed:
+    """
+    An awaitable that continues already started coroutine. The coroutine
+    is suspended on some future, so we just hand this future over to the
+    task that awaits us, and send the result back to coroutine when the task
+    wakes us up (same as the task does itself)
+    """
+
+    def __init__(self, coro: Coroutine, awaited: Any):
+        self.coro = coro
+        self.awaited = awaited
+
+    def __await__(self) -> Generator:
+        coro, awaited = self.coro, self.awaited
+
+        while True:
+            try:
+                yield awaited
+            except BaseException as exc:  # noqa: cancellation must get into coroutine, too
+                send, value = coro.throw, exc
+            else:
+                send, value = coro.send, None
+
+            try:
+                awaited = send(value)
+            except StopIteration as stop:
+                return stop.value
+
+
+async def _continue(coro: Coroutine, awaited: Any) -> Any:
+    return await _Resumed(coro, awaited)
+
+
+def run_eagerly(coro: Coroutine) -> Optional[asyncio.Task]:
+    """
+    Runs coroutine right in the current stack frame until it finishes or
+    suspends for the first time. If coroutine never suspends (most of the
+    handlers do not), None is returned and no task is created at all. Otherwise,
+    returns a task that continues the coroutine from the place it stopped
+
+    Exceptions raised before the first suspension are propagated to the caller
+
+    Note: until the first suspension there is no current task, so things like
+    asyncio.current_task() or asyncio.timeout() will not work there
+    """
+
+    try:
+        awaited = coro.send(None)
+    except StopIteration:
+        return None
+
+    return asyncio.get_running_loop().create_task(_continue(coro, awaited))
@@ -1,5 +1,8 @@
+import sys
+from functools import lru_cache
+from email.utils import formatdate
 from string import hexdigits
-from typing import Union, Optional, Dict, List, BinaryIO
+from typing import Union, Optional, Dict, List, Tuple, BinaryIO
 
 from .status_codes import status_codes
 
@@ -8,6 +11,34 @@ HTTP_METHODS = {b'GET', b'HEAD', b'POST', b'PUT',
                 b'TRACE', b'PATCH'}
 HEX_TO_BYTE = {(a + b).encode(): bytes.fromhex(a + b)
                for a in hexdigits for b in hexdigits}
+# parsed query strings are cached per worker, as clients tend to repeat them.
+# Long ones are usually unique, and would take too much memory
+PARAMS_CACHE_SIZE = 1024
+PARAMS_CACHE_MAX_LENGTH = 512
+COMMON_HEADERS = (
+    'Host', 'Connection', 'Keep-Alive', 'User-Agent', 'Accept', 'Accept-Encoding',
+    'Accept-Language', 'Accept-Charset', 'Cache-Control', 'Pragma', 'Cookie',
+    'Referer', 'Origin', 'Upgrade-Insecure-Requests', 'Content-Type',
+    'Content-Length', 'Transfer-Encoding', 'Content-Encoding', 'Expect',
+    'Authorization', 'If-Modified-Since', 'If-None-Match', 'Range', 'Upgrade',
+    'DNT', 'TE', 'Via', 'Forwarded', 'X-Forwarded-For', 'X-Forwarded-Proto',
+    'X-Forwarded-Host', 'X-Real-IP', 'X-Requested-With', 'Sec-Fetch-Site',
+    'Sec-Fetch-Mode', 'Sec-Fetch-User', 'Sec-Fetch-Dest', 'Sec-CH-UA',
+    'Sec-CH-UA-Mobile', 'Sec-CH-UA-Platform', 'Priority',
+)
+# lowercase names of common headers by the way they are usually spelled.
+# Names are interned, so headers of all the requests share the same objects,
+# and lowercase name doesn't have to be built for them
+HEADER_KEYS: Dict[bytes, str] = {
+    spelling.encode(): sys.intern(name.lower())
+    for name in COMMON_HEADERS
+    for spelling in (name, name.lower())
+}
+INTERNED_HEADER_NAMES: Dict[bytes, bytes] = {name: name for name in HEADER_KEYS}
+# parser gives new objects for every message, so known methods and versions
+# are replaced by these shared ones, and only the unknown ones are kept
+INTERNED_METHODS: Dict[bytes, bytes] = {method: method for method in HTTP_METHODS}
+INTERNED_VERSIONS: Dict[str, str] = {version: version for version in ('1.0', '1.1')}
 
 
 def format_headers(headers: dict):
@@ -16,12 +47,22 @@ def format_headers(headers: dict):
         .encode()
 
 
+def http_date(timestamp: float) -> bytes:
+    """
+    Returns the time in format of the Date header, like
+    `Sat, 17 Oct 2026 07:27:52 GMT`. Its length is always the same
+    """
+
+    return formatdate(timestamp, usegmt=True).encode()
+
+
 def render_http_response(protocol: bytes,
                          code: int,
                          status_code: Optional[bytes],
                          headers: Union[dict, bytes],
                          body: bytes,
-                         count_content_length: bool = False) -> bytes:
+                         count_content_length: bool = False,
+                         with_body: bool = True) -> bytes:
     """
     A function for rendering http responses. Uses C-formatting as the only way for
     formatting byte-strings (f-strings with encoding are shit)
@@ -32,21 +73,32 @@ def render_http_response(protocol: bytes,
              status_code - may be None, than it'll be taken from the list of known.
                            If no known status codes relate to the status code, UNKNOWN
                            will be used
-             headers - a dict (or CaseInsensitiveDict) with headers. May be bytes, than
-                       they won't be rendered
+             headers - entities.Headers, or a dict (or CaseInsensitiveDict) with headers.
+                       May be bytes, than they won't be rendered
              body - only bytes are accepted
              count_content_length - disabled by default, but if enabled and headers aren't
                                     already rendered, content-length header will be replaced
-                                    by len(body)
+                                    by len(body). Headers object itself is not changed
+             with_body - if disabled, body isn't sent, but content-length is still
+                         counted by it. Used for responses to HEAD requests
     """
 
-    if not isinstance(headers, bytes):
-        if count_content_length:
-            headers['content-length'] = len(body)
+    if isinstance(headers, bytes):
+        headers = headers + b'\r\n' if headers else b''
+    else:
+        skip = 'content-length' if count_content_length else None
 
-        headers = '\r\n'.join(
-            f'{key}: {value}' for key, value in headers.items()
-        ).encode()
+        if isinstance(headers, dict):
+            headers = ''.join(
+                f'{key}: {value}\r\n' for key, value in headers.items()
+                if skip is None or key.lower() != skip
+            ).encode()
+        else:
+            # entities.Headers, they know how to render themselves
+            headers = headers.render(skip)
+
+        if count_content_length:
+            headers += b'content-length: %d\r\n' % len(body)
 
     status_description = status_code or status_codes.get(code, 'UNKNOWN')
 
@@ -56,7 +108,8 @@ def render_http_response(protocol: bytes,
 
     # I'm not using format_headers() function here just to avoid useless calling
     # as everybody knows, functions' calls are a bit expensive in CPython
-    return b'HTTP/%s %d %s\r\n%s\r\n\r\n%s' % (protocol, code, status_description, headers, body)
+    return b'HTTP/%s %d %s\r\n%s\r\n%s' % (protocol, code, status_description, headers,
+                                            body if with_body else b'')
 
 
 def render_http_request(method: bytes,
@@ -109,32 +162,89 @@ def generate_chunked_data(fd: BinaryIO, chunk_length: int = 4096):
 
 def parse_params(params: bytes) -> Dict[str, List[str]]:
     """
-    Returns dict with params (empty if no params given)
+    Parses application/x-www-form-urlencoded string (query string or form
+    body) into dict, where every name has a list of its values, in order
+    they came. Names and values are decoded: `+` is a space, then percent
+    escapes are decoded, and the result is decoded as UTF-8 (invalid bytes
+    are replaced). Name without `=` has an empty value, and empty pairs
+    (like in `a=1&&b=2`) are skipped
+    """
+
+    pairs: Dict[str, List[str]] = {}
+
+    if b'+' in params:
+        # plus is never a separator, so it's replaced in the whole string
+        params = params.replace(b'+', b' ')
+
+    if b'%' in params:
+        for pair in params.split(b'&'):
+            if pair:
+                key, _, value = pair.partition(b'=')
+                key = decode_param(key)
+
+                if key in pairs:
+                    pairs[key].append(decode_param(value))
+                else:
+                    pairs[key] = [decode_param(value)]
+    else:
+        # nothing to decode, so the whole string is decoded at once
+        for pair in params.decode('utf-8', 'replace').split('&'):
+            if pair:
+                key, _, value = pair.partition('=')
+
+                if key in pairs:
+                    pairs[key].append(value)
+                else:
+                    pairs[key] = [value]
+
+    return pairs
 
-    May raise exceptions: ValueError
+
+@lru_cache(maxsize=PARAMS_CACHE_SIZE)
+def _parse_params_cached(params: bytes) -> Tuple[Tuple[str, Tuple[str, ...]], ...]:
+    # kept immutable, as it's shared by all the requests with the same string
+    return tuple((name, tuple(values)) for name, values in parse_params(params).items())
+
+
+def parse_query(params: bytes) -> Dict[str, List[str]]:
+    """
+    Same as parse_params(), but strings up to PARAMS_CACHE_MAX_LENGTH are parsed
+    once. Every call returns a new dict, so it may be modified
     """
 
-    pairs: Dict[str, List] = {}
+    if len(params) > PARAMS_CACHE_MAX_LENGTH:
+        return parse_params(params)
 
-    for attr in params.split(b'&' if b'&' in params else b';'):
-        key, value = attr.decode().split('=', 1)
+    return {name: list(values) for name, values in _parse_params_cached(params)}
 
-        if key not in pairs:
-            pairs[key] = [value]
-        else:
-            pairs[key].append(value)
 
-    return pairs
+def decode_param(raw: bytes) -> str:
+    if b'%' in raw:
+        raw = decode_url(raw)
+
+    return raw.decode('utf-8', 'replace')
 
 
 def decode_url(bytestring: bytes) -> bytes:
+    """
+    Decodes percent escapes. Invalid escapes are left as they are
+    """
+
     bits = bytestring.split(b'%')
-    decoded: bytes = bits[0]
+    # collecting pieces and joining them once, as concatenating
+    # them one by one is quadratic
+    decoded: List[bytes] = [bits[0]]
+    append = decoded.append
+    hex_to_byte = HEX_TO_BYTE
 
     for item in bits[1:]:
-        try:
-            decoded += HEX_TO_BYTE[item[:2]] + item[2:]
-        except KeyError:
-            decoded += b'%' + item
+        byte = hex_to_byte.get(item[:2])
+
+        if byte is None:
+            append(b'%')
+            append(item)
+        else:
+            append(byte)
+            append(item[2:])
 
-    return decoded
+    return b''.join(decoded)
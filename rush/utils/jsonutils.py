@@ -0,0 +1,99 @@
+import json
+import mmap
+from typing import Any, Union
+
+try:
+    import simdjson
+except ImportError:
+    simdjson = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+JSON_CONTENT_TYPE = b'application/json'
+
+# simdjson parser keeps its buffers between documents, so it's reused by
+# the whole worker. Created on the first parse, so it's never shared by forks
+_parser: Any = None
+
+
+def loads(data: Union[bytes, bytearray, memoryview, mmap.mmap, str], lazy: bool = True) -> Any:
+    """
+    Parses JSON by pysimdjson, or by orjson/stdlib json if it isn't installed
+
+    With pysimdjson and lazy=True, objects and arrays are returned as
+    read-only simdjson.Object and simdjson.Array: fields are converted into
+    python objects only when they're accessed, so reading a few fields of a
+    big document is cheap. Use as_dict()/as_list() to get usual objects.
+    Otherwise usual objects are returned
+
+    Raises ValueError (or its subclass) if JSON is invalid
+    """
+
+    global _parser
+
+    if simdjson is not None:
+        if _parser is None:
+            _parser = simdjson.Parser()
+
+        try:
+            return _parser.parse(data, recursive=not lazy)
+        except RuntimeError:
+            # documents of the previous parse are still referenced (handler
+            # awaits something while holding them), so the parser can't be
+            # reused. It lives as long as they do, and we take a new one
+            _parser = simdjson.Parser()
+
+            return _parser.parse(data, recursive=not lazy)
+
+    if orjson is not None:
+        if not isinstance(data, (bytes, bytearray, memoryview, str)):
+            # like mmap of the body written into a file
+            data = memoryview(data)
+
+        return orjson.loads(data)
+
+    if not isinstance(data, (bytes, str)):
+        data = bytes(data)
+
+    return json.loads(data)
+
+
+def _default(obj: Any) -> Any:
+    """
+    Lets serializers encode the lazy documents returned by loads()
+    """
+
+    if simdjson is not None:
+        if isinstance(obj, simdjson.Object):
+            return obj.as_dict()
+        if isinstance(obj, simdjson.Array):
+            return obj.as_list()
+
+    raise TypeError(f'object of type {obj.__class__.__name__} is not JSON serializable')
+
+
+def dumps(obj: Any) -> bytes:
+    """
+    Serializes object into compact UTF-8 JSON by the fastest encoder available:
+    orjson, ujson or stdlib json
+    """
+
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default)
+
+    if ujson is not None:
+        try:
+            return ujson.dumps(obj, ensure_ascii=False).encode()
+        except TypeError:
+            # ujson knows nothing about lazy documents
+            pass
+
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), default=_default).encode()
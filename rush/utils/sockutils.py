@@ -1,7 +1,19 @@
 import socket
+import struct
+import ctypes
 from time import sleep
 from typing import Tuple, Union
 
+# not exported by the socket module of older pythons
+SO_ATTACH_REUSEPORT_CBPF = getattr(socket, 'SO_ATTACH_REUSEPORT_CBPF', 51)
+
+# classic BPF, see linux/filter.h
+BPF_LD_W_ABS = 0x20     # BPF_LD | BPF_W | BPF_ABS
+BPF_ALU_MOD_K = 0x94    # BPF_ALU | BPF_MOD | BPF_K
+BPF_RET_A = 0x16        # BPF_RET | BPF_A
+# "absolute" offset of ancillary data: number of CPU that handles the packet
+SKF_AD_CPU = (-0x1000 + 36) & 0xffffffff
+
 
 def bind_sock(
         sock: socket.socket,
@@ -18,3 +30,25 @@ def bind_sock(
             sleep(retries_timeout)
 
     return False, max_retries
+
+
+def attach_cpu_steering(sock: socket.socket, sockets_count: int):
+    """
+    Attaches a program to the SO_REUSEPORT group of the socket, that picks
+    the socket by the number of CPU received the connection: CPU N gets
+    N-th socket of the group (sockets are numbered in order they were bound),
+    and CPUs above sockets count wrap around. Linux only
+    """
+
+    instructions = (
+        (BPF_LD_W_ABS, 0, 0, SKF_AD_CPU),
+        (BPF_ALU_MOD_K, 0, 0, sockets_count),
+        (BPF_RET_A, 0, 0, 0),
+    )
+    program = ctypes.create_string_buffer(
+        b''.join(struct.pack('=HBBI', *instruction) for instruction in instructions)
+    )
+    # struct sock_fprog. Kernel copies the program, so the buffer has to live
+    # only until setsockopt() returns
+    fprog = struct.pack('@HP', len(instructions), ctypes.addressof(program))
+    sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_REUSEPORT_CBPF, fprog)
@@ -0,0 +1,81 @@
+import asyncio
+from math import ceil
+from typing import List, Set, Optional, Protocol
+
+
+class Expirable(Protocol):
+    # slot the entry is currently scheduled in, managed by the wheel only
+    timer_slot: Optional[set]
+
+    def on_timeout(self) -> None:
+        ...
+
+
+class TimerWheel:
+    """
+    Coarse timer for a lot of timeouts that are mostly re-armed or cancelled
+    before they fire (like connections timeouts). Instead of a call_later()
+    per timeout, entries are put into the slots of the wheel, and a single
+    periodic callback expires the whole slot at once. So scheduling and
+    cancelling are just adding and removing from a set
+
+    The price is precision: timeout fires up to `resolution` seconds later
+    than it was asked for. Timeouts longer than `max_timeout` are cut down
+    to it
+    """
+
+    def __init__(self, resolution: float = 1, max_timeout: float = 300):
+        self.resolution = resolution
+        self.slots: List[Set[Expirable]] = [
+            set() for _ in range(ceil(max_timeout / resolution) + 1)
+        ]
+        self.position = 0
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._handle: Optional[asyncio.TimerHandle] = None
+
+    def start(self) -> None:
+        self.stop()
+        self._loop = asyncio.get_running_loop()
+        self._handle = self._loop.call_later(self.resolution, self._tick)
+
+    def stop(self) -> None:
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    def schedule(self, entry: Expirable, timeout: float) -> None:
+        """
+        Schedules entry.on_timeout() call in `timeout` seconds (rounded up to
+        the wheel resolution). If entry was already scheduled, it's re-scheduled
+        """
+
+        self.cancel(entry)
+
+        ticks = min(max(ceil(timeout / self.resolution), 1), len(self.slots) - 1)
+        slot = self.slots[(self.position + ticks) % len(self.slots)]
+        slot.add(entry)
+        entry.timer_slot = slot
+
+    def cancel(self, entry: Expirable) -> None:
+        if entry.timer_slot is not None:
+            entry.timer_slot.discard(entry)
+            entry.timer_slot = None
+
+    def __len__(self):
+        return sum(map(len, self.slots))
+
+    def _tick(self) -> None:
+        self.position = (self.position + 1) % len(self.slots)
+        expired = self.slots[self.position]
+
+        if expired:
+            # entries may re-schedule themselves in on_timeout(), and
+            # they must not get into the slot we are iterating over
+            self.slots[self.position] = set()
+
+            for entry in expired:
+                entry.timer_slot = None
+                entry.on_timeout()
+
+        self._handle = self._loop.call_later(self.resolution, self._tick)
@@ -1,11 +1,16 @@
 import os
+import sys
+import time
+import signal
+import select
 import socket
 import logging
 import asyncio
+import subprocess
 import multiprocessing
 from traceback import format_exc
 from dataclasses import dataclass, field
-from typing import List, Type, Union, Optional
+from typing import List, Dict, Tuple, Type, Union, Optional
 
 from .utils import sockutils
 from .typehints import Logger
@@ -13,15 +18,38 @@ from .server.base import HTTPServer
 from .utils.osdetector import is_windows
 from .entities import CaseInsensitiveDict
 from .dispatcher.base import BaseDispatcher
-from .server.aiohttpserver import AioHTTPServer
+from .server.aiohttpserver import AioHTTPServer, DirectServerProtocol
 from .storage import (base as storage_base,
                       fd_sendfile as storage_fd_sendfile)
 
 
 try:
-    from signal import SIGKILL
+    from signal import SIGKILL, SIGTERM, SIGHUP, SIGUSR2
 except ImportError:
-    from signal import CTRL_C_EVENT as SIGKILL
+    from signal import CTRL_C_EVENT as SIGKILL, SIGTERM
+
+    SIGHUP = SIGUSR2 = None
+
+# write end of the pipe the process that started us on reload waits on
+# until we are ready to serve, so it could drain itself
+READY_FD_ENV = 'RUSH_READY_FD'
+# set for processes spawned by master to replace dead workers, holds
+# the number of the worker being replaced
+WORKER_ENV = 'RUSH_WORKER'
+# comma-separated listening sockets inherited from master by such a process,
+# or from the previous server on reload
+LISTEN_FDS_ENV = 'RUSH_LISTEN_FDS'
+# comma-separated CPUs workers are pinned to. Passed to processes started by
+# master, as they inherit its affinity, that is already narrowed to one CPU
+CPUS_ENV = 'RUSH_CPUS'
+# first file descriptor passed by systemd socket activation
+SD_LISTEN_FDS_START = 3
+# worker that died earlier than in this many seconds after start is
+# considered as crashing on startup, so its respawn is delayed
+WORKER_MIN_LIFETIME = 5
+# how often master checks whether workers are alive. SIGCHLD can't be used
+# for that, as event loops reserve it for their child watchers
+WORKERS_CHECK_INTERVAL = .5
 
 
 @dataclass
@@ -43,7 +71,95 @@ class Settings:
     logger: Logger = field(default_factory=logging.getLogger)
 
     storage: Type[storage_base.Storage] = field(default=storage_fd_sendfile.SimpleDevStorage)
+    # AioHTTPServer runs on asyncio transports (uvloop, if it's installed).
+    # rush.server.epollserver.EpollHTTPServer manages the sockets itself by
+    # edge-triggered epoll, Linux only
     httpserver: Type[HTTPServer] = field(default=AioHTTPServer)
+    # DirectServerProtocol feeds the parser right from data_received(),
+    # AsyncioServerProtocol passes the data through per-connection queue
+    server_protocol: Type[asyncio.Protocol] = field(default=DirectServerProtocol)
+    # run handlers right in data_received() until their first suspension,
+    # so handlers that never suspend don't need a task at all. Works only
+    # with DirectServerProtocol
+    eager_handlers: bool = field(default=False)
+
+    # per-connection flow control. Transport pauses us when its write buffer
+    # grows over high-water mark, and resumes when it's drained below low-water
+    # mark. Reading is paused while there are max_pending_requests received
+    # but not processed requests, or their bodies take max_pending_body bytes
+    write_high_water: int = field(default=64 * 1024)
+    write_low_water: int = field(default=16 * 1024)
+    max_pending_requests: int = field(default=32)
+    max_pending_body: int = field(default=1024 * 1024)
+
+    # requests with bodies bigger than max_body_size bytes are answered with
+    # 413 Payload Too Large, and connection is closed. If content-length is
+    # known, it happens right after the headers are received, without waiting
+    # for the body. None disables the limit. Routes may have their own limits
+    # instead (see dp.route(max_body_size=...)). Bodies bigger than
+    # body_spill_threshold are written into a temporary file instead of being
+    # kept in memory (see Request.body_file)
+    max_body_size: Optional[int] = field(default=100 * 1024 * 1024)
+    body_spill_threshold: Optional[int] = field(default=1024 * 1024)
+    # small GET and HEAD requests without anything unusual are parsed without
+    # httptools, and their request lines are cached (see parser.Protocol).
+    # Worth enabling for load like health checks and API clients send, as
+    # the rest of GETs (like browser ones) are parsed a bit slower with it
+    parser_fast_path: bool = field(default=False)
+
+    # connection is closed if client doesn't send the whole request line and
+    # headers in header_timeout seconds, doesn't send a piece of body in
+    # body_timeout seconds, or doesn't send a new request in keepalive_timeout
+    # seconds after the previous one was processed. None disables a timeout.
+    # Timeouts are checked every timeouts_resolution seconds, so they may
+    # fire up to this much later
+    keepalive_timeout: Optional[float] = field(default=75)
+    header_timeout: Optional[float] = field(default=30)
+    body_timeout: Optional[float] = field(default=60)
+    timeouts_resolution: float = field(default=1)
+    # a hard limit of concurrent connections per worker. Connections above it
+    # are closed right after accepting. max_connections, in contrast, is only
+    # the listen backlog and file descriptors limit
+    max_worker_connections: Optional[int] = field(default=None)
+    # how many protocols of closed connections (with their parsers, requests
+    # and responses) are kept per worker to be reused by new connections
+    protocol_pool_size: int = field(default=256)
+
+    # on SIGTERM, workers stop accepting new connections, close idle ones and
+    # give the others shutdown_timeout seconds to finish requests they process.
+    # On SIGHUP or SIGUSR2, parent starts a new server with the same command
+    # line (so it also picks up a new code) and drains itself as soon as the
+    # new one is ready to serve
+    shutdown_timeout: float = field(default=30)
+
+    # master process respawns dead workers. If workers keep dying right after
+    # start, every next respawn is delayed twice longer, starting from
+    # respawn_backoff, up to max_respawn_backoff seconds. Dedicated master
+    # doesn't serve requests itself, so it stays responsive for supervision
+    # and is able to simply fork new workers, while serving master has to
+    # start them by its command line, because it can't fork from inside
+    # a running event loop
+    dedicated_master: bool = field(default=False)
+    respawn_backoff: float = field(default=.5)
+    max_respawn_backoff: float = field(default=30)
+
+    # pin every worker to its own CPU: worker N runs only on the N-th CPU
+    # available to the server. In this mode master binds a separate socket for
+    # every worker, in workers order, and attaches a BPF program to them, so
+    # connection is accepted by the worker that runs on the CPU received it.
+    # Steering requires workers to occupy CPUs from 0 and works under Linux
+    # only, otherwise workers are just pinned
+    pin_workers: bool = field(default=False)
+
+    # master binds listening sockets before forking, and workers inherit them
+    # instead of binding on their own. Every worker still gets its own socket
+    # in the SO_REUSEPORT group, so the kernel keeps balancing connections.
+    # Bind errors are found at once, before any worker has started, and on
+    # reload sockets are passed to the new server, so no connection is refused
+    # while servers are switched. Implied by pin_workers. If the server is
+    # started by systemd socket activation (LISTEN_FDS), passed sockets are
+    # used as they are, and host and port are ignored
+    inherit_sockets: bool = field(default=False)
 
     asyncio_logging: bool = field(default=True)
     asyncio_logging_level: int = field(default=logging.DEBUG)
@@ -63,6 +179,33 @@ class WebServer:
         # if children is None, current process isn't parent
         # only parent process has a list of children
         self._children: Optional[List[int]] = []
+        # worker number of every child by its pid. Number of the parent is 0,
+        # if it serves itself
+        self._worker_ids: Dict[int, int] = {}
+        self._worker_id = 0
+        self._spawned_at: Dict[int, float] = {}
+        # CPU affinity is available only under Linux
+        self._pin_workers = settings.pin_workers and hasattr(os, 'sched_setaffinity')
+        # CPUs the server was allowed to run on before anything was pinned
+        self._cpus: List[int] = []
+        # listening socket of every worker, if they are bound by master
+        self._sockets: Optional[Dict[int, socket.socket]] = None
+        # how many workers in a row died right after they were started
+        self._respawn_failures = 0
+        self._stopping = False
+        self._reload_requested = False
+        self._ready_fd: Optional[int] = None
+
+    @property
+    def workers_count(self) -> int:
+        """
+        Count of alive worker processes, including parent if it serves
+        requests. Makes sense only in parent process
+        """
+
+        serving_parent = 0 if self.settings.dedicated_master else 1
+
+        return len(self._children or ()) + serving_parent
 
     def run(self, dp: BaseDispatcher):
         """
@@ -70,17 +213,54 @@ class WebServer:
         Everything it does - just checks whether dispatcher
         was inherited from base class, and setting forks count
         if not specified. Then it just creates n-1 processes with
-        web-server workers and running the n one
+        web-server workers and running the n one (or n processes,
+        if master is dedicated, and supervising them)
         """
 
         if not isinstance(dp, BaseDispatcher):
             raise TypeError(f'{dp} object must be inherited from '
                             'rush.dispatcher.base.Dispatcher object!')
 
+        if self._pin_workers:
+            self._cpus = self._pop_cpus()
+
+        worker_id = os.environ.pop(WORKER_ENV, None)
+
+        if worker_id is not None:
+            # we were started by master to replace a dead worker
+            self._children = None
+            self._worker_id = int(worker_id)
+            inherited_sockets = self._pop_inherited_sockets()
+
+            if inherited_sockets:
+                self._sockets = {self._worker_id: inherited_sockets[0]}
+
+            self._server_worker(dp)
+            return
+
+        ready_fd = os.environ.pop(READY_FD_ENV, None)
+        self._ready_fd = int(ready_fd) if ready_fd is not None else None
+        inherited_sockets = self._pop_inherited_sockets()
+
+        dedicated_master = self.settings.dedicated_master and not is_windows()
         children_count = self._get_children_count(self.settings.processes)
+        processes_count = children_count + (0 if dedicated_master else 1)
+
+        if processes_count != self.settings.processes:
+            self.logger.info(f'setting processes count to {processes_count}')
 
-        if children_count != self.settings.processes:
-            self.logger.info(f'setting processes count to {children_count}')
+        if self.settings.pin_workers and not self._pin_workers:
+            self.logger.warning('pinning workers to CPUs is not supported by the platform')
+
+        if inherited_sockets:
+            self.logger.info(f'serving on {len(inherited_sockets)} inherited sockets')
+            # if there are fewer sockets than workers, some of them are shared
+            self._sockets = {
+                worker_id: inherited_sockets[worker_id % len(inherited_sockets)]
+                for worker_id in range(processes_count)
+            }
+        elif self._pin_workers or (self.settings.inherit_sockets and not is_windows()):
+            self._sockets = self._bind_workers_sockets(processes_count)
 
         self.logger.debug(f'forking {children_count} times')
         self._children = self._do_forks(n=children_count)
@@ -88,6 +268,10 @@ class WebServer:
         if self._children is not None:
             self.logger.debug('children has been spawned')
 
+            if dedicated_master:
+                self._supervise(dp)
+                return
+
         self._server_worker(dp)
 
     def _get_children_count(self, raw_count: Optional[int]) -> int:
@@ -95,9 +279,11 @@ class WebServer:
         Returns a count of children has to be spawned
 
         Returns 0 if Windows (as reuseport isn't available under windows)
-        Returns raw_count if raw_count >1
+        Returns raw_count - 1 if raw_count >1, as parent is also serving
         Returns 0 if raw_count is 1
         Returns multiprocessing.cpu_count() - 1 if raw_count is None or <0
+
+        If master is dedicated, it doesn't serve, so 1 is not subtracted
         """
 
         if is_windows():
@@ -106,16 +292,23 @@ class WebServer:
                                     'not available; disabling forks')
             return 0
 
+        serving_parent = 0 if self.settings.dedicated_master else 1
+
+        # dedicated master must have at least a single worker
+        min_count = 1 - serving_parent
+
         if raw_count is None or raw_count < 0:
-            return multiprocessing.cpu_count() - 1
+            return max(multiprocessing.cpu_count() - serving_parent, min_count)
 
-        return raw_count - 1 if raw_count > 0 else 0
+        return max(raw_count - serving_parent, min_count)
 
     def _do_forks(self, n: int) -> Optional[List[int]]:
         spawned_children = []
+        # parent is the worker number 0, if it serves itself
+        first_id = 0 if self.settings.dedicated_master else 1
 
-        for child_num in range(n - 1):
-            child_pid = os.fork()
+        for child_num in range(n):
+            child_pid = self._fork(first_id + child_num)
 
             if child_pid != 0:
                 spawned_children.append(child_pid)
@@ -125,49 +318,314 @@ class WebServer:
 
         return spawned_children
 
-    def _server_worker(self, dp: BaseDispatcher):
+    def _fork(self, worker_id: int) -> int:
+        child_pid = os.fork()
+
+        if child_pid == 0:
+            self._children = None
+            self._worker_id = worker_id
+
+            if self.settings.dedicated_master:
+                # signal handlers of master make no sense here
+                for signum in (SIGTERM, SIGHUP, SIGUSR2, signal.SIGINT):
+                    signal.signal(signum, signal.SIG_DFL if signum != signal.SIGINT
+                                  else signal.default_int_handler)
+        else:
+            self._worker_ids[child_pid] = worker_id
+            self._spawned_at[child_pid] = time.monotonic()
+
+        return child_pid
+
+    def _bind_workers_sockets(self, count: int) -> Dict[int, socket.socket]:
         """
-        Finally, we're in our brand-new process that belongs only to us, hohoho
+        Binds a socket for every worker. SO_REUSEPORT group numbers sockets
+        in order they start listening, so worker N gets N-th socket of the group
         """
 
-        self.logger.disabled = not self._is_parent()
+        sockets = {}
 
-        sock = socket.socket()
+        for worker_id in range(count):
+            sock = sockets[worker_id] = self._bind_socket()
+            # the real backlog is set by the worker later
+            sock.listen(socket.SOMAXCONN)
 
-        if not is_windows():
-            # as I said before, windows does not support reuseport
-            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, True)
+        if self._pin_workers:
+            self._attach_steering(sockets)
 
-        self.logger.debug(f'trying to bind on {self.settings.host}:{self.settings.port}...')
+        return sockets
 
-        succeeded, retries_went = sockutils.bind_sock(
-            sock=sock,
-            addr=(self.settings.host, self.settings.port),
-            max_retries=self.settings.max_bind_retries or 99999,
-            retries_timeout=self.settings.bind_retries_timeout
+    def _attach_steering(self, sockets: Dict[int, socket.socket]):
+        count = len(sockets)
+        cpus = self._cpus
+
+        if cpus[:count] != list(range(count)):
+            self.logger.warning(f'connections can\'t be steered to {count} workers on CPUs '
+                                f'{cpus}: every worker needs its own CPU, numbered from 0; '
+                                'leaving balancing to the kernel')
+        else:
+            try:
+                sockutils.attach_cpu_steering(sockets[0], count)
+            except OSError as exc:
+                self.logger.warning(f'failed to attach connections steering program: {exc}; '
+                                    'leaving balancing to the kernel')
+
+    @staticmethod
+    def _pop_inherited_sockets() -> List[socket.socket]:
+        """
+        Returns listening sockets passed by master or the previous server, or
+        by systemd socket activation. Variables are removed from environment,
+        so they are not inherited by processes we start
+        """
+
+        fds = os.environ.pop(LISTEN_FDS_ENV, None)
+        listen_pid = os.environ.pop('LISTEN_PID', None)
+        listen_fds = os.environ.pop('LISTEN_FDS', None)
+        os.environ.pop('LISTEN_FDNAMES', None)
+
+        if fds is not None:
+            fds = [int(fd) for fd in fds.split(',')]
+        elif listen_fds is not None and listen_pid == str(os.getpid()):
+            fds = range(SD_LISTEN_FDS_START, SD_LISTEN_FDS_START + int(listen_fds))
+        else:
+            return []
+
+        sockets = [socket.socket(fileno=fd) for fd in fds]
+
+        for sock in sockets:
+            sock.set_inheritable(False)
+
+        return sockets
+
+    @staticmethod
+    def _pop_cpus() -> List[int]:
+        """
+        Returns CPUs passed by the process that started us, or the ones we
+        are allowed to run on, if we are the first one
+        """
+
+        cpus = os.environ.pop(CPUS_ENV, None)
+
+        if cpus is not None:
+            return [int(cpu) for cpu in cpus.split(',')]
+
+        return sorted(os.sched_getaffinity(0))
+
+    def _pin_worker(self):
+        cpus = self._cpus
+        cpu = cpus[self._worker_id % len(cpus)]
+        os.sched_setaffinity(0, {cpu})
+        self.logger.debug(f'worker id={self._worker_id} is pinned to CPU {cpu}')
+
+    def _supervise(self, dp: BaseDispatcher):
+        """
+        Dedicated master loop. Master doesn't serve requests, it only watches
+        workers, respawns dead ones, and handles signals. There's no event
+        loop here, so new workers may be simply forked
+        """
+
+        if self._ready_fd is not None:
+            # workers report about readiness instead of us
+            os.close(self._ready_fd)
+            self._ready_fd = None
+
+        self.logger.info(f'supervising {self.workers_count} workers')
+        signal.signal(SIGTERM, self._request_stop)
+        signal.signal(SIGHUP, self._request_reload)
+        signal.signal(SIGUSR2, self._request_reload)
+
+        # pairs of (time, worker id)
+        respawns: List[Tuple[float, int]] = []
+        new_server_fd: Optional[int] = None
+
+        try:
+            while True:
+                if self._stopping:
+                    self.logger.info('shutting down gracefully '
+                                     f'(timeout={self.settings.shutdown_timeout}secs)...')
+                    break
+
+                if self._reload_requested:
+                    self._reload_requested = False
+                    new_server_fd = self._start_new_server()
+
+                if new_server_fd is not None:
+                    readable, _, _ = select.select([new_server_fd], [], [], 0)
+
+                    if readable:
+                        if self._read_new_server_readiness(new_server_fd):
+                            break
+
+                        new_server_fd = None
+
+                for worker_id in self._reap_children():
+                    respawns.append((time.monotonic() + self._next_respawn_delay(), worker_id))
+
+                now = time.monotonic()
+
+                while respawns and min(respawns)[0] <= now:
+                    _, worker_id = min(respawns)
+                    respawns.remove(min(respawns))
+
+                    child_pid = self._fork(worker_id)
+
+                    if child_pid == 0:
+                        self._server_worker(dp)
+                        return
+
+                    self._children.append(child_pid)
+                    self.logger.info(f'respawned a worker pid={child_pid}')
+
+                time.sleep(WORKERS_CHECK_INTERVAL)
+        except KeyboardInterrupt:
+            self.logger.info('shutting down (aborted by user)...')
+
+        self._stop_children()
+
+    def _request_stop(self, *_):
+        self._stopping = True
+
+    def _request_reload(self, *_):
+        self._reload_requested = True
+
+    def _reap_children(self) -> List[int]:
+        """
+        Collects children that have exited, and returns their worker numbers
+        """
+
+        dead = []
+
+        for child in tuple(self._children):
+            try:
+                pid, status = os.waitpid(child, os.WNOHANG)
+            except ChildProcessError:
+                pid, status = child, None
+
+            if pid == child:
+                self._children.remove(child)
+                dead.append(self._worker_ids.pop(child))
+                lifetime = time.monotonic() - self._spawned_at.pop(child, 0)
+
+                if lifetime < WORKER_MIN_LIFETIME:
+                    self._respawn_failures += 1
+                else:
+                    self._respawn_failures = 0
+
+                if not self._stopping:
+                    self.logger.warning(f'worker pid={child} has died (status={status}, '
+                                        f'lived {round(lifetime, 2)}secs); '
+                                        f'{self.workers_count} workers are alive')
+
+        return dead
+
+    def _next_respawn_delay(self) -> float:
+        if not self._respawn_failures:
+            return 0
+
+        return min(
+            self.settings.respawn_backoff * 2 ** (self._respawn_failures - 1),
+            self.settings.max_respawn_backoff
         )
 
-        if not succeeded:
-            bind_retries = self.settings.max_bind_retries
-            retries_timeout = self.settings.bind_retries_timeout
-            self.logger.error(f'failed to bind server on {self.settings.host}:{self.settings.port}:'
-                              f'max retries exceeded (retries={bind_retries}, '
-                              f'retries_timeout={retries_timeout}, '
-                              f'time_elapsed={round(bind_retries * retries_timeout, 2)}secs)')
+    def _watch_children(self, loop: asyncio.AbstractEventLoop):
+        """
+        Serving master's way to supervise workers. As fork is not safe from
+        inside the running event loop, new worker is started by the same
+        command line we were started with (so it also re-imports the code)
+        """
 
-            if self._is_parent():
-                self.logger.critical('the problem was caused in parent process, shutting down'
-                                     'the server')
-                self._kill_children()
+        if self._stopping:
+            return
 
-            sock.close()
-            raise SystemExit(1)
+        for worker_id in self._reap_children():
+            loop.call_later(self._next_respawn_delay(), self._spawn_worker, worker_id)
+
+        loop.call_later(WORKERS_CHECK_INTERVAL, self._watch_children, loop)
+
+    def _spawn_worker(self, worker_id: int):
+        if self._stopping:
+            return
+
+        env = dict(os.environ, **{WORKER_ENV: str(worker_id)})
+        sock = self._sockets[worker_id] if self._sockets is not None else None
+
+        if self._pin_workers:
+            env[CPUS_ENV] = ','.join(map(str, self._cpus))
+
+        if sock is not None:
+            # worker socket is still in the group, new worker has to take it
+            env[LISTEN_FDS_ENV] = str(sock.fileno())
+            sock.set_inheritable(True)
+
+        try:
+            child_pid = os.posix_spawn(sys.executable, self._command_line(), env)
+        except OSError as exc:
+            self.logger.error(f'failed to respawn a worker: {exc}')
+            return
+        finally:
+            if sock is not None:
+                sock.set_inheritable(False)
+
+        self._children.append(child_pid)
+        self._worker_ids[child_pid] = worker_id
+        self._spawned_at[child_pid] = time.monotonic()
+        self.logger.info(f'respawned a worker pid={child_pid}')
+
+    @staticmethod
+    def _command_line() -> List[str]:
+        # sys.orig_argv keeps interpreter options as well, like -m
+        argv = list(getattr(sys, 'orig_argv', [sys.executable] + sys.argv))
+        argv[0] = sys.executable
+
+        return argv
+
+    def _server_worker(self, dp: BaseDispatcher):
+        """
+        Finally, we're in our brand-new process that belongs only to us, hohoho
+        """
+
+        self.logger.disabled = not self._is_parent()
+
+        # readiness is reported by parent, or by the workers, if parent is
+        # a dedicated master. Others must close it, otherwise, if parent dies
+        # before it's ready, the previous server will never know about that
+        if self._ready_fd is not None and not self._is_parent() \
+                and not self.settings.dedicated_master:
+            os.close(self._ready_fd)
+            self._ready_fd = None
+
+        if self._pin_workers:
+            self._pin_worker()
+
+        if self._sockets is not None:
+            sock = self._sockets[self._worker_id]
+
+            if not self._is_parent():
+                # sockets of other workers are kept by master only
+                for other_sock in self._sockets.values():
+                    if other_sock is not sock:
+                        other_sock.close()
+        else:
+            sock = self._bind_socket()
 
         if self._is_parent():
-            host, port = self.settings.host, self.settings.port
-            self.logger.info(f'successfully bound socket on {host}:{port}')
+            address = sock.getsockname()
+
+            if isinstance(address, tuple):
+                address = f'{address[0]}:{address[1]}'
+
+            self.logger.info(f'successfully bound socket on {address}')
             self.logger.info('press CTRL-C to stop the server')
 
+        if self._ready_fd is not None:
+            try:
+                os.write(self._ready_fd, b'1')
+            except BrokenPipeError:
+                # another worker has already reported it
+                pass
+
+            os.close(self._ready_fd)
+            self._ready_fd = None
+
         if hasattr(dp, 'on_begin_serving'):
             on_begin_serving = dp.on_begin_serving
         else:
@@ -184,17 +642,27 @@ class WebServer:
             on_begin_serving=on_begin_serving,
             on_message_complete=dp.process_request,
             storage=self.settings.storage(),
-            default_headers=self.settings.default_headers
+            default_headers=self.settings.default_headers,
+            settings=self.settings,
+            body_limit=dp.get_max_body_size,
+            body_streamed=dp.streams_body,
+            continue_check=dp.check_continue
         )
 
         while True:
             try:
                 loop = asyncio.new_event_loop()
+                self._set_signal_handlers(loop, http_server)
                 loop.run_until_complete(http_server.poll())
+                # poll() returns only when server was shut down gracefully
+                if self._is_parent():
+                    self._stop_children()
+
+                break
             except (KeyboardInterrupt, SystemExit, EOFError):
                 if self._is_parent():
                     self.logger.info('shutting down (aborted by user)...')
-                    self._kill_children()
+                    self._stop_children()
                     http_server.stop()
                     break
                 else:
@@ -210,6 +678,136 @@ class WebServer:
                                     'reproduce an error')
                 self.logger.info('continuing the job')
 
+    def _bind_socket(self) -> socket.socket:
+        sock = socket.socket()
+
+        if not is_windows():
+            # as I said before, windows does not support reuseport
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, True)
+
+        self.logger.debug(f'trying to bind on {self.settings.host}:{self.settings.port}...')
+
+        succeeded, retries_went = sockutils.bind_sock(
+            sock=sock,
+            addr=(self.settings.host, self.settings.port),
+            max_retries=self.settings.max_bind_retries or 99999,
+            retries_timeout=self.settings.bind_retries_timeout
+        )
+
+        if not succeeded:
+            bind_retries = self.settings.max_bind_retries
+            retries_timeout = self.settings.bind_retries_timeout
+            self.logger.error(f'failed to bind server on {self.settings.host}:{self.settings.port}:'
+                              f'max retries exceeded (retries={bind_retries}, '
+                              f'retries_timeout={retries_timeout}, '
+                              f'time_elapsed={round(bind_retries * retries_timeout, 2)}secs)')
+
+            if self._is_parent():
+                self.logger.critical('the problem was caused in parent process, shutting down'
+                                     'the server')
+                self._kill_children()
+
+            sock.close()
+            raise SystemExit(1)
+
+        return sock
+
+    def _set_signal_handlers(self, loop: asyncio.AbstractEventLoop, http_server: HTTPServer):
+        if is_windows():
+            return
+
+        loop.add_signal_handler(SIGTERM, self._shutdown, http_server)
+
+        if self._is_parent():
+            loop.add_signal_handler(SIGHUP, self._reload, loop, http_server)
+            loop.add_signal_handler(SIGUSR2, self._reload, loop, http_server)
+            loop.call_later(WORKERS_CHECK_INTERVAL, self._watch_children, loop)
+
+    def _shutdown(self, http_server: HTTPServer):
+        """
+        Graceful shutdown. Parent passes the signal to the children, so they're
+        draining in the same time as parent does
+        """
+
+        self.logger.info(
+            f'shutting down gracefully (timeout={self.settings.shutdown_timeout}secs)...'
+        )
+        self._stopping = True
+
+        if self._is_parent():
+            for child in self._children:
+                try:
+                    os.kill(child, SIGTERM)
+                except OSError as exc:
+                    self.logger.warning(f'failed to stop child pid={child}: {exc}')
+
+        http_server.shutdown(self.settings.shutdown_timeout)
+
+    def _reload(self, loop: asyncio.AbstractEventLoop, http_server: HTTPServer):
+        """
+        Starts a new server by the same command line we were started with. New server
+        binds on the same port (reuseport lets us do that), and tells us when it's
+        ready to serve by writing into the pipe. Only then we are draining. If new
+        server fails to start, we just continue serving
+        """
+
+        read_fd = self._start_new_server()
+
+        if read_fd is not None:
+            loop.add_reader(read_fd, self._on_new_server_ready, loop, read_fd, http_server)
+
+    def _start_new_server(self) -> Optional[int]:
+        """
+        Returns read end of the pipe new server reports its readiness to
+        """
+
+        self.logger.info('reloading: starting a new server...')
+
+        read_fd, write_fd = os.pipe()
+        env = dict(os.environ, **{READY_FD_ENV: str(write_fd)})
+        pass_fds = [write_fd]
+
+        if self._pin_workers:
+            env[CPUS_ENV] = ','.join(map(str, self._cpus))
+
+        if self._sockets is not None:
+            # new server takes over our sockets, so connections queued in them
+            # are accepted by it instead of being reset when we stop
+            listen_fds = list(dict.fromkeys(sock.fileno() for sock in self._sockets.values()))
+            env[LISTEN_FDS_ENV] = ','.join(map(str, listen_fds))
+            pass_fds.extend(listen_fds)
+
+        try:
+            subprocess.Popen(self._command_line(), env=env, pass_fds=pass_fds)
+        except OSError as exc:
+            self.logger.error(f'failed to start a new server: {exc}; continuing the job')
+            os.close(read_fd)
+            return None
+        finally:
+            os.close(write_fd)
+
+        return read_fd
+
+    def _read_new_server_readiness(self, read_fd: int) -> bool:
+        ready = os.read(read_fd, 1)
+        os.close(read_fd)
+
+        if not ready:
+            # pipe was closed without writing anything, so new server has died
+            self.logger.error('new server failed to start; continuing the job')
+            return False
+
+        self.logger.info('new server is ready')
+
+        return True
+
+    def _on_new_server_ready(self, loop: asyncio.AbstractEventLoop,
+                             read_fd: int, http_server: HTTPServer):
+        loop.remove_reader(read_fd)
+
+        if self._read_new_server_readiness(read_fd):
+            self._shutdown(http_server)
+
     @staticmethod
     def _set_max_descriptors(expected: int) -> int:
         """
@@ -246,6 +844,49 @@ class WebServer:
 
         return self._children is not None
 
+    def _stop_children(self):
+        """
+        Asks children to shut down gracefully, and kills those who didn't
+        manage to do that in time
+        """
+
+        if not self._is_parent():
+            return
+
+        for child in self._children:
+            try:
+                os.kill(child, SIGTERM)
+            except OSError:
+                pass
+
+        if is_windows():
+            return self._kill_children()
+
+        # children aren't aborting connections in the same moment as timeout
+        # expires, so giving them a bit more
+        deadline = time.monotonic() + self.settings.shutdown_timeout + 1
+        alive = set(self._children)
+
+        while alive and time.monotonic() < deadline:
+            for child in tuple(alive):
+                try:
+                    pid, _ = os.waitpid(child, os.WNOHANG)
+                except ChildProcessError:
+                    pid = child
+
+                if pid == child:
+                    alive.remove(child)
+
+            time.sleep(.1)
+
+        self._children = list(alive)
+
+        if alive:
+            self.logger.warning(f'{len(alive)} children did not stop in time')
+            self._kill_children()
+        else:
+            self.logger.info('all the children have stopped')
+
     def _kill_children(self):
         if self._is_parent():
             self.logger.debug('killing children...')